@@ -2,7 +2,13 @@
 
 from django.contrib import admin
 
-from .models import ChatMessage, ChatSession, MessageCitation
+from .models import (
+    ChatMessage,
+    ChatSession,
+    ChatSessionArchive,
+    MessageCitation,
+    PendingChatTurn,
+)
 
 
 class ChatMessageInline(admin.TabularInline):
@@ -101,3 +107,31 @@ class MessageCitationAdmin(admin.ModelAdmin):
     search_fields = ("title", "source_name")
     raw_id_fields = ("message", "content_item")
     ordering = ["message", "order"]
+
+
+@admin.register(PendingChatTurn)
+class PendingChatTurnAdmin(admin.ModelAdmin):
+    """Admin interface for the chat turn outbox."""
+
+    list_display = ("id", "session", "assistant_message_id", "attempts", "created_at")
+    search_fields = ("session__title", "last_error")
+    readonly_fields = (
+        "session",
+        "user_message_id",
+        "assistant_message_id",
+        "payload",
+        "attempts",
+        "last_error",
+        "created_at",
+    )
+    ordering = ["created_at"]
+
+
+@admin.register(ChatSessionArchive)
+class ChatSessionArchiveAdmin(admin.ModelAdmin):
+    """Admin interface for archived chat session messages."""
+
+    list_display = ("session", "message_count", "archived_at")
+    search_fields = ("session__title",)
+    readonly_fields = ("session", "message_count", "archived_at")
+    exclude = ("data",)
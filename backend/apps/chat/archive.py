@@ -0,0 +1,269 @@
+"""Cold storage for the messages of archived chat sessions.
+
+ChatMessage is the fastest-growing table. Sessions the user has archived
+are rarely read again, so ``archive_session`` moves their messages (with
+citations and retrieved chunk ids) into a single compressed
+``ChatSessionArchive`` row and deletes the hot rows. Reads go through
+``load_archived_messages``; ``restore_session`` moves the messages back
+with their original ids and timestamps when the session is unarchived or
+a new message is sent to it.
+
+Partitioning ChatMessage by month was not an option: the citation,
+retrieved-chunk and outbox tables reference message ids, and Postgres
+requires the partition key in every unique constraint.
+"""
+
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.fields import DateTimeField
+
+from apps.content.models import ContentChunk, ContentItem
+
+from .models import ChatMessage, ChatSession, ChatSessionArchive, MessageCitation
+
+logger = logging.getLogger(__name__)
+
+
+def _message_record(message):
+    """Return the JSON-serializable archive record for a message."""
+    return {
+        "id": message.id,
+        "role": message.role,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "model_used": message.model_used,
+        "input_tokens": message.input_tokens,
+        "output_tokens": message.output_tokens,
+        "is_truncated": message.is_truncated,
+        "chunk_ids": [chunk.id for chunk in message.retrieved_chunks.all()],
+        "citations": [
+            {
+                "id": citation.id,
+                "content_item_id": citation.content_item_id,
+                "title": citation.title,
+                "url": citation.url,
+                "source_name": citation.source_name,
+                "order": citation.order,
+            }
+            for citation in message.citations.all()
+        ],
+    }
+
+
+def archive_session(session_id):
+    """Move a session's messages into its ChatSessionArchive row.
+
+    Args:
+        session_id: Primary key of the ChatSession.
+
+    Returns:
+        The number of messages archived (0 if the session has no messages
+        or is already archived).
+    """
+    with transaction.atomic():
+        # Lock the session so a concurrent restore or turn commit waits
+        session = ChatSession.objects.select_for_update().filter(pk=session_id).first()
+        if (
+            session is None
+            or ChatSessionArchive.objects.filter(session=session).exists()
+        ):
+            return 0
+
+        messages = list(
+            ChatMessage.objects.filter(session=session)
+            .order_by("created_at", "id")
+            .prefetch_related("citations", "retrieved_chunks")
+        )
+        if not messages:
+            return 0
+
+        records = [_message_record(message) for message in messages]
+        ChatSessionArchive.objects.create(
+            session=session,
+            data=zlib.compress(json.dumps(records).encode()),
+            message_count=len(records),
+        )
+        ChatMessage.objects.filter(session=session).delete()
+    return len(records)
+
+
+def restore_session(session_id):
+    """Move an archived session's messages back into ChatMessage.
+
+    Messages keep their ids and timestamps. Citations and retrieved chunks
+    whose content has been deleted since the session was archived are
+    dropped.
+
+    Args:
+        session_id: Primary key of the ChatSession.
+
+    Returns:
+        The number of messages restored (0 if the session had no archive).
+    """
+    with transaction.atomic():
+        ChatSession.objects.select_for_update().filter(pk=session_id).first()
+        archive = ChatSessionArchive.objects.filter(session_id=session_id).first()
+        if archive is None:
+            return 0
+
+        records = _decode(archive.data)
+        messages = ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(
+                    id=record["id"],
+                    session_id=session_id,
+                    role=record["role"],
+                    content=record["content"],
+                    model_used=record["model_used"],
+                    input_tokens=record["input_tokens"],
+                    output_tokens=record["output_tokens"],
+                    is_truncated=record["is_truncated"],
+                )
+                for record in records
+            ]
+        )
+        # bulk_create stamps auto_now_add fields with the current time
+        for message, record in zip(messages, records, strict=True):
+            message.created_at = parse_datetime(record["created_at"])
+        ChatMessage.objects.bulk_update(messages, ["created_at"])
+
+        chunk_ids = set(
+            ContentChunk.objects.filter(
+                id__in=[cid for record in records for cid in record["chunk_ids"]]
+            ).values_list("id", flat=True)
+        )
+        ChatMessage.retrieved_chunks.through.objects.bulk_create(
+            [
+                ChatMessage.retrieved_chunks.through(
+                    chatmessage_id=record["id"],
+                    contentchunk_id=chunk_id,
+                )
+                for record in records
+                for chunk_id in record["chunk_ids"]
+                if chunk_id in chunk_ids
+            ]
+        )
+
+        item_ids = set(
+            ContentItem.objects.filter(
+                id__in=[
+                    citation["content_item_id"]
+                    for record in records
+                    for citation in record["citations"]
+                ]
+            ).values_list("id", flat=True)
+        )
+        MessageCitation.objects.bulk_create(
+            [
+                MessageCitation(
+                    id=citation["id"],
+                    message_id=record["id"],
+                    content_item_id=citation["content_item_id"],
+                    title=citation["title"],
+                    url=citation["url"],
+                    source_name=citation["source_name"],
+                    order=citation["order"],
+                )
+                for record in records
+                for citation in record["citations"]
+                if citation["content_item_id"] in item_ids
+            ]
+        )
+
+        archive.delete()
+    return len(records)
+
+
+def load_archived_messages(session_id, user=None):
+    """Return an archived session's messages as API representations.
+
+    The dicts have the same shape as ``ChatMessageSerializer`` output and
+    are in chronological order.
+
+    Args:
+        session_id: Primary key of the ChatSession.
+        user: If given, only return the archive of a session owned by them.
+
+    Returns:
+        A list of message dicts, or None if the session is not archived.
+    """
+    archives = ChatSessionArchive.objects.filter(session_id=session_id)
+    if user is not None:
+        archives = archives.filter(session__user=user)
+    archive = archives.first()
+    if archive is None:
+        return None
+
+    created_at = DateTimeField()
+    return [
+        {
+            "id": record["id"],
+            "session": session_id,
+            "role": record["role"],
+            "content": record["content"],
+            "created_at": created_at.to_representation(
+                parse_datetime(record["created_at"])
+            ),
+            "model_used": record["model_used"],
+            "input_tokens": record["input_tokens"],
+            "output_tokens": record["output_tokens"],
+            "is_truncated": record["is_truncated"],
+            "citations": [
+                {
+                    "id": citation["id"],
+                    "title": citation["title"],
+                    "url": citation["url"],
+                    "source_name": citation["source_name"],
+                    "order": citation["order"],
+                }
+                for citation in record["citations"]
+            ],
+        }
+        for record in _decode(archive.data)
+    ]
+
+
+def archive_stale_sessions(older_than_days=None, limit=500):
+    """Archive the messages of sessions archived and idle for a while.
+
+    Args:
+        older_than_days: Minimum days since the session was last updated
+            (defaults to ``settings.CHAT_ARCHIVE_AFTER_DAYS``).
+        limit: Maximum number of sessions to archive in one call.
+
+    Returns:
+        A tuple ``(sessions, messages)`` of how many were archived.
+    """
+    if older_than_days is None:
+        older_than_days = settings.CHAT_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    session_ids = list(
+        ChatSession.objects.filter(
+            is_archived=True,
+            updated_at__lte=cutoff,
+            archive__isnull=True,
+            message_count__gt=0,
+        )
+        .order_by("updated_at")
+        .values_list("id", flat=True)[:limit]
+    )
+
+    sessions = messages = 0
+    for session_id in session_ids:
+        count = archive_session(session_id)
+        if count:
+            sessions += 1
+            messages += count
+    logger.info("Archived %d message(s) from %d chat session(s)", messages, sessions)
+    return sessions, messages
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(bytes(data)))
@@ -0,0 +1,169 @@
+"""Incremental source-citation matching for streamed chat responses.
+
+The assistant cites sources either by mentioning a source title or with
+``[Source: title]`` notation. ``CitationMatcher`` consumes the response
+one delta at a time and reports each source the moment it is first
+referenced, so citations can be streamed to the client alongside the text.
+"""
+
+from collections import deque
+
+SOURCE_MARKER = "[source:"
+
+# Longest [Source: ...] reference that is buffered before giving up
+MAX_REF_LENGTH = 500
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over a fixed set of lowercase patterns.
+
+    Matching is driven one character at a time through ``step`` so the
+    automaton state can be carried across arbitrary chunk boundaries.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def step(self, state, char):
+        """Advance from ``state`` by ``char``.
+
+        Returns:
+            A tuple ``(new_state, matched_pattern_indices)``.
+        """
+        while state and char not in self._goto[state]:
+            state = self._fail[state]
+        state = self._goto[state].get(char, 0)
+        return state, self._output[state]
+
+
+def build_citation(item):
+    """Build the citation dict for a ContentItem."""
+    return {
+        "content_item": item,
+        "title": item.title,
+        "url": item.url,
+        "source_name": item.source.name if item.source else "",
+    }
+
+
+def serialize_citation(citation):
+    """Return the client-facing (JSON-safe) fields of a citation dict."""
+    return {
+        "title": citation["title"],
+        "url": citation.get("url", ""),
+        "source_name": citation.get("source_name", ""),
+    }
+
+
+class CitationMatcher:
+    """Streaming matcher for source references in an assistant response.
+
+    Titles of the candidate content items are compiled into a single
+    Aho-Corasick automaton together with the ``[source:`` marker, so each
+    delta is scanned once regardless of how many sources are in context.
+    A ``[Source: ...]`` reference that is only part of a title is matched
+    when its closing bracket arrives.
+    """
+
+    def __init__(self, chunks):
+        self._items = []
+        seen_items = set()
+        for chunk in chunks:
+            item = chunk.content_item
+            if item.id not in seen_items:
+                seen_items.add(item.id)
+                self._items.append(item)
+
+        self._titles = [item.title.lower() for item in self._items]
+        self._marker_index = len(self._titles)
+        self._automaton = AhoCorasick([*self._titles, SOURCE_MARKER])
+        self._state = 0
+        self._ref_buffer = None
+        self._matched = set()
+        self.citations = []
+
+    def feed(self, text):
+        """Consume the next piece of the response.
+
+        Args:
+            text: The next text delta.
+
+        Returns:
+            Citation dicts for sources first referenced within this delta.
+        """
+        if not self._items:
+            return []
+
+        new_citations = []
+        for char in text.lower():
+            if self._ref_buffer is not None:
+                if char == "]":
+                    self._match_reference(self._ref_buffer.strip(), new_citations)
+                    self._ref_buffer = None
+                elif len(self._ref_buffer) < MAX_REF_LENGTH:
+                    self._ref_buffer += char
+                else:
+                    self._ref_buffer = None
+
+            self._state, matches = self._automaton.step(self._state, char)
+            for index in matches:
+                if index == self._marker_index:
+                    self._ref_buffer = ""
+                else:
+                    self._add(index, new_citations)
+
+        return new_citations
+
+    def _match_reference(self, ref, new_citations):
+        """Match a completed ``[Source: ref]`` against candidate titles."""
+        if not ref:
+            return
+        for index, title in enumerate(self._titles):
+            if ref in title:
+                self._add(index, new_citations)
+
+    def _add(self, index, new_citations):
+        """Record a citation for the item at ``index`` if not yet seen."""
+        if index in self._matched:
+            return
+        self._matched.add(index)
+        citation = build_citation(self._items[index])
+        self.citations.append(citation)
+        new_citations.append(citation)
+
+    def citations_in_context_order(self):
+        """Return matched citations ordered as their chunks were retrieved."""
+        order = {item.id: position for position, item in enumerate(self._items)}
+        return sorted(self.citations, key=lambda c: order[c["content_item"].id])
@@ -0,0 +1,50 @@
+"""
+Django management command to move archived chat sessions to cold storage.
+
+Messages of sessions that have been archived and untouched for
+CHAT_ARCHIVE_AFTER_DAYS are moved out of ChatMessage into one compressed
+ChatSessionArchive row per session (see apps.chat.archive). Run it from
+cron; the first run also migrates existing archived sessions.
+
+Usage examples:
+    python manage.py archive_chat_sessions
+    python manage.py archive_chat_sessions --older-than-days 90 --limit 100
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.archive import archive_stale_sessions
+
+
+class Command(BaseCommand):
+    """Move the messages of stale archived sessions to cold storage."""
+
+    help = "Move messages of archived chat sessions into compressed cold storage"
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=None,
+            help="Only archive sessions untouched for this many days "
+            "(default: CHAT_ARCHIVE_AFTER_DAYS)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=500,
+            help="Maximum number of sessions to archive (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        sessions, messages = archive_stale_sessions(
+            older_than_days=options["older_than_days"],
+            limit=options["limit"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {messages} message(s) from {sessions} chat session(s)"
+            )
+        )
@@ -0,0 +1,49 @@
+"""
+Django management command to replay chat turns left in the outbox.
+
+Chat turns are committed right after their ``done`` event is streamed. If
+the process dies or the commit fails, the turn stays in PendingChatTurn
+until the periodic ``flush_chat_outbox`` Celery task, or this command,
+writes it.
+
+Usage examples:
+    python manage.py flush_chat_outbox
+    python manage.py flush_chat_outbox --min-age 0 --limit 100
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.persistence import flush_pending_turns
+
+
+class Command(BaseCommand):
+    """Commit pending chat turns from the outbox."""
+
+    help = "Commit chat turns whose write-behind persistence did not complete"
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=30,
+            help="Only replay turns older than this many seconds (default: 30)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=500,
+            help="Maximum number of turns to replay (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        committed, remaining = flush_pending_turns(
+            min_age_seconds=options["min_age"],
+            limit=options["limit"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Committed {committed} chat turn(s)"))
+        if remaining:
+            self.stdout.write(
+                self.style.WARNING(f"{remaining} turn(s) could not be committed")
+            )
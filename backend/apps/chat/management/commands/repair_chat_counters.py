@@ -0,0 +1,37 @@
+"""
+Django management command to recompute chat session message counters.
+
+ChatSession.message_count and last_message_at are maintained by the chat
+write path. Run this after writing or deleting messages by other means,
+or to check that the counters have not drifted. Archived sessions whose
+messages were moved to ChatSessionArchive are left as they are.
+
+Usage examples:
+    python manage.py repair_chat_counters
+    python manage.py repair_chat_counters --session 42 --session 43
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.persistence import repair_session_counters
+
+
+class Command(BaseCommand):
+    """Recompute denormalized chat session counters."""
+
+    help = "Recompute message_count and last_message_at for chat sessions"
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            "--session",
+            type=int,
+            action="append",
+            dest="sessions",
+            help="Only repair this session id (repeatable; default: all)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        updated = repair_session_counters(session_ids=options["sessions"])
+        self.stdout.write(self.style.SUCCESS(f"Repaired {updated} chat session(s)"))
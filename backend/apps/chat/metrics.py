@@ -0,0 +1,69 @@
+"""Usage counters for streamed chat responses.
+
+Counters live in the Django cache so they are shared by every worker
+process that uses the same cache backend. They are approximate: a cache
+eviction or restart simply resets them.
+"""
+
+from django.core.cache import cache
+
+KEY_PREFIX = "chat:stream:"
+
+COUNTERS = (
+    "completed",
+    "completed_output_tokens",
+    "cancelled",
+    "cancelled_output_tokens",
+    "output_tokens_saved",
+)
+
+
+def _incr(name, amount):
+    """Atomically add ``amount`` to counter ``name``."""
+    key = KEY_PREFIX + name
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, timeout=None)
+
+
+def get_stream_stats():
+    """Return all stream counters as a dict (missing counters are 0)."""
+    values = cache.get_many([KEY_PREFIX + name for name in COUNTERS])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in COUNTERS}
+
+
+def reset_stream_stats():
+    """Reset all stream counters."""
+    cache.delete_many([KEY_PREFIX + name for name in COUNTERS])
+
+
+def record_stream_completed(output_tokens):
+    """Count a stream that ran to completion."""
+    _incr("completed", 1)
+    _incr("completed_output_tokens", output_tokens)
+
+
+def record_stream_cancelled(partial_output_tokens, max_tokens):
+    """Count a stream cancelled because the client went away.
+
+    The tokens saved are estimated as the average length of completed
+    responses (or ``max_tokens`` before any have completed) minus what was
+    already generated.
+
+    Returns:
+        The estimated number of output tokens saved.
+    """
+    stats = get_stream_stats()
+    if stats["completed"]:
+        expected = stats["completed_output_tokens"] / stats["completed"]
+    else:
+        expected = max_tokens
+    saved = max(0, round(expected) - partial_output_tokens)
+
+    _incr("cancelled", 1)
+    _incr("cancelled_output_tokens", partial_output_tokens)
+    _incr("output_tokens_saved", saved)
+    return saved
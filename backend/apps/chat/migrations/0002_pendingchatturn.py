@@ -0,0 +1,63 @@
+# Outbox table for write-behind persistence of chat turns
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingChatTurn",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "user_message_id",
+                    models.BigIntegerField(
+                        help_text="Pre-allocated ChatMessage id for the user message",
+                    ),
+                ),
+                (
+                    "assistant_message_id",
+                    models.BigIntegerField(
+                        help_text=(
+                            "Pre-allocated ChatMessage id for the assistant message"
+                        ),
+                    ),
+                ),
+                (
+                    "payload",
+                    models.JSONField(
+                        help_text=(
+                            "Message contents, token usage, chunk ids and citations"
+                        ),
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pending_turns",
+                        to="chat.chatsession",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
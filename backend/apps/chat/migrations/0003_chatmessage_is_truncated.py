@@ -0,0 +1,20 @@
+# Flag assistant messages whose generation was cancelled mid-stream
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0002_pendingchatturn"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="is_truncated",
+            field=models.BooleanField(
+                default=False,
+                help_text="Generation was cancelled because the client disconnected",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Extend the (session, created_at) index with id for keyset pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0003_chatmessage_is_truncated"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="chatmessage",
+            name="chat_chatmes_session_b4e5f6_idx",
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["session", "created_at", "id"],
+                name="chat_msg_session_keyset_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Denormalize message_count and last_message_at onto ChatSession
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    ChatSession = apps.get_model("chat", "ChatSession")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+
+    messages = (
+        ChatMessage.objects.filter(session=OuterRef("pk")).order_by().values("session")
+    )
+    ChatSession.objects.update(
+        message_count=Coalesce(
+            Subquery(messages.annotate(n=Count("id")).values("n")), 0
+        ),
+        last_message_at=Subquery(
+            messages.annotate(last=Max("created_at")).values("last")
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0004_chatmessage_keyset_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="last_message_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
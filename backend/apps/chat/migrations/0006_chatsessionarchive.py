@@ -0,0 +1,36 @@
+# Cold storage table for the messages of archived chat sessions
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0005_chatsession_message_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatSessionArchive",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archive",
+                        serialize=False,
+                        to="chat.chatsession",
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(
+                        help_text="zlib-compressed JSON list of the session's messages"
+                    ),
+                ),
+                ("message_count", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Outbox turns without an answer keep only the user's message
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0006_chatsessionarchive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pendingchatturn",
+            name="assistant_message_id",
+            field=models.BigIntegerField(
+                blank=True,
+                help_text="Pre-allocated ChatMessage id for the assistant message; "
+                "null if the turn produced no answer",
+                null=True,
+            ),
+        ),
+    ]
@@ -13,6 +13,11 @@ class ChatSession(models.Model):
 
     Tracks the full conversation history, associated era context,
     and cumulative token usage for billing/analytics.
+
+    ``message_count`` and ``last_message_at`` are denormalized from
+    ChatMessage so the session list needs no join. They are incremented
+    when a chat turn is committed and can be recomputed with the
+    ``repair_chat_counters`` management command.
     """
 
     user = models.ForeignKey(
@@ -33,6 +38,8 @@ class ChatSession(models.Model):
     is_archived = models.BooleanField(default=False)
     total_input_tokens = models.PositiveIntegerField(default=0)
     total_output_tokens = models.PositiveIntegerField(default=0)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["-updated_at"]
@@ -72,6 +79,10 @@ class ChatMessage(models.Model):
     model_used = models.CharField(max_length=50, blank=True)
     input_tokens = models.PositiveIntegerField(default=0)
     output_tokens = models.PositiveIntegerField(default=0)
+    is_truncated = models.BooleanField(
+        default=False,
+        help_text="Generation was cancelled because the client disconnected",
+    )
     retrieved_chunks = models.ManyToManyField(
         "content.ContentChunk",
         blank=True,
@@ -81,7 +92,11 @@ class ChatMessage(models.Model):
     class Meta:
         ordering = ["created_at"]
         indexes = [
-            models.Index(fields=["session", "created_at"]),
+            # Keyset pagination of a session's history (apps.chat.pagination)
+            models.Index(
+                fields=["session", "created_at", "id"],
+                name="chat_msg_session_keyset_idx",
+            ),
         ]
 
     def __str__(self):
@@ -118,3 +133,70 @@ class MessageCitation(models.Model):
 
     def __str__(self):
         return f"Citation: {self.title} (message #{self.message_id})"
+
+
+class PendingChatTurn(models.Model):
+    """A completed chat turn waiting to be written to the chat tables.
+
+    Acts as a transactional outbox: the streaming endpoint records the
+    finished turn here with a single insert, emits its ``done`` event, and
+    then commits the messages, citations and token counters in one
+    transaction that also deletes this row. Rows left behind by a crashed
+    or cancelled commit are replayed periodically by Celery beat (or by
+    ``manage.py flush_chat_outbox``). Turns that ended without an answer
+    carry only the user message.
+    """
+
+    session = models.ForeignKey(
+        ChatSession,
+        on_delete=models.CASCADE,
+        related_name="pending_turns",
+    )
+    user_message_id = models.BigIntegerField(
+        help_text="Pre-allocated ChatMessage id for the user message",
+    )
+    assistant_message_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Pre-allocated ChatMessage id for the assistant message; "
+        "null if the turn produced no answer",
+    )
+    payload = models.JSONField(
+        help_text="Message contents, token usage, chunk ids and citations",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"Pending turn #{self.pk} (session #{self.session_id})"
+
+
+class ChatSessionArchive(models.Model):
+    """The messages of an archived chat session, moved to cold storage.
+
+    ``manage.py archive_chat_sessions`` moves the messages (with their
+    citations and retrieved chunk ids) of sessions archived for a while
+    out of ChatMessage into one zlib-compressed JSON blob per session,
+    keeping the hot table and its indexes small. ``ChatMessageListView``
+    reads archived history from here, and ``apps.chat.archive`` restores
+    the rows when the session is unarchived or continued.
+    """
+
+    session = models.OneToOneField(
+        ChatSession,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="archive",
+    )
+    data = models.BinaryField(
+        help_text="zlib-compressed JSON list of the session's messages",
+    )
+    message_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of session #{self.session_id}"
@@ -0,0 +1,113 @@
+"""Keyset pagination for chat message history."""
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class MessageKeysetPagination(BasePagination):
+    """Page through a session's messages by ``(created_at, id)``.
+
+    Unlike offset pagination, each page is an index range scan on
+    ``(session, created_at, id)`` regardless of how long the session is,
+    and pages stay stable while new messages are added.
+
+    Query parameters (message ids act as cursors):
+    - (none): the newest ``limit`` messages
+    - ``before=<id>``: the ``limit`` messages just before that message
+      ("load older")
+    - ``after=<id>``: up to ``limit`` messages after that message
+      (incremental fetch of what is new since the client's last message)
+    - ``limit``: page size, default 50, at most 200
+
+    Every page is returned in chronological order as
+    ``{"results": [...], "has_more": bool}``, where ``has_more`` says
+    whether further pages exist in the requested direction.
+    """
+
+    page_size = 50
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return one page of ``queryset`` as a list."""
+        before, after, limit = self._get_cursor(request)
+
+        if after is not None:
+            anchor = self._get_anchor(queryset, after)
+            rows = list(
+                queryset.filter(
+                    Q(created_at__gt=anchor.created_at)
+                    | Q(created_at=anchor.created_at, id__gt=anchor.id)
+                ).order_by("created_at", "id")[: limit + 1]
+            )
+            self.has_more = len(rows) > limit
+            return rows[:limit]
+
+        if before is not None:
+            anchor = self._get_anchor(queryset, before)
+            queryset = queryset.filter(
+                Q(created_at__lt=anchor.created_at)
+                | Q(created_at=anchor.created_at, id__lt=anchor.id)
+            )
+        rows = list(queryset.order_by("-created_at", "-id")[: limit + 1])
+        self.has_more = len(rows) > limit
+        return rows[:limit][::-1]
+
+    def paginate_records(self, records, request):
+        """Return one page of already loaded message dicts.
+
+        Used for archived sessions, whose messages are read from cold
+        storage rather than queried. ``records`` must be in chronological
+        order; the cursors behave as in ``paginate_queryset``.
+        """
+        before, after, limit = self._get_cursor(request)
+
+        if after is not None:
+            rows = records[self._find_record(records, after) + 1 :]
+            self.has_more = len(rows) > limit
+            return rows[:limit]
+
+        end = len(records)
+        if before is not None:
+            end = self._find_record(records, before)
+        start = max(0, end - limit)
+        self.has_more = start > 0
+        return records[start:end]
+
+    def get_paginated_response(self, data):
+        """Wrap a serialized page with its ``has_more`` flag."""
+        return Response({"results": data, "has_more": self.has_more})
+
+    def _get_cursor(self, request):
+        before = self._get_id(request, "before")
+        after = self._get_id(request, "after")
+        if before is not None and after is not None:
+            raise ValidationError({"error": "Use either before or after, not both."})
+        return before, after, self._get_limit(request)
+
+    def _get_id(self, request, name):
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        if not value.isdigit():
+            raise ValidationError({"error": f"{name} must be a message id."})
+        return int(value)
+
+    def _get_limit(self, request):
+        value = request.query_params.get("limit", "")
+        if not value.isdigit() or int(value) == 0:
+            return self.page_size
+        return min(int(value), self.max_page_size)
+
+    def _get_anchor(self, queryset, message_id):
+        anchor = queryset.filter(id=message_id).only("id", "created_at").first()
+        if anchor is None:
+            raise ValidationError({"error": "Message not found in this session."})
+        return anchor
+
+    def _find_record(self, records, message_id):
+        for index, record in enumerate(records):
+            if record["id"] == message_id:
+                return index
+        raise ValidationError({"error": "Message not found in this session."})
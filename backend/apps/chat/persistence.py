@@ -0,0 +1,280 @@
+"""Write-behind persistence for chat turns.
+
+Persisting a turn used to take several sequential writes on the streaming
+critical path. Instead, the finished turn is recorded as one
+``PendingChatTurn`` outbox row (with pre-allocated message ids so the
+``done`` event can still carry the assistant message id), and the chat
+tables are updated afterwards in a single transaction by
+``commit_chat_turn``. Turns that end without an answer (provider errors,
+an early disconnect) are recorded with ``enqueue_user_message`` so the
+question still reaches the history. Outbox rows that survive a crash are
+replayed by ``flush_pending_turns``, which Celery beat runs periodically
+(``apps.chat.tasks.flush_chat_outbox``).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.content.models import ContentChunk, ContentItem
+
+from .models import ChatMessage, ChatSession, MessageCitation, PendingChatTurn
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_message_ids(count):
+    """Allocate ``count`` ChatMessage primary keys from the id sequence.
+
+    Returns:
+        A list of ids in ascending order.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [ChatMessage._meta.db_table, count],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def enqueue_chat_turn(
+    session,
+    user_content,
+    assistant_content,
+    model_used,
+    input_tokens,
+    output_tokens,
+    chunks,
+    citations,
+    is_truncated=False,
+):
+    """Record a finished chat turn in the outbox.
+
+    Args:
+        session: The ChatSession the turn belongs to.
+        user_content: The user's message text.
+        assistant_content: The full assistant response.
+        model_used: Model that produced the response.
+        input_tokens: Prompt tokens reported by the provider.
+        output_tokens: Completion tokens reported by the provider.
+        chunks: ContentChunk instances used as RAG context.
+        citations: Citation dicts as produced by ``CitationMatcher``.
+        is_truncated: True if generation was cancelled before completion.
+
+    Returns:
+        The saved PendingChatTurn.
+    """
+    user_message_id, assistant_message_id = reserve_message_ids(2)
+    return PendingChatTurn.objects.create(
+        session=session,
+        user_message_id=user_message_id,
+        assistant_message_id=assistant_message_id,
+        payload={
+            "user_content": user_content,
+            "assistant_content": assistant_content,
+            "model_used": model_used,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "is_truncated": is_truncated,
+            "chunk_ids": [chunk.id for chunk in chunks],
+            "citations": [
+                {
+                    "content_item_id": citation["content_item"].id,
+                    "title": citation["title"],
+                    "url": citation.get("url", ""),
+                    "source_name": citation.get("source_name", ""),
+                }
+                for citation in citations
+            ],
+        },
+    )
+
+
+def enqueue_user_message(session, user_content):
+    """Record a turn that produced no answer, keeping the user's message.
+
+    Returns:
+        The saved PendingChatTurn, without an assistant message.
+    """
+    (user_message_id,) = reserve_message_ids(1)
+    return PendingChatTurn.objects.create(
+        session=session,
+        user_message_id=user_message_id,
+        assistant_message_id=None,
+        payload={
+            "user_content": user_content,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "chunk_ids": [],
+            "citations": [],
+        },
+    )
+
+
+def commit_chat_turn(turn_id):
+    """Write an outbox turn to the chat tables in one transaction.
+
+    The outbox row is locked with ``SKIP LOCKED`` and deleted in the same
+    transaction, so concurrent flushers never commit a turn twice.
+
+    Args:
+        turn_id: Primary key of the PendingChatTurn.
+
+    Returns:
+        True if this call committed the turn, False if it was already
+        committed or is being committed elsewhere.
+    """
+    with transaction.atomic():
+        turn = (
+            PendingChatTurn.objects.select_for_update(skip_locked=True)
+            .filter(pk=turn_id)
+            .first()
+        )
+        if turn is None:
+            return False
+
+        payload = turn.payload
+        messages = [
+            ChatMessage(
+                id=turn.user_message_id,
+                session_id=turn.session_id,
+                role=ChatMessage.Role.USER,
+                content=payload["user_content"],
+            )
+        ]
+        if turn.assistant_message_id is not None:
+            messages.append(
+                ChatMessage(
+                    id=turn.assistant_message_id,
+                    session_id=turn.session_id,
+                    role=ChatMessage.Role.ASSISTANT,
+                    content=payload["assistant_content"],
+                    model_used=payload["model_used"],
+                    input_tokens=payload["input_tokens"],
+                    output_tokens=payload["output_tokens"],
+                    is_truncated=payload.get("is_truncated", False),
+                )
+            )
+        messages = ChatMessage.objects.bulk_create(messages)
+
+        # Content may have been reprocessed since the turn was streamed
+        chunk_ids = ContentChunk.objects.filter(
+            id__in=payload["chunk_ids"]
+        ).values_list("id", flat=True)
+        ChatMessage.retrieved_chunks.through.objects.bulk_create(
+            [
+                ChatMessage.retrieved_chunks.through(
+                    chatmessage_id=turn.assistant_message_id,
+                    contentchunk_id=chunk_id,
+                )
+                for chunk_id in chunk_ids
+            ]
+        )
+
+        item_ids = set(
+            ContentItem.objects.filter(
+                id__in=[c["content_item_id"] for c in payload["citations"]]
+            ).values_list("id", flat=True)
+        )
+        MessageCitation.objects.bulk_create(
+            [
+                MessageCitation(
+                    message_id=turn.assistant_message_id,
+                    content_item_id=citation["content_item_id"],
+                    title=citation["title"],
+                    url=citation["url"],
+                    source_name=citation["source_name"],
+                    order=i,
+                )
+                for i, citation in enumerate(payload["citations"])
+                if citation["content_item_id"] in item_ids
+            ]
+        )
+
+        ChatSession.objects.filter(pk=turn.session_id).update(
+            total_input_tokens=F("total_input_tokens") + payload["input_tokens"],
+            total_output_tokens=F("total_output_tokens") + payload["output_tokens"],
+            message_count=F("message_count") + len(messages),
+            last_message_at=messages[-1].created_at,
+            updated_at=timezone.now(),
+        )
+
+        turn.delete()
+    return True
+
+
+def try_commit_chat_turn(turn_id):
+    """Commit a turn, recording the failure on the outbox row if it fails.
+
+    Returns:
+        True if the turn was committed by this call.
+    """
+    try:
+        return commit_chat_turn(turn_id)
+    except Exception as e:
+        logger.exception("Failed to commit chat turn %s", turn_id)
+        PendingChatTurn.objects.filter(pk=turn_id).update(
+            attempts=F("attempts") + 1,
+            last_error=str(e)[:2000],
+        )
+        return False
+
+
+def flush_pending_turns(min_age_seconds=30, limit=500):
+    """Replay outbox turns whose inline commit did not complete.
+
+    Args:
+        min_age_seconds: Skip turns younger than this so in-flight inline
+            commits are not raced.
+        limit: Maximum number of turns to process in one call.
+
+    Returns:
+        A tuple ``(committed, remaining)`` where ``remaining`` counts turns
+        that failed again or were locked by another flusher.
+    """
+    cutoff = timezone.now() - timedelta(seconds=min_age_seconds)
+    turn_ids = list(
+        PendingChatTurn.objects.filter(created_at__lte=cutoff)
+        .order_by("created_at")
+        .values_list("id", flat=True)[:limit]
+    )
+
+    committed = sum(1 for turn_id in turn_ids if try_commit_chat_turn(turn_id))
+    return committed, len(turn_ids) - committed
+
+
+def repair_session_counters(session_ids=None):
+    """Recompute the denormalized message counters of chat sessions.
+
+    ``commit_chat_turn`` keeps ``message_count`` and ``last_message_at``
+    up to date incrementally. This rewrites them from ChatMessage, for
+    sessions whose counters drifted (e.g. messages written or deleted
+    outside the chat write path). Sessions moved to a ChatSessionArchive
+    are skipped: their messages are no longer in ChatMessage, and their
+    counters were left as they were when the session was archived.
+
+    Args:
+        session_ids: Sessions to repair, or None for all sessions.
+
+    Returns:
+        The number of sessions updated.
+    """
+    messages = (
+        ChatMessage.objects.filter(session=OuterRef("pk")).order_by().values("session")
+    )
+    sessions = ChatSession.objects.filter(archive__isnull=True)
+    if session_ids is not None:
+        sessions = sessions.filter(pk__in=session_ids)
+    return sessions.update(
+        message_count=Coalesce(
+            Subquery(messages.annotate(n=Count("id")).values("n")), 0
+        ),
+        last_message_at=Subquery(
+            messages.annotate(last=Max("created_at")).values("last")
+        ),
+    )
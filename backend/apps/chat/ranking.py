@@ -0,0 +1,169 @@
+"""Re-ranking stages for RAG retrieval.
+
+The pgvector search in ``apps.chat.services`` returns candidates ordered
+purely by distance to the query. The functions here re-order or thin out
+that candidate list before it is turned into prompt context.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Lazy-loaded cross-encoder singletons, keyed by model name
+_cross_encoders = {}
+
+
+def _normalize_rows(matrix):
+    """Return a copy of ``matrix`` with every row scaled to unit length."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(
+    query_embedding,
+    candidate_embeddings,
+    top_k,
+    lambda_mult=0.7,
+    group_ids=None,
+    max_per_group=None,
+    relevance=None,
+):
+    """Select a diverse subset of candidates with Maximal Marginal Relevance.
+
+    Each step picks the candidate maximising
+    ``lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, selected))``.
+    All similarities are computed up front with two matrix products, so the
+    greedy loop only does O(N) vector work per selected item.
+
+    Args:
+        query_embedding: Query vector of shape (d,).
+        candidate_embeddings: Candidate vectors of shape (N, d).
+        top_k: Number of candidates to select.
+        lambda_mult: Relevance/diversity trade-off. 1.0 is pure relevance
+            ordering, 0.0 is pure diversity.
+        group_ids: Optional sequence of length N grouping candidates (e.g.
+            by content item) for the per-group cap.
+        max_per_group: Optional maximum number of selections per group.
+        relevance: Optional precomputed query relevance scores of shape
+            (N,), e.g. from a cross-encoder. Replaces the query/candidate
+            cosine similarity in the MMR objective.
+
+    Returns:
+        A list of candidate indices in selection order.
+    """
+    embeddings = np.asarray(candidate_embeddings, dtype=np.float32)
+    n_candidates = embeddings.shape[0] if embeddings.ndim == 2 else 0
+    if n_candidates == 0 or top_k <= 0:
+        return []
+
+    embeddings = _normalize_rows(embeddings)
+    if relevance is None:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm:
+            query = query / query_norm
+        relevance = embeddings @ query
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+
+    pairwise = embeddings @ embeddings.T
+
+    groups = np.asarray(group_ids) if group_ids is not None else None
+    group_counts = {}
+
+    available = np.ones(n_candidates, dtype=bool)
+    max_sim_to_selected = np.full(n_candidates, -np.inf, dtype=np.float32)
+    selected = []
+
+    for _ in range(min(top_k, n_candidates)):
+        if selected:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim_to_selected
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        if not available[best]:
+            break
+
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim_to_selected, pairwise[best], out=max_sim_to_selected)
+
+        if groups is not None and max_per_group:
+            group = groups[best]
+            group_counts[group] = group_counts.get(group, 0) + 1
+            if group_counts[group] >= max_per_group:
+                available &= groups != group
+
+    return selected
+
+
+def get_cross_encoder(model_name):
+    """Return the process-wide CPU cross-encoder for ``model_name``.
+
+    The model is loaded on first use and kept for the lifetime of the
+    process, mirroring the embedding model in ``apps.content.views``.
+    """
+    model = _cross_encoders.get(model_name)
+    if model is None:
+        from sentence_transformers import CrossEncoder
+
+        model = CrossEncoder(model_name, device="cpu")
+        _cross_encoders[model_name] = model
+    return model
+
+
+def cross_encoder_scores(query, passages, model_name, budget_ms, batch_size=16):
+    """Score (query, passage) pairs with a cross-encoder within a time budget.
+
+    Passages are scored in batches. Before each batch the remaining budget
+    is compared with the duration of the previous batch, so the stage stops
+    early instead of overrunning the budget by a full batch.
+
+    Args:
+        query: The user's query text.
+        passages: Candidate passage texts.
+        model_name: Cross-encoder model to use.
+        budget_ms: Hard latency budget for the whole stage, in milliseconds.
+        batch_size: Number of pairs scored per forward pass.
+
+    Returns:
+        A tuple ``(scores, elapsed_ms)``. ``scores`` is a NumPy array of
+        relevance probabilities in [0, 1], or None if the budget was
+        exceeded (including time spent loading the model).
+    """
+    start = time.perf_counter()
+    budget = budget_ms / 1000.0
+
+    def elapsed():
+        return time.perf_counter() - start
+
+    model = get_cross_encoder(model_name)
+
+    scores = []
+    last_batch = 0.0
+    for offset in range(0, len(passages), batch_size):
+        if elapsed() + last_batch > budget:
+            logger.info(
+                "Cross-encoder budget exhausted after %d/%d passages",
+                offset,
+                len(passages),
+            )
+            return None, elapsed() * 1000
+        batch_start = time.perf_counter()
+        pairs = [(query, text) for text in passages[offset : offset + batch_size]]
+        # predict() already applies the model's sigmoid activation
+        scores.extend(
+            model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        )
+        last_batch = time.perf_counter() - batch_start
+
+    if elapsed() > budget:
+        return None, elapsed() * 1000
+
+    return np.asarray(scores, dtype=np.float32), elapsed() * 1000
@@ -0,0 +1,125 @@
+"""Model routing for chat turns.
+
+``stream_chat_response`` used to send every turn to the same model with
+the same ``max_tokens``. ``route_chat_turn`` instead picks a tier from
+``settings.CHAT_MODEL_TIERS`` using signals that are already available
+locally before the LLM call:
+
+- the estimated token length of the user's message,
+- the similarity scores of the retrieved chunks (best score, spread
+  between best and worst, and number of distinct sources),
+- the number of earlier messages in the session.
+
+Short messages without a relevant source ("thanks!") go to the light
+tier. Long questions, questions whose sources span several items with
+similar scores (typically comparisons), and long conversations go to the
+deep tier. Everything else goes to the standard tier.
+
+Each turn's decision is logged with its latency and usage as one JSON
+record on this module's logger, so the thresholds can be tuned offline.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+
+from apps.llm.budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LIGHT = "light"
+STANDARD = "standard"
+DEEP = "deep"
+
+
+def routing_signals(user_message_text, chunks, history_depth):
+    """Compute the routing signals for a chat turn.
+
+    Args:
+        user_message_text: The user's message text.
+        chunks: Retrieved ContentChunk instances, annotated with
+            ``distance`` when they come from the vector search.
+        history_depth: Number of earlier messages sent as history.
+
+    Returns:
+        A dict of JSON-serializable signals.
+    """
+    scores = [
+        1 - chunk.distance
+        for chunk in chunks
+        if getattr(chunk, "distance", None) is not None
+    ]
+    return {
+        "query_tokens": estimate_tokens(user_message_text),
+        "chunks": len(chunks),
+        "sources": len({chunk.content_item_id for chunk in chunks}),
+        "top_score": round(max(scores), 4) if scores else None,
+        "score_spread": round(max(scores) - min(scores), 4) if scores else None,
+        "history_depth": history_depth,
+    }
+
+
+def choose_tier(signals):
+    """Return ``(tier, reason)`` for a set of routing signals."""
+    query_tokens = signals["query_tokens"]
+    short = query_tokens <= settings.CHAT_ROUTING_SHORT_QUERY_TOKENS
+
+    if query_tokens >= settings.CHAT_ROUTING_LONG_QUERY_TOKENS:
+        return DEEP, "long_query"
+    if (
+        not short
+        and signals["sources"] >= settings.CHAT_ROUTING_MULTI_SOURCE
+        and signals["score_spread"] is not None
+        and signals["score_spread"] <= settings.CHAT_ROUTING_FLAT_SPREAD
+    ):
+        return DEEP, "multi_source"
+    if short and (
+        signals["top_score"] is None
+        or signals["top_score"] < settings.CHAT_ROUTING_LIGHT_MAX_SCORE
+    ):
+        return LIGHT, "short_unsourced"
+    if not short and signals["history_depth"] >= settings.CHAT_ROUTING_DEEP_HISTORY:
+        return DEEP, "deep_history"
+    return STANDARD, "default"
+
+
+def route_chat_turn(user_message_text, chunks, history_depth):
+    """Pick the model and ``max_tokens`` for a chat turn.
+
+    Returns:
+        A decision dict with ``tier``, ``model``, ``max_tokens``,
+        ``reason`` and ``signals``.
+    """
+    signals = routing_signals(user_message_text, chunks, history_depth)
+    if settings.CHAT_ROUTING_ENABLED:
+        tier, reason = choose_tier(signals)
+    else:
+        tier, reason = STANDARD, "disabled"
+    return {
+        "tier": tier,
+        "model": settings.CHAT_MODEL_TIERS[tier]["model"],
+        "max_tokens": settings.CHAT_MODEL_TIERS[tier]["max_tokens"],
+        "reason": reason,
+        "signals": signals,
+    }
+
+
+def log_route_outcome(decision, outcome, first_token_ms, total_ms, usage):
+    """Log a routing decision together with how the turn went.
+
+    Args:
+        decision: Dict returned by ``route_chat_turn``.
+        outcome: "completed", "cancelled" or "error".
+        first_token_ms: Time to the first streamed token, or None.
+        total_ms: Time from the start of the LLM call to the end of the stream.
+        usage: Dict with ``input_tokens`` and ``output_tokens``.
+    """
+    record = {
+        **decision,
+        "outcome": outcome,
+        "first_token_ms": first_token_ms,
+        "total_ms": total_ms,
+        **usage,
+    }
+    logger.info("Chat route: %s", json.dumps(record))
@@ -36,6 +36,7 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             "model_used",
             "input_tokens",
             "output_tokens",
+            "is_truncated",
             "citations",
         ]
         read_only_fields = [
@@ -44,13 +45,13 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             "model_used",
             "input_tokens",
             "output_tokens",
+            "is_truncated",
         ]
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
-    """Serializer for ChatSession model with annotated message count."""
+    """Serializer for ChatSession model with its message counters."""
 
-    message_count = serializers.IntegerField(read_only=True, default=0)
     era_name = serializers.CharField(source="era.name", read_only=True, default=None)
 
     class Meta:
@@ -66,6 +67,7 @@ class ChatSessionSerializer(serializers.ModelSerializer):
             "total_input_tokens",
             "total_output_tokens",
             "message_count",
+            "last_message_at",
         ]
         read_only_fields = [
             "id",
@@ -73,6 +75,8 @@ class ChatSessionSerializer(serializers.ModelSerializer):
             "updated_at",
             "total_input_tokens",
             "total_output_tokens",
+            "message_count",
+            "last_message_at",
         ]
 
 
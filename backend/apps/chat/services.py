@@ -4,8 +4,10 @@ Provides retrieval-augmented generation (RAG) functionality using pgvector
 for semantic search and the Anthropic Claude API for response generation.
 """
 
+import asyncio
 import json
 import logging
+import time
 
 import anthropic
 from asgiref.sync import sync_to_async
@@ -13,10 +15,26 @@ from django.conf import settings
 from pgvector.django import CosineDistance
 
 from apps.content.models import ContentChunk
+from apps.content.retrieval import fetch_candidates, get_query_embedding
 from apps.eras.models import Era
+from apps.llm.breaker import CircuitOpenError, aguarded, get_breaker
+from apps.llm.budget import BudgetExceededError, estimate_tokens, reconcile, reserve
+from apps.llm.governor import INTERACTIVE, GovernorTimeoutError, agoverned
+
+from .citations import CitationMatcher, serialize_citation
+from .metrics import record_stream_cancelled, record_stream_completed
+from .ranking import cross_encoder_scores, mmr_select
+from .routing import log_route_outcome, route_chat_turn
 
 logger = logging.getLogger(__name__)
 
+# Upper estimate of the RAG context and history added to each prompt, used
+# to size token budget reservations before retrieval has run
+PROMPT_OVERHEAD_TOKENS = 4000
+
+BUDGET_EXCEEDED_MESSAGE = "Daily AI usage limit reached. Try again after the reset."
+BUDGET_EXCEEDED_EVENT = {"type": "error", "content": BUDGET_EXCEEDED_MESSAGE}
+
 SYSTEM_PROMPT = """You are Toledot, a church history teaching assistant grounded in the Reformed \
 theological tradition. Your purpose is to help users learn about and understand the history of \
 the Christian church from the apostolic era to the present day.
@@ -36,39 +54,61 @@ the response is not grounded in the provided materials.
 """
 
 
-def get_query_embedding(text: str):
-    """Generate an embedding vector for a query string.
-
-    Uses the lazy-loaded sentence-transformers model from the content app
-    to ensure consistency between search and chat embeddings.
-
-    Args:
-        text: The query text to embed.
-
-    Returns:
-        A list of floats representing the embedding vector.
-    """
-    from apps.content.views import _get_query_embedding
-
-    return _get_query_embedding(text)
-
-
-def retrieve_relevant_chunks(query_text, era=None, top_k=6, min_score=0.3):
+def retrieve_relevant_chunks(
+    query_text,
+    era=None,
+    top_k=6,
+    min_score=0.3,
+    diversify=True,
+    rerank=None,
+    adaptive=None,
+    stats=None,
+):
     """Retrieve relevant content chunks using pgvector cosine similarity search.
 
     Performs a semantic search against the content chunk embeddings to find
-    the most relevant passages for the given query.
+    the most relevant passages for the given query. When ``diversify`` is
+    set, ``CHAT_RETRIEVAL_FETCH_K`` candidates are over-fetched and reduced
+    to ``top_k`` with Maximal Marginal Relevance so that a single lecture or
+    article cannot crowd out every other source.
+
+    With ``adaptive`` retrieval, a candidate window that yields fewer than
+    ``top_k`` chunks above ``min_score`` (typically because the era filter
+    is applied after HNSW candidate generation) is widened and re-queried
+    with a larger ``hnsw.ef_search`` until enough chunks qualify, the
+    similarity tail drops below ``min_score``, or the cost caps are hit.
+
+    When ``rerank`` is enabled the leading ``CHAT_RERANK_CANDIDATES``
+    candidates are scored by a CPU cross-encoder first. If that stage does
+    not finish within ``CHAT_RERANK_BUDGET_MS`` the vector order is used.
 
     Args:
         query_text: The user's question or search query.
         era: Optional Era instance to filter results by era tag.
         top_k: Maximum number of chunks to retrieve.
         min_score: Minimum cosine similarity score (0.0-1.0) to include.
+        diversify: Whether to apply MMR diversification to the candidates.
+        rerank: Whether to run the cross-encoder stage. Defaults to
+            ``settings.CHAT_RERANK_ENABLED``.
+        adaptive: Whether to widen the candidate window when results are
+            starved. Defaults to ``settings.CHAT_RETRIEVAL_ADAPTIVE``.
+        stats: Optional dict that receives per-stage timings in
+            milliseconds, candidate counts, the achieved k and the number
+            of widening rounds and rows scanned for this call.
 
     Returns:
         A list of ContentChunk instances ordered by relevance.
     """
+    if rerank is None:
+        rerank = settings.CHAT_RERANK_ENABLED
+    if adaptive is None:
+        adaptive = settings.CHAT_RETRIEVAL_ADAPTIVE
+    if stats is None:
+        stats = {}
+
+    stage_start = time.perf_counter()
     query_embedding = get_query_embedding(query_text)
+    stats["embed_ms"] = _elapsed_ms(stage_start)
 
     chunks = (
         ContentChunk.objects.select_related("content_item__source")
@@ -82,17 +122,121 @@ def retrieve_relevant_chunks(query_text, era=None, top_k=6, min_score=0.3):
             content_item__tags__tag_type="era",
         )
 
-    chunks = chunks[:top_k]
+    fetch_k = top_k
+    if diversify:
+        fetch_k = max(fetch_k, settings.CHAT_RETRIEVAL_FETCH_K)
+    if rerank:
+        fetch_k = max(fetch_k, settings.CHAT_RERANK_CANDIDATES)
 
-    results = []
-    for chunk in chunks:
-        similarity = 1 - chunk.distance
-        if similarity >= min_score:
-            results.append(chunk)
+    stage_start = time.perf_counter()
+    results = fetch_candidates(
+        chunks, fetch_k, top_k, min_score, adaptive=adaptive, stats=stats
+    )
+    stats["ann_ms"] = _elapsed_ms(stage_start)
+    stats["candidates"] = len(results)
+
+    relevance = None
+    if rerank and results:
+        results, relevance = rerank_chunks(query_text, results, stats)
 
+    if diversify and results:
+        stage_start = time.perf_counter()
+        results = diversify_chunks(query_embedding, results, top_k, relevance=relevance)
+        stats["mmr_ms"] = _elapsed_ms(stage_start)
+
+    results = results[:top_k]
+    stats["achieved_k"] = len(results)
     return results
 
 
+def rerank_chunks(query_text, chunks, stats):
+    """Re-order the leading candidates with the CPU cross-encoder.
+
+    Only the first ``CHAT_RERANK_CANDIDATES`` chunks are scored; the
+    remainder is dropped once a re-rank succeeds. On budget overrun or
+    model failure the candidates are returned unchanged in vector order.
+
+    Args:
+        query_text: The user's question.
+        chunks: Candidate ContentChunk instances in vector order.
+        stats: Dict receiving ``rerank_ms`` and ``rerank_applied``.
+
+    Returns:
+        A tuple ``(chunks, relevance)`` where ``relevance`` holds the
+        cross-encoder scores aligned with ``chunks``, or None on fallback.
+    """
+    candidates = chunks[: settings.CHAT_RERANK_CANDIDATES]
+    stage_start = time.perf_counter()
+    try:
+        scores, _ = cross_encoder_scores(
+            query_text,
+            [chunk.chunk_text for chunk in candidates],
+            model_name=settings.CHAT_RERANK_MODEL,
+            budget_ms=settings.CHAT_RERANK_BUDGET_MS,
+            batch_size=settings.CHAT_RERANK_BATCH_SIZE,
+        )
+    except Exception:
+        logger.exception("Cross-encoder re-rank failed")
+        scores = None
+    stats["rerank_ms"] = _elapsed_ms(stage_start)
+    stats["rerank_applied"] = scores is not None
+
+    if scores is None:
+        return chunks, None
+
+    order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+    return [candidates[i] for i in order], [float(scores[i]) for i in order]
+
+
+def diversify_chunks(
+    query_embedding,
+    chunks,
+    top_k,
+    lambda_mult=None,
+    max_per_item=None,
+    relevance=None,
+):
+    """Re-rank candidate chunks with Maximal Marginal Relevance.
+
+    Uses the embeddings already loaded on the candidate chunks, so no
+    further database access is needed.
+
+    Args:
+        query_embedding: The query embedding vector.
+        chunks: Candidate ContentChunk instances, most relevant first.
+        top_k: Number of chunks to select.
+        lambda_mult: Relevance/diversity trade-off. Defaults to
+            ``settings.CHAT_MMR_LAMBDA``.
+        max_per_item: Maximum chunks taken from one content item. Defaults
+            to ``settings.CHAT_MMR_MAX_PER_ITEM``; 0 disables the cap.
+        relevance: Optional per-chunk relevance scores (e.g. from the
+            cross-encoder) used instead of embedding similarity.
+
+    Returns:
+        The selected ContentChunk instances in selection order.
+    """
+    if lambda_mult is None:
+        lambda_mult = settings.CHAT_MMR_LAMBDA
+    if max_per_item is None:
+        max_per_item = settings.CHAT_MMR_MAX_PER_ITEM
+
+    order = mmr_select(
+        query_embedding,
+        [chunk.embedding for chunk in chunks],
+        top_k,
+        lambda_mult=lambda_mult,
+        group_ids=[chunk.content_item_id for chunk in chunks],
+        max_per_group=max_per_item,
+        relevance=relevance,
+    )
+    return [chunks[i] for i in order]
+
+
+def _elapsed_ms(start):
+    """Return milliseconds elapsed since the ``time.perf_counter()`` start."""
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
 def build_context(chunks, era=None):
     """Build a context string from retrieved chunks for prompt augmentation.
 
@@ -164,131 +308,279 @@ def build_messages(session, user_message, context):
     return messages
 
 
-async def stream_chat_response(session, user_message_text, era=None):
+async def stream_chat_response(
+    session, user_message_text, era=None, charge_budget=False
+):
     """Stream a chat response using Claude with RAG context.
 
     Performs the full RAG pipeline: retrieves relevant chunks, builds context,
-    sends the augmented prompt to Claude, streams the response, and persists
-    all messages and citations to the database.
+    routes the turn to a model tier (see ``apps.chat.routing``), sends the
+    augmented prompt to Claude, and streams the response. The
+    finished turn is written to the PendingChatTurn outbox, the ``done``
+    event is emitted, and the turn is then committed to the chat tables
+    (see ``apps.chat.persistence``). When no answer is produced (provider
+    errors, a disconnect before the first token), the user's message is
+    still saved.
+
+    If the generator is closed or cancelled mid-answer (e.g. the client
+    disconnected and did not resume, see ``apps.chat.streams``), the
+    upstream Anthropic stream is closed immediately and the partial answer
+    is persisted with ``is_truncated=True``.
+
+    While the Anthropic circuit breaker is open (see ``apps.llm.breaker``),
+    an error event is yielded without calling the API.
 
     Args:
         session: The ChatSession instance.
         user_message_text: The user's message text.
         era: Optional Era instance to scope the search.
+        charge_budget: Whether to charge the turn to the session user's
+            daily token budget (see ``apps.llm.budget``). An estimate is
+            reserved right before Claude is called and reconciled with the
+            actual usage once the stream ends, fails or is cancelled; if it
+            does not fit, an error event is yielded instead.
 
     Yields:
         Dicts with SSE event data:
         - {"type": "delta", "content": "..."} for each text chunk
+        - {"type": "citation", "citation": {...}} when a source is first cited
         - {"type": "done", "message_id": "...", "citations": [...]} on completion
         - {"type": "error", "content": "..."} on failure
     """
-    from .models import ChatMessage, MessageCitation
+    from .persistence import (
+        enqueue_chat_turn,
+        enqueue_user_message,
+        try_commit_chat_turn,
+    )
+
+    async def save_unanswered():
+        turn = await sync_to_async(enqueue_user_message)(session, user_message_text)
+        await sync_to_async(try_commit_chat_turn)(turn.id)
 
     # Retrieve relevant chunks (sync ORM - must be wrapped for async)
+    retrieval_stats = {}
     try:
         chunks = await sync_to_async(retrieve_relevant_chunks)(
-            user_message_text, era=era
+            user_message_text, era=era, stats=retrieval_stats
         )
     except Exception:
         logger.exception("Failed to retrieve chunks for RAG")
         chunks = []
+    logger.info("RAG retrieval stats: %s", json.dumps(retrieval_stats))
 
     context = build_context(chunks, era=era)
 
-    # Save user message
-    user_msg = await ChatMessage.objects.acreate(
-        session=session,
-        role=ChatMessage.Role.USER,
-        content=user_message_text,
-    )
-
     # Build messages for Claude (sync ORM - must be wrapped for async)
     messages = await sync_to_async(build_messages)(
         session, user_message_text, context
     )
 
-    # Stream response from Claude
-    client = anthropic.AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
+    # Pick the model tier and max_tokens for this turn
+    route = route_chat_turn(user_message_text, chunks, len(messages) - 1)
+    model = route["model"]
+    max_tokens = route["max_tokens"]
+
+    # Stream response from Claude. Retries are left to the circuit breaker
+    # so that they stop as soon as the provider is known to be down.
+    client = anthropic.AsyncAnthropic(
+        api_key=settings.ANTHROPIC_API_KEY,
+        base_url=settings.ANTHROPIC_BASE_URL or None,
+        timeout=settings.ANTHROPIC_TIMEOUT,
+        max_retries=0,
+    )
+    breaker = get_breaker("anthropic", model)
 
+    citation_matcher = CitationMatcher(chunks)
     full_response = ""
     input_tokens = 0
     output_tokens = 0
+    stream = None
+    outcome = "error"
+    error_event = None
+    call_start = time.perf_counter()
+    first_token_ms = None
+
+    # Reserved here rather than by the view, so that every reservation is
+    # reconciled by the ``finally`` below, even if the client left before
+    # the stream started
+    reservation = None
+    if charge_budget:
+        try:
+            reservation = await sync_to_async(reserve)(
+                session.user_id, estimate_turn_tokens(user_message_text)
+            )
+        except BudgetExceededError:
+            yield BUDGET_EXCEEDED_EVENT
+            return
 
     try:
-        async with client.messages.stream(
-            model=settings.ANTHROPIC_MODEL,
-            max_tokens=2048,
-            system=SYSTEM_PROMPT,
-            messages=messages,
-        ) as stream:
+        async with (
+            agoverned("anthropic", INTERACTIVE),
+            aguarded(
+                breaker,
+                lambda: client.messages.stream(
+                    model=model,
+                    max_tokens=max_tokens,
+                    system=SYSTEM_PROMPT,
+                    messages=messages,
+                ),
+            ) as stream,
+        ):
             async for text in stream.text_stream:
+                if first_token_ms is None:
+                    first_token_ms = _elapsed_ms(call_start)
                 full_response += text
                 yield {"type": "delta", "content": text}
+                for citation in citation_matcher.feed(text):
+                    yield {
+                        "type": "citation",
+                        "citation": serialize_citation(citation),
+                    }
 
             # Get final message for token counts
             final_message = await stream.get_final_message()
             input_tokens = final_message.usage.input_tokens
             output_tokens = final_message.usage.output_tokens
-
+            outcome = "completed"
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client disconnected. Leaving the ``async with`` block has already
+        # closed the HTTP response, so Anthropic stops generating.
+        outcome = "cancelled"
+        partial_tokens = estimate_tokens(full_response)
+        saved = record_stream_cancelled(partial_tokens, max_tokens)
+        logger.info(
+            "Chat stream cancelled by client: session=%s partial_tokens=%d "
+            "estimated_tokens_saved=%d",
+            session.id,
+            partial_tokens,
+            saved,
+        )
+        if full_response:
+            turn = await sync_to_async(enqueue_chat_turn)(
+                session,
+                user_message_text,
+                full_response,
+                model,
+                _snapshot_input_tokens(stream),
+                partial_tokens,
+                chunks,
+                citation_matcher.citations,
+                is_truncated=True,
+            )
+            await sync_to_async(try_commit_chat_turn)(turn.id)
+        else:
+            await save_unanswered()
+        raise
+    except GovernorTimeoutError:
+        logger.warning("No Anthropic capacity for chat session %s", session.id)
+        error_event = {
+            "type": "error",
+            "content": "The AI service is busy. Please try again in a moment.",
+        }
+    except CircuitOpenError as e:
+        logger.warning("Skipping Anthropic call for session %s: %s", session.id, e)
+        error_event = {
+            "type": "error",
+            "content": "The AI service is temporarily unavailable. "
+            "Please try again in a minute.",
+        }
     except anthropic.APIConnectionError:
         logger.exception("Failed to connect to Anthropic API")
-        yield {"type": "error", "content": "Failed to connect to AI service."}
-        return
+        error_event = {"type": "error", "content": "Failed to connect to AI service."}
     except anthropic.RateLimitError:
         logger.exception("Anthropic API rate limit exceeded")
-        yield {"type": "error", "content": "AI service rate limit exceeded. Please try again later."}
-        return
+        error_event = {
+            "type": "error",
+            "content": "AI service rate limit exceeded. Please try again later.",
+        }
     except anthropic.APIStatusError as e:
         logger.exception("Anthropic API error: %s", e.message)
-        yield {"type": "error", "content": "AI service error. Please try again later."}
-        return
-
-    # Save assistant message
-    assistant_msg = await ChatMessage.objects.acreate(
-        session=session,
-        role=ChatMessage.Role.ASSISTANT,
-        content=full_response,
-        model_used=settings.ANTHROPIC_MODEL,
-        input_tokens=input_tokens,
-        output_tokens=output_tokens,
-    )
-
-    # Save retrieved chunks reference
-    if chunks:
-        await assistant_msg.retrieved_chunks.aset([c.id for c in chunks])
-
-    # Extract and save citations
-    citations = extract_citations(full_response, chunks)
-    for i, citation in enumerate(citations):
-        await MessageCitation.objects.acreate(
-            message=assistant_msg,
-            content_item=citation["content_item"],
-            title=citation["title"],
-            url=citation.get("url", ""),
-            source_name=citation.get("source_name", ""),
-            order=i,
+        error_event = {
+            "type": "error",
+            "content": "AI service error. Please try again later.",
+        }
+    finally:
+        if reservation is not None:
+            await sync_to_async(reconcile)(
+                reservation,
+                _tokens_used(stream, input_tokens, output_tokens, full_response),
+            )
+        log_route_outcome(
+            route,
+            outcome,
+            first_token_ms,
+            _elapsed_ms(call_start),
+            {
+                "input_tokens": input_tokens or _snapshot_input_tokens(stream),
+                "output_tokens": output_tokens or estimate_tokens(full_response),
+            },
         )
 
-    # Update session token counts
-    session.total_input_tokens += input_tokens
-    session.total_output_tokens += output_tokens
-    await session.asave(
-        update_fields=["total_input_tokens", "total_output_tokens", "updated_at"]
+    if error_event is not None:
+        await save_unanswered()
+        yield error_event
+        return
+
+    record_stream_completed(output_tokens)
+
+    # Record the turn in the outbox (one insert) and emit ``done`` before
+    # committing it. A commit that fails, or never runs because the
+    # generator is closed after ``done``, leaves the turn in the outbox for
+    # the periodic flush.
+    citations = citation_matcher.citations
+    turn = await sync_to_async(enqueue_chat_turn)(
+        session,
+        user_message_text,
+        full_response,
+        model,
+        input_tokens,
+        output_tokens,
+        chunks,
+        citations,
     )
 
     yield {
         "type": "done",
-        "message_id": str(assistant_msg.id),
-        "citations": [
-            {
-                "title": c["title"],
-                "url": c.get("url", ""),
-                "source_name": c.get("source_name", ""),
-            }
-            for c in citations
-        ],
+        "message_id": str(turn.assistant_message_id),
+        "citations": [serialize_citation(c) for c in citations],
     }
 
+    await sync_to_async(try_commit_chat_turn)(turn.id)
+
+
+def estimate_turn_tokens(user_message_text):
+    """Return an upper estimate of the tokens one chat turn may use.
+
+    Routing happens after retrieval, so the largest tier's ``max_tokens``
+    is assumed.
+    """
+    return (
+        estimate_tokens(SYSTEM_PROMPT + user_message_text)
+        + PROMPT_OVERHEAD_TOKENS
+        + max(tier["max_tokens"] for tier in settings.CHAT_MODEL_TIERS.values())
+    )
+
+
+def _tokens_used(stream, input_tokens, output_tokens, full_response):
+    """Return the tokens a chat turn used, estimating unreported usage."""
+    if output_tokens:
+        return input_tokens + output_tokens
+    return _snapshot_input_tokens(stream) + estimate_tokens(full_response)
+
+
+def _snapshot_input_tokens(stream):
+    """Return the prompt tokens reported so far by an Anthropic stream.
+
+    ``message_start`` carries the input token count, so it is known even
+    when the stream is cancelled before ``get_final_message``.
+    """
+    try:
+        tokens = stream.current_message_snapshot.usage.input_tokens
+    except Exception:
+        return 0
+    return tokens if isinstance(tokens, int) else 0
+
 
 def extract_citations(response_text, chunks):
     """Extract source citations from the AI response text.
@@ -296,6 +588,7 @@ def extract_citations(response_text, chunks):
     Matches retrieved chunks against the response to determine which
     sources were actually referenced, either by title mention or
     by [Source: title] notation matching the specific source title.
+    This is the whole-text form of the streaming ``CitationMatcher``.
 
     Args:
         response_text: The full AI-generated response text.
@@ -304,37 +597,6 @@ def extract_citations(response_text, chunks):
     Returns:
         A list of dicts with keys: content_item, title, url, source_name.
     """
-    import re
-
-    citations = []
-    seen_items = set()
-    response_lower = response_text.lower()
-
-    # Extract all [Source: ...] references from the response
-    source_refs = [
-        ref.strip().lower()
-        for ref in re.findall(r"\[source:\s*([^\]]+)\]", response_lower)
-    ]
-
-    for chunk in chunks:
-        item = chunk.content_item
-        if item.id not in seen_items:
-            seen_items.add(item.id)
-            title_lower = item.title.lower()
-            # Check if this specific source is referenced
-            title_referenced = title_lower in response_lower
-            source_notation_match = any(
-                title_lower in ref or ref in title_lower
-                for ref in source_refs
-            )
-            if title_referenced or source_notation_match:
-                citations.append(
-                    {
-                        "content_item": item,
-                        "title": item.title,
-                        "url": item.url,
-                        "source_name": item.source.name if item.source else "",
-                    }
-                )
-
-    return citations
+    matcher = CitationMatcher(chunks)
+    matcher.feed(response_text)
+    return matcher.citations_in_context_order()
@@ -0,0 +1,414 @@
+"""Resumable SSE delivery for chat responses.
+
+A chat response is generated by a background task that publishes every
+event to a short-lived buffer in the Django cache (Valkey in deployed
+environments), keyed by a stream id. Each SSE frame carries
+``id: <stream_id>:<seq>``, so a client that reconnects with
+``Last-Event-ID`` is attached to the still-running generation (or replayed
+its completed buffer) instead of asking the question again.
+
+Readers in the producing process follow the in-memory event list; readers
+in other processes poll the cache. Generation is abandoned once no reader
+has been attached for ``CHAT_STREAM_RESUME_GRACE`` seconds, checked on a
+timer so that a stalled upstream is abandoned as well. The grace period
+trades resumability against wasted tokens: a client that reconnects
+within it gets the rest of the same answer, but a client that left for
+good keeps the answer generating (and billed) for that long. A grace of 0
+restores cancellation as soon as the last reader leaves (within
+``READER_CHECK_INTERVAL``), at the cost of resuming only finished streams.
+
+To keep the number of frames (and buffer writes) per answer low,
+consecutive text deltas are coalesced before they are published, and
+readers send ``: ping`` comment frames while the stream is idle so that
+proxies do not time out before the first token.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import aclosing
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chat:sse:"
+
+# Seconds between cache polls when following a stream from another process
+POLL_INTERVAL = 0.1
+
+# Seconds without new events before a cross-process reader gives up
+STALL_TIMEOUT = 60
+
+# Seconds between checks of the attached-reader count by the producer
+READER_CHECK_INTERVAL = 1.0
+
+ERROR_EVENT = {"type": "error", "content": "An unexpected error occurred."}
+
+HEARTBEAT_FRAME = ": ping\n\n"
+
+# Streams produced by this process, keyed by stream id
+_live_streams = {}
+
+# Strong references to producer tasks so they are not garbage collected
+_producer_tasks = set()
+
+
+class _LiveStream:
+    """In-process state of a stream produced by this worker."""
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.reader_detached = False
+        self._changed = asyncio.Event()
+
+    def append(self, data):
+        """Add serialized event ``data`` and wake up readers."""
+        self.events.append(data)
+        self._notify()
+
+    def finish(self):
+        """Mark the stream as complete and wake up readers."""
+        self.finished = True
+        self._notify()
+
+    async def wait(self):
+        """Wait until the next event is appended or the stream finishes."""
+        await self._changed.wait()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class _Pump:
+    """Drain an async iterator into a queue from a background task.
+
+    Lets a consumer wait for the next item with a timeout without
+    cancelling the iterator: ``asyncio.wait_for`` on ``__anext__`` would
+    cancel ``stream_chat_response`` mid-generation. Items that are already
+    queued are returned without suspending.
+    """
+
+    _END = object()
+
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    async def _run(self):
+        try:
+            async for item in self._iterator:
+                self._queue.put_nowait(item)
+        except Exception as e:
+            self._queue.put_nowait(_PumpError(e))
+        finally:
+            self._queue.put_nowait(self._END)
+
+    async def get(self, timeout=None):
+        """Return ``(True, item)``, or ``(False, None)`` on timeout.
+
+        Raises:
+            StopAsyncIteration: When the iterator is exhausted.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        if not self._queue.empty():
+            item = self._queue.get_nowait()
+        elif timeout is None:
+            item = await self._queue.get()
+        else:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except TimeoutError:
+                return False, None
+
+        if item is self._END:
+            raise StopAsyncIteration
+        if isinstance(item, _PumpError):
+            raise item.error
+        return True, item
+
+    async def aclose(self):
+        """Stop the background task and close the iterator."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._iterator.aclose()
+
+
+class _PumpError:
+    """Carries an exception raised by a pumped iterator to its consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+async def coalesce_deltas(events, max_bytes, max_delay_ms):
+    """Merge consecutive delta events from ``events``.
+
+    Buffered text is flushed as one delta when it reaches ``max_bytes``,
+    when ``max_delay_ms`` has passed since the first buffered delta, or
+    before any other event (so a citation still follows the text that
+    completes it).
+
+    Args:
+        events: Async iterator of event dicts.
+        max_bytes: Flush once this many UTF-8 bytes are buffered.
+        max_delay_ms: Maximum time a delta is held back; 0 disables
+            coalescing.
+    """
+    if max_delay_ms <= 0:
+        async with aclosing(events):
+            async for event in events:
+                yield event
+        return
+
+    parts = []
+    size = 0
+    deadline = None
+    source = _Pump(events)
+
+    def flush():
+        nonlocal parts, size, deadline
+        event = {"type": "delta", "content": "".join(parts)}
+        parts, size, deadline = [], 0, None
+        return event
+
+    try:
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                ready, event = await source.get(timeout)
+            except StopAsyncIteration:
+                break
+
+            if not ready:
+                yield flush()
+                continue
+            if event["type"] == "delta":
+                parts.append(event["content"])
+                size += len(event["content"].encode())
+                if deadline is None:
+                    deadline = time.monotonic() + max_delay_ms / 1000
+                if size >= max_bytes:
+                    yield flush()
+                continue
+            if parts:
+                yield flush()
+            yield event
+
+        if parts:
+            yield flush()
+    finally:
+        await source.aclose()
+
+
+def _key(stream_id, name):
+    return f"{KEY_PREFIX}{stream_id}:{name}"
+
+
+def format_frame(stream_id, seq, data):
+    """Format serialized event ``data`` as an SSE frame with an event id."""
+    return f"id: {stream_id}:{seq}\ndata: {data}\n\n"
+
+
+def parse_event_id(value):
+    """Parse a ``Last-Event-ID`` header value.
+
+    Returns:
+        A tuple ``(stream_id, seq)``, or None if the value is malformed.
+    """
+    stream_id, _, seq = (value or "").strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+def create_stream(user_id, session_id):
+    """Register a new stream and return its id."""
+    stream_id = uuid.uuid4().hex
+    cache.set_many(
+        {
+            _key(stream_id, "meta"): {"user_id": user_id, "session_id": session_id},
+            _key(stream_id, "readers"): 0,
+        },
+        settings.CHAT_STREAM_BUFFER_TTL,
+    )
+    return stream_id
+
+
+def get_stream_meta(stream_id):
+    """Return ``{"user_id", "session_id"}`` for a buffered stream, or None."""
+    return cache.get(_key(stream_id, "meta"))
+
+
+def start_stream(stream_id, events):
+    """Start producing ``events`` for ``stream_id`` in a background task.
+
+    Must be called from within the running event loop.
+
+    Args:
+        stream_id: Id returned by ``create_stream``.
+        events: Async generator of event dicts (``stream_chat_response``).
+    """
+    live = _LiveStream()
+    _live_streams[stream_id] = live
+    events = coalesce_deltas(
+        events,
+        settings.CHAT_STREAM_COALESCE_BYTES,
+        settings.CHAT_STREAM_COALESCE_MS,
+    )
+    task = asyncio.get_running_loop().create_task(_produce(stream_id, live, events))
+    _producer_tasks.add(task)
+    task.add_done_callback(_producer_tasks.discard)
+
+
+async def _produce(stream_id, live, events):
+    """Publish ``events`` to the in-memory list and the cache buffer.
+
+    Attached readers are checked every ``READER_CHECK_INTERVAL`` seconds
+    whether or not events arrive, so a stalled upstream is abandoned too.
+    """
+    ttl = settings.CHAT_STREAM_BUFFER_TTL
+    grace = settings.CHAT_STREAM_RESUME_GRACE
+    seq = 0
+    unattended_since = None
+    next_check = time.monotonic() + READER_CHECK_INTERVAL
+
+    async def publish(event):
+        nonlocal seq
+        seq += 1
+        data = json.dumps(event)
+        live.append(data)
+        await cache.aset_many(
+            {_key(stream_id, seq): data, _key(stream_id, "last"): seq}, ttl
+        )
+
+    source = _Pump(events)
+    try:
+        while True:
+            try:
+                ready, event = await source.get(max(0.0, next_check - time.monotonic()))
+            except StopAsyncIteration:
+                break
+            if ready:
+                await publish(event)
+
+            now = time.monotonic()
+            if not live.reader_detached and now < next_check:
+                continue
+            live.reader_detached = False
+            next_check = now + READER_CHECK_INTERVAL
+            if await cache.aget(_key(stream_id, "readers"), 0) > 0:
+                unattended_since = None
+                continue
+            if unattended_since is None:
+                unattended_since = now
+            if now - unattended_since >= grace:
+                logger.info("Abandoning chat stream %s: no clients attached", stream_id)
+                break
+    except Exception:
+        logger.exception("Error during chat stream")
+        await publish(ERROR_EVENT)
+    finally:
+        # Closing the source cancels generation if it is still running
+        await source.aclose()
+        live.finish()
+        _live_streams.pop(stream_id, None)
+        await cache.aset(_key(stream_id, "end"), seq, ttl)
+        await cache.atouch(_key(stream_id, "meta"), ttl)
+
+
+async def subscribe(stream_id, after_seq=0):
+    """Yield SSE frames for the events of a stream after ``after_seq``.
+
+    Ends when the stream is complete. While iterating, the reader is
+    counted as attached, which keeps the producer generating. A heartbeat
+    comment frame is sent whenever no event arrives for
+    ``CHAT_STREAM_HEARTBEAT_SECONDS``.
+    """
+    readers_key = _key(stream_id, "readers")
+    await cache.aadd(readers_key, 0, settings.CHAT_STREAM_BUFFER_TTL)
+    try:
+        await cache.aincr(readers_key)
+    except ValueError:
+        pass
+
+    live = _live_streams.get(stream_id)
+    try:
+        if live is not None:
+            frames = _follow_live(stream_id, live, after_seq)
+        else:
+            frames = _follow_buffer(stream_id, after_seq)
+        heartbeat = settings.CHAT_STREAM_HEARTBEAT_SECONDS or None
+        source = _Pump(frames)
+        try:
+            while True:
+                try:
+                    ready, frame = await source.get(heartbeat)
+                except StopAsyncIteration:
+                    break
+                yield frame if ready else HEARTBEAT_FRAME
+        finally:
+            await source.aclose()
+    finally:
+        try:
+            await cache.adecr(readers_key)
+        except ValueError:
+            pass
+        if live is not None:
+            live.reader_detached = True
+
+
+async def _follow_live(stream_id, live, after_seq):
+    """Follow a stream produced by this process."""
+    seq = after_seq
+    while True:
+        while seq < len(live.events):
+            seq += 1
+            yield format_frame(stream_id, seq, live.events[seq - 1])
+        if live.finished:
+            return
+        await live.wait()
+
+
+async def _follow_buffer(stream_id, after_seq):
+    """Follow a stream through the cache buffer (any process)."""
+    last_key = _key(stream_id, "last")
+    end_key = _key(stream_id, "end")
+    seq = after_seq
+    last_progress = time.monotonic()
+
+    while True:
+        state = await cache.aget_many([last_key, end_key])
+        end = state.get(end_key)
+        last = end if end is not None else state.get(last_key, 0)
+
+        if last > seq:
+            keys = [_key(stream_id, n) for n in range(seq + 1, last + 1)]
+            buffered = await cache.aget_many(keys)
+            for n, key in enumerate(keys, start=seq + 1):
+                if key not in buffered:
+                    logger.warning("Chat stream %s buffer expired at %d", stream_id, n)
+                    return
+                yield format_frame(stream_id, n, buffered[key])
+                seq = n
+            last_progress = time.monotonic()
+
+        if end is not None and seq >= end:
+            return
+        if time.monotonic() - last_progress > STALL_TIMEOUT:
+            logger.warning("Chat stream %s stalled; closing reader", stream_id)
+            return
+        await asyncio.sleep(POLL_INTERVAL)
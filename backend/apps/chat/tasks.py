@@ -0,0 +1,24 @@
+"""Celery tasks for the chat app.
+
+``flush_chat_outbox`` runs on the Celery beat schedule
+(``CELERY_BEAT_SCHEDULE``) and commits chat turns whose inline commit did
+not complete (see ``apps.chat.persistence``).
+"""
+
+import logging
+
+from celery import shared_task
+
+from .persistence import flush_pending_turns
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_chat_outbox():
+    """Commit chat turns left in the PendingChatTurn outbox."""
+    committed, remaining = flush_pending_turns()
+    if committed or remaining:
+        logger.info(
+            "Flushed chat outbox: %d committed, %d remaining", committed, remaining
+        )
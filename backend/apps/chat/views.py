@@ -4,23 +4,37 @@ Provides CRUD endpoints for chat sessions and messages, plus an
 async SSE streaming endpoint for real-time AI chat responses.
 """
 
-import json
+import hashlib
 import logging
+from contextlib import aclosing
 
-from django.db.models import Count
+from django.db.models import prefetch_related_objects
 from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 
+from apps.llm.budget import BudgetExceededError, check
+
+from .archive import load_archived_messages, restore_session
 from .models import ChatMessage, ChatSession
+from .pagination import MessageKeysetPagination
 from .serializers import (
     ChatMessageSerializer,
     ChatSessionCreateSerializer,
     ChatSessionSerializer,
     ChatStreamSerializer,
 )
+from .streams import (
+    create_stream,
+    get_stream_meta,
+    parse_event_id,
+    start_stream,
+    subscribe,
+)
 from .throttles import ChatBurstThrottle, ChatRateThrottle
 
 logger = logging.getLogger(__name__)
@@ -50,17 +64,23 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         return ChatSessionSerializer
 
     def get_queryset(self):
-        """Return sessions belonging to the authenticated user."""
-        return (
-            ChatSession.objects.filter(user=self.request.user)
-            .select_related("era")
-            .annotate(message_count=Count("messages"))
-        )
+        """Return sessions belonging to the authenticated user.
+
+        ``message_count`` is a stored counter, so listing is an index scan
+        on ``(user, -updated_at)`` without touching the messages table.
+        """
+        return ChatSession.objects.filter(user=self.request.user).select_related("era")
 
     def perform_create(self, serializer):
         """Assign the authenticated user to the new session."""
         serializer.save(user=self.request.user)
 
+    def perform_update(self, serializer):
+        """Move an unarchived session's messages back out of cold storage."""
+        session = serializer.save()
+        if not session.is_archived:
+            restore_session(session.id)
+
 
 class ChatMessageListView(ListAPIView):
     """List messages for a specific chat session.
@@ -68,27 +88,66 @@ class ChatMessageListView(ListAPIView):
     Endpoint:
     - GET /api/chat/sessions/{session_id}/messages/
 
-    Returns all messages in chronological order for the given session.
-    Only accessible by the session owner. Pagination is disabled since
-    chat UIs need the full conversation history.
+    Returns one keyset-paginated page of messages in chronological order
+    (see ``MessageKeysetPagination``): the newest messages by default,
+    older ones with ``?before=<id>`` and newer ones with ``?after=<id>``.
+    Only accessible by the session owner.
+
+    Each page carries an ``ETag`` computed from the message ids, so a
+    client revalidating with ``If-None-Match`` gets an empty 304 without
+    the messages being serialized when nothing changed. Messages are
+    never edited after they are written, so the ids identify the page
+    content.
+
+    Sessions whose messages were moved to cold storage (``apps.chat.archive``)
+    are read through from their archive with the same cursors.
     """
 
     serializer_class = ChatMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = None
+    pagination_class = MessageKeysetPagination
 
     def get_queryset(self):
         """Return messages for the specified session owned by the user."""
         session_id = self.kwargs["session_id"]
-        return (
-            ChatMessage.objects.filter(
-                session_id=session_id,
-                session__user=self.request.user,
-            )
-            .prefetch_related("citations")
-            .order_by("created_at")
+        return ChatMessage.objects.filter(
+            session_id=session_id,
+            session__user=self.request.user,
         )
 
+    def list(self, request, *args, **kwargs):
+        """Return a page of messages, or 304 if the client's copy is current."""
+        archived = load_archived_messages(self.kwargs["session_id"], user=request.user)
+        if archived is not None:
+            page = self.paginator.paginate_records(archived, request)
+            ids = [message["id"] for message in page]
+        else:
+            page = self.paginate_queryset(self.get_queryset())
+            ids = [message.id for message in page]
+
+        etag = _page_etag(ids, self.paginator.has_more)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["Cache-Control"] = "private, no-cache"
+            return not_modified
+
+        if archived is not None:
+            response = self.get_paginated_response(page)
+        else:
+            prefetch_related_objects(page, "citations")
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+def _page_etag(message_ids, has_more):
+    """Return a strong ETag identifying a page of messages."""
+    key = ",".join(str(message_id) for message_id in message_ids)
+    digest = hashlib.sha256(f"{key}|{has_more}".encode()).hexdigest()[:32]
+    return quote_etag(digest)
+
 
 @api_view(["POST"])
 @permission_classes([permissions.IsAuthenticated])
@@ -107,7 +166,16 @@ def chat_stream(request):
     - data: {"type": "done", "message_id": "...", "citations": [...]} on completion
     - data: {"type": "error", "content": "..."} on failure
 
-    Rate limited to 30 messages/hour and 5 messages/minute per user.
+    Every event carries an ``id: <stream_id>:<seq>`` field. Re-sending the
+    same request with a ``Last-Event-ID`` header resumes the stream after
+    that event (attaching to the running generation if it has not
+    finished) without starting a new LLM call. Returns 410 if the stream
+    is no longer buffered.
+
+    Rate limited to 30 messages/hour and 5 messages/minute per user, and
+    subject to the daily token budgets in ``apps.llm.budget``: returns 429
+    with ``reset_at`` and a ``Retry-After`` header once they are exhausted,
+    without saving the message.
 
     Note: This endpoint requires ASGI (uvicorn) to properly handle the async
     streaming generator. Under WSGI, Django runs sync views in a thread pool
@@ -135,6 +203,19 @@ def chat_stream(request):
             status=status.HTTP_404_NOT_FOUND,
         )
 
+    # Resume an interrupted stream instead of generating a new answer
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        parsed = parse_event_id(last_event_id)
+        meta = get_stream_meta(parsed[0]) if parsed else None
+        if meta != {"user_id": request.user.id, "session_id": session.id}:
+            return Response(
+                {"error": "Chat stream is no longer available."},
+                status=status.HTTP_410_GONE,
+            )
+        stream_id, after_seq = parsed
+        return _sse_response(subscribe(stream_id, after_seq=after_seq))
+
     # Apply throttling manually for the function-based view
     throttles = [ChatRateThrottle(), ChatBurstThrottle()]
     for throttle in throttles:
@@ -145,25 +226,56 @@ def chat_stream(request):
                 status=status.HTTP_429_TOO_MANY_REQUESTS,
             )
 
+    from .services import (
+        BUDGET_EXCEEDED_MESSAGE,
+        estimate_turn_tokens,
+        stream_chat_response,
+    )
+
+    # Refuse up front when the daily token budgets are spent, without
+    # saving the message. The stream makes the actual reservation, so that
+    # it is always reconciled.
+    try:
+        check(request.user.id, estimate_turn_tokens(message_text))
+    except BudgetExceededError as e:
+        return Response(
+            {
+                "error": BUDGET_EXCEEDED_MESSAGE,
+                "reset_at": e.reset_at.isoformat(),
+            },
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    # Continuing an archived session needs its history back in ChatMessage
+    if session.is_archived:
+        restore_session(session.id)
+
     era = session.era
+    stream_id = create_stream(request.user.id, session.id)
 
     async def event_stream():
-        """Generate SSE events from the chat service."""
-        from .services import stream_chat_response
-
-        try:
-            async for event in stream_chat_response(session, message_text, era=era):
-                data = json.dumps(event)
-                yield f"data: {data}\n\n"
-        except Exception:
-            logger.exception("Error during chat stream")
-            error_event = json.dumps(
-                {"type": "error", "content": "An unexpected error occurred."}
-            )
-            yield f"data: {error_event}\n\n"
+        """Start generation in the background and follow its events.
+
+        The response only reads the stream buffer, so a client disconnect
+        does not stop generation until the resume grace period expires
+        (see ``apps.chat.streams`` for the trade-off).
+        """
+        start_stream(
+            stream_id,
+            stream_chat_response(session, message_text, era=era, charge_budget=True),
+        )
+        async with aclosing(subscribe(stream_id)) as frames:
+            async for frame in frames:
+                yield frame
+
+    return _sse_response(event_stream())
+
 
+def _sse_response(frames):
+    """Wrap an async iterator of SSE frames in a streaming response."""
     response = StreamingHttpResponse(
-        event_stream(),
+        frames,
         content_type="text/event-stream",
     )
     response["X-Accel-Buffering"] = "no"
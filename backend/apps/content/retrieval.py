@@ -0,0 +1,117 @@
+"""Nearest-neighbour retrieval over content chunk embeddings.
+
+``fetch_candidates`` runs a pgvector query for a ContentChunk queryset
+ordered by distance, widening the candidate window and the HNSW
+``ef_search`` while too few chunks clear the similarity threshold. It is
+shared by chat retrieval (``apps.chat.services``) and quiz grounding
+(``apps.quiz.grounding``).
+
+``get_query_embedding`` embeds text with the same sentence-transformers
+model as the content chunks, for search, chat and short answer grading.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+
+# Lazy-loaded embedding model singleton
+_embedding_model = None
+
+
+def get_query_embedding(text: str):
+    """Generate an embedding vector for a query string.
+
+    Args:
+        text: The query text to embed.
+
+    Returns:
+        A list of floats representing the embedding vector.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+
+        _embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+    return _embedding_model.encode(text).tolist()
+
+
+def fetch_candidates(queryset, fetch_k, top_k, min_score, adaptive=True, stats=None):
+    """Run the nearest-neighbour query, widening the window if starved.
+
+    Args:
+        queryset: ContentChunk queryset annotated with ``distance`` and
+            ordered by it.
+        fetch_k: Initial candidate window size.
+        top_k: Number of chunks above ``min_score`` the caller needs.
+        min_score: Minimum cosine similarity for a candidate to qualify.
+        adaptive: Whether to widen the window when fewer than ``top_k``
+            candidates qualify.
+        stats: Optional dict receiving ``rounds``, ``rows_scanned`` and the
+            final ``ef_search``.
+
+    Returns:
+        The qualifying ContentChunk instances in distance order.
+    """
+    if stats is None:
+        stats = {}
+
+    window = fetch_k
+    ef_search = max(settings.CHAT_HNSW_EF_SEARCH, window)
+    rounds = 0
+    rows_scanned = 0
+    previous_rows = -1
+
+    while True:
+        rounds += 1
+        rows = _scan_candidates(queryset, window, ef_search if adaptive else None)
+        rows_scanned += len(rows)
+        results = [row for row in rows if 1 - row.distance >= min_score]
+
+        if not adaptive or len(results) >= top_k:
+            break
+        # Rows come back in distance order, so once the tail falls below
+        # min_score a wider window cannot add qualifying chunks.
+        if rows and 1 - rows[-1].distance < min_score:
+            break
+        # A short round means there are no more matching rows when the
+        # search was not limited by ef_search: with iterative index scans,
+        # or once a wider search has found nothing new. (Without iterative
+        # scans, filters apply after the index scan, so a single short round
+        # can still be starved by ef_search.)
+        if len(rows) < window and ef_search >= window:
+            if settings.CHAT_HNSW_ITERATIVE_SCAN or len(rows) == previous_rows:
+                break
+        previous_rows = len(rows)
+        if (
+            window >= settings.CHAT_RETRIEVAL_MAX_CANDIDATES
+            and ef_search >= settings.CHAT_HNSW_MAX_EF_SEARCH
+        ):
+            break
+
+        window = min(window * 2, settings.CHAT_RETRIEVAL_MAX_CANDIDATES)
+        ef_search = min(max(ef_search * 2, window), settings.CHAT_HNSW_MAX_EF_SEARCH)
+
+    stats["rounds"] = rounds
+    stats["rows_scanned"] = rows_scanned
+    if adaptive:
+        stats["ef_search"] = ef_search
+    return results
+
+
+def _scan_candidates(queryset, window, ef_search=None):
+    """Evaluate one candidate window, optionally with a per-query ef_search.
+
+    ``SET LOCAL`` only lasts for the enclosing transaction, so the HNSW
+    tuning never leaks to other queries on a pooled connection.
+    """
+    if ef_search is None or connection.vendor != "postgresql":
+        return list(queryset[:window])
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+            if settings.CHAT_HNSW_ITERATIVE_SCAN:
+                cursor.execute(
+                    "SET LOCAL hnsw.iterative_scan = %s",
+                    [settings.CHAT_HNSW_ITERATIVE_SCAN],
+                )
+        return list(queryset[:window])
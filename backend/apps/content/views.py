@@ -8,6 +8,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .models import ContentChunk, ContentItem, Source
+from .retrieval import get_query_embedding
 from .serializers import (
     ContentChunkSerializer,
     ContentItemSerializer,
@@ -98,7 +99,7 @@ def content_search(request):
 
     try:
         # Generate embedding from query text server-side
-        query_embedding = _get_query_embedding(query_text)
+        query_embedding = get_query_embedding(query_text)
 
         # Perform vector similarity search using cosine distance
         chunks = (
@@ -131,17 +132,3 @@ def content_search(request):
             {"error": f"Search failed: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
-
-
-# Lazy-loaded embedding model singleton
-_embedding_model = None
-
-
-def _get_query_embedding(text: str):
-    """Generate embedding for a query using sentence-transformers."""
-    global _embedding_model
-    if _embedding_model is None:
-        from sentence_transformers import SentenceTransformer
-
-        _embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _embedding_model.encode(text).tolist()
@@ -0,0 +1,285 @@
+"""Shared circuit breakers for upstream LLM providers.
+
+One breaker exists per provider/model pair. Its state lives in the Django
+cache (Valkey in deployed environments), so every worker sees the same
+state.
+
+- Closed: calls pass. Outcomes are counted in time buckets, and the
+  breaker trips when, over ``LLM_BREAKER_WINDOW_SECONDS``, at least
+  ``LLM_BREAKER_MIN_CALLS`` calls were made and either the failure rate or
+  the slow-call rate reaches its threshold.
+- Open: calls fail immediately with ``CircuitOpenError`` for
+  ``LLM_BREAKER_OPEN_SECONDS``, instead of each waiting out the client
+  timeout.
+- Half-open: once the open period ends, exactly one caller is let through
+  as a probe. Success closes the breaker. Failure re-opens it for twice as
+  long (capped).
+
+``call`` and ``aguarded`` wrap provider calls with the breaker and retry
+transient failures with jittered exponential backoff.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+import anthropic
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "llm:cb:"
+
+# Width of one outcome-counting bucket, in seconds
+BUCKET_SECONDS = 10
+
+# Longest open period after repeated failed probes, in seconds
+MAX_OPEN_SECONDS = 600
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+CONNECTION_ERRORS = (anthropic.APIConnectionError, openai.APIConnectionError)
+STATUS_ERRORS = (anthropic.APIStatusError, openai.APIStatusError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit for {name} is open (retry in {retry_after:.0f}s)")
+
+
+def is_provider_failure(exc):
+    """Return True if ``exc`` indicates a degraded provider.
+
+    Connection errors and timeouts, 429s and 5xx responses count.
+    Other 4xx responses are caller errors and do not.
+    """
+    if isinstance(exc, CONNECTION_ERRORS):
+        return True
+    if isinstance(exc, STATUS_ERRORS):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def retry_delay(attempt):
+    """Return the jittered backoff before retry number ``attempt`` (0-based)."""
+    ceiling = settings.LLM_RETRY_BASE_DELAY * 2**attempt
+    return random.uniform(0, ceiling)  # noqa: S311
+
+
+class CircuitBreaker:
+    """Cache-backed circuit breaker for one provider/model pair."""
+
+    def __init__(self, provider, model):
+        self.name = f"{provider}:{model}"
+        self._prefix = f"{KEY_PREFIX}{self.name}:"
+
+    def _key(self, name):
+        return self._prefix + name
+
+    def _bucket_keys(self, bucket):
+        return [self._key(f"{bucket}:{kind}") for kind in ("calls", "failures", "slow")]
+
+    def check(self):
+        """Raise if the breaker does not let a call through.
+
+        Returns:
+            True if the caller is the half-open probe, False otherwise.
+
+        Raises:
+            CircuitOpenError: While open, or half-open with a probe in flight.
+        """
+        tripped = cache.get(self._key("tripped"))
+        if tripped is None:
+            return False
+        remaining = tripped["until"] - time.time()
+        if remaining > 0:
+            raise CircuitOpenError(self.name, remaining)
+        if cache.add(self._key("probe"), 1, settings.LLM_BREAKER_OPEN_SECONDS):
+            logger.info("Circuit %s half-open: probing", self.name)
+            return True
+        raise CircuitOpenError(self.name, settings.LLM_BREAKER_OPEN_SECONDS)
+
+    def record_success(self, latency, slow_after=None, probe=False):
+        """Record a successful call that took ``latency`` seconds."""
+        if slow_after is None:
+            slow_after = settings.LLM_BREAKER_SLOW_SECONDS
+        slow = latency >= slow_after
+        self._count(failure=False, slow=slow)
+        if probe:
+            if slow:
+                self._trip(reopen=True)
+            else:
+                cache.delete_many([self._key("tripped"), self._key("probe")])
+                logger.info("Circuit %s closed", self.name)
+        elif slow:
+            self._evaluate()
+
+    def record_failure(self, probe=False):
+        """Record a failed call."""
+        self._count(failure=True, slow=False)
+        if probe:
+            self._trip(reopen=True)
+        else:
+            self._evaluate()
+
+    def _count(self, failure, slow):
+        bucket = int(time.time() // BUCKET_SECONDS)
+        calls, failures, slow_calls = self._bucket_keys(bucket)
+        ttl = settings.LLM_BREAKER_WINDOW_SECONDS + BUCKET_SECONDS
+        for key, flag in ((calls, True), (failures, failure), (slow_calls, slow)):
+            if not flag:
+                continue
+            cache.add(key, 0, ttl)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, ttl)
+
+    def _window(self):
+        """Return ``(calls, failures, slow)`` over the sliding window."""
+        newest = int(time.time() // BUCKET_SECONDS)
+        buckets = range(
+            newest - settings.LLM_BREAKER_WINDOW_SECONDS // BUCKET_SECONDS + 1,
+            newest + 1,
+        )
+        keys = [self._bucket_keys(bucket) for bucket in buckets]
+        values = cache.get_many([key for group in keys for key in group])
+        return tuple(sum(values.get(group[i], 0) for group in keys) for i in range(3))
+
+    def _evaluate(self):
+        if cache.get(self._key("tripped")) is not None:
+            return
+        calls, failures, slow = self._window()
+        if calls < settings.LLM_BREAKER_MIN_CALLS:
+            return
+        if (
+            failures / calls >= settings.LLM_BREAKER_ERROR_RATE
+            or slow / calls >= settings.LLM_BREAKER_SLOW_RATE
+        ):
+            self._trip(reopen=False)
+
+    def _trip(self, reopen):
+        previous = cache.get(self._key("tripped"))
+        duration = settings.LLM_BREAKER_OPEN_SECONDS
+        if reopen and previous is not None:
+            duration = min(previous["duration"] * 2, MAX_OPEN_SECONDS)
+        cache.set(
+            self._key("tripped"),
+            {"until": time.time() + duration, "duration": duration},
+            timeout=None,
+        )
+        cache.delete(self._key("probe"))
+        logger.warning("Circuit %s opened for %ds", self.name, duration)
+
+    def stats(self):
+        """Return the breaker state and its window counters."""
+        tripped = cache.get(self._key("tripped"))
+        if tripped is None:
+            state = CLOSED
+        elif tripped["until"] > time.time():
+            state = OPEN
+        else:
+            state = HALF_OPEN
+        calls, failures, slow = self._window()
+        return {
+            "state": state,
+            "retry_after": max(0, tripped["until"] - time.time()) if tripped else 0,
+            "calls": calls,
+            "failures": failures,
+            "slow": slow,
+        }
+
+
+def get_breaker(provider, model):
+    """Return the breaker for ``provider``/``model``."""
+    return CircuitBreaker(provider, model)
+
+
+def call(breaker, fn, *args, slow_after=None, **kwargs):
+    """Call ``fn`` under ``breaker``, retrying provider failures with jitter.
+
+    Args:
+        breaker: The CircuitBreaker guarding the provider.
+        fn: The provider call, e.g. ``client.chat.completions.create``.
+        slow_after: Latency in seconds above which the call counts as slow.
+
+    Raises:
+        CircuitOpenError: If the breaker is (or becomes) open.
+    """
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        probe = breaker.check()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_provider_failure(e):
+                raise
+            breaker.record_failure(probe=probe)
+            if attempt == settings.LLM_MAX_RETRIES:
+                raise
+            logger.warning("Retrying %s after %s", breaker.name, type(e).__name__)
+            time.sleep(retry_delay(attempt))
+            continue
+        breaker.record_success(
+            time.monotonic() - start, slow_after=slow_after, probe=probe
+        )
+        return result
+
+
+@asynccontextmanager
+async def aguarded(breaker, open_stream, slow_after=None):
+    """Enter the async context manager ``open_stream()`` under ``breaker``.
+
+    Opening the stream (up to the response headers) is retried with
+    jittered backoff and timed against ``slow_after``. Provider failures
+    raised while the stream is consumed are recorded as well.
+
+    Args:
+        breaker: The CircuitBreaker guarding the provider.
+        open_stream: Zero-argument callable returning a fresh async
+            context manager, e.g. ``lambda: client.messages.stream(...)``.
+        slow_after: Latency in seconds above which opening counts as slow.
+
+    Raises:
+        CircuitOpenError: If the breaker is (or becomes) open.
+    """
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        probe = await sync_to_async(breaker.check)()
+        manager = open_stream()
+        start = time.monotonic()
+        try:
+            stream = await manager.__aenter__()
+        except Exception as e:
+            if not is_provider_failure(e):
+                raise
+            await sync_to_async(breaker.record_failure)(probe=probe)
+            if attempt == settings.LLM_MAX_RETRIES:
+                raise
+            logger.warning("Retrying %s after %s", breaker.name, type(e).__name__)
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+        await sync_to_async(breaker.record_success)(
+            time.monotonic() - start, slow_after=slow_after, probe=probe
+        )
+        break
+
+    try:
+        yield stream
+    except BaseException as e:
+        if isinstance(e, Exception) and is_provider_failure(e):
+            await sync_to_async(breaker.record_failure)()
+        if not await manager.__aexit__(type(e), e, e.__traceback__):
+            raise
+    else:
+        await manager.__aexit__(None, None, None)
@@ -0,0 +1,187 @@
+"""Daily LLM token budgets per user and for the whole deployment.
+
+Usage is tracked in per-UTC-day counters in the Django cache (Valkey in
+deployed environments), so every worker enforces the same budget. Before a
+call, the caller reserves an estimate of the tokens it may use. The
+reservation is refused with ``BudgetExceededError`` if it does not fit in
+the user's ``LLM_USER_DAILY_TOKENS`` or the deployment's
+``LLM_GLOBAL_DAILY_TOKENS`` (0 disables a limit). After the call, the
+reservation is reconciled with the usage reported by the provider.
+
+Usage::
+
+    reservation = reserve(user.id, estimate)
+    try:
+        response = client.chat.completions.create(...)
+    except Exception:
+        reconcile(reservation, 0)
+        raise
+    reconcile(reservation, response.usage.total_tokens)
+"""
+
+import logging
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "llm:budget:"
+
+# Counters outlive their day so late reconciliations still find them
+COUNTER_TTL = 2 * 24 * 60 * 60
+
+USER = "user"
+GLOBAL = "global"
+
+# Rough characters-per-token ratio for English text, used to estimate
+# prompts before a call and output the provider has not reported
+CHARS_PER_TOKEN = 4
+
+
+class BudgetExceededError(Exception):
+    """Raised when a reservation does not fit in a daily token budget."""
+
+    def __init__(self, scope, limit, reset_at):
+        self.scope = scope
+        self.limit = limit
+        self.reset_at = reset_at
+        super().__init__(f"Daily {scope} token budget of {limit} exhausted")
+
+    @property
+    def retry_after(self):
+        """Seconds until the budget resets."""
+        return max(1, int((self.reset_at - datetime.now(UTC)).total_seconds()))
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in ``text`` without a tokenizer."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _day(now=None):
+    return (now or datetime.now(UTC)).strftime("%Y%m%d")
+
+
+def get_reset_time(now=None):
+    """Return when the current daily budgets reset (next UTC midnight)."""
+    now = now or datetime.now(UTC)
+    return datetime(now.year, now.month, now.day, tzinfo=UTC) + timedelta(days=1)
+
+
+def _user_key(user_id, day):
+    return f"{KEY_PREFIX}{USER}:{user_id}:{day}"
+
+
+def _global_key(day):
+    return f"{KEY_PREFIX}{GLOBAL}:{day}"
+
+
+def _add(key, amount):
+    """Atomically add ``amount`` (may be negative) and return the new total."""
+    cache.add(key, 0, COUNTER_TTL)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, COUNTER_TTL)
+        return amount
+
+
+def _limits(user_id, day):
+    """Return the (counter key, limit, scope) budgets a call is charged to."""
+    limits = []
+    if user_id is not None:
+        limits.append((_user_key(user_id, day), settings.LLM_USER_DAILY_TOKENS, USER))
+    limits.append((_global_key(day), settings.LLM_GLOBAL_DAILY_TOKENS, GLOBAL))
+    return limits
+
+
+def reserve(user_id, tokens):
+    """Reserve ``tokens`` for ``user_id`` ahead of an LLM call.
+
+    Args:
+        user_id: The user the call is made for, or None for background
+            work that only counts against the global budget.
+        tokens: Upper estimate of prompt plus completion tokens.
+
+    Returns:
+        A reservation dict to pass to ``reconcile``.
+
+    Raises:
+        BudgetExceededError: If the reservation would exceed the user's or
+            the global daily budget. Nothing is reserved in that case.
+    """
+    day = _day()
+    checks = _limits(user_id, day)
+    applied = []
+    for key, limit, scope in checks:
+        total = _add(key, tokens)
+        applied.append(key)
+        if limit and total > limit:
+            for key in applied:
+                _add(key, -tokens)
+            logger.info(
+                "Token budget exceeded: scope=%s user=%s requested=%d",
+                scope,
+                user_id,
+                tokens,
+            )
+            raise BudgetExceededError(scope, limit, get_reset_time())
+    return {"user_id": user_id, "day": day, "tokens": tokens}
+
+
+def check(user_id, tokens):
+    """Raise if reserving ``tokens`` for ``user_id`` would be refused now.
+
+    Nothing is reserved, so a later ``reserve`` can still be refused. Lets a
+    caller reject a request up front when the reservation itself has to be
+    made where it is guaranteed to be reconciled.
+
+    Raises:
+        BudgetExceededError: As ``reserve`` would.
+    """
+    day = _day()
+    checks = _limits(user_id, day)
+    for key, limit, scope in checks:
+        if limit and cache.get(key, 0) + tokens > limit:
+            raise BudgetExceededError(scope, limit, get_reset_time())
+
+
+def reconcile(reservation, actual_tokens):
+    """Replace a reservation's estimate with the tokens actually used.
+
+    Args:
+        reservation: Dict returned by ``reserve``.
+        actual_tokens: Prompt plus completion tokens reported by the
+            provider (0 if the call failed before using any).
+    """
+    delta = actual_tokens - reservation["tokens"]
+    if delta:
+        day = reservation["day"]
+        if reservation["user_id"] is not None:
+            _add(_user_key(reservation["user_id"], day), delta)
+        _add(_global_key(day), delta)
+    reservation["tokens"] = actual_tokens
+
+
+def get_user_usage(user_id):
+    """Return today's token usage and limit for ``user_id``."""
+    used = cache.get(_user_key(user_id, _day()), 0)
+    return _usage(used, settings.LLM_USER_DAILY_TOKENS)
+
+
+def get_global_usage():
+    """Return today's token usage and limit for the deployment."""
+    used = cache.get(_global_key(_day()), 0)
+    return _usage(used, settings.LLM_GLOBAL_DAILY_TOKENS)
+
+
+def _usage(used, limit):
+    return {
+        "used": used,
+        "limit": limit,
+        "remaining": max(0, limit - used) if limit else None,
+        "reset_at": get_reset_time().isoformat(),
+    }
@@ -0,0 +1,29 @@
+"""API exceptions for requests that cannot be served by an LLM provider."""
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ProviderUnavailableError(APIException):
+    """503 returned while a provider's circuit breaker is open."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "The AI service is temporarily unavailable. Please try again shortly."
+    )
+    default_code = "provider_unavailable"
+
+
+class UsageLimitExceededError(APIException):
+    """429 returned once a daily token budget is exhausted."""
+
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = "Daily AI usage limit reached. Try again after the reset."
+    default_code = "token_budget_exceeded"
+
+    def __init__(self, reset_at, retry_after):
+        # DRF sends ``wait`` as the Retry-After header
+        self.wait = retry_after
+        super().__init__(
+            {"detail": self.default_detail, "reset_at": reset_at.isoformat()}
+        )
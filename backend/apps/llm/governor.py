@@ -0,0 +1,307 @@
+"""Fleet-wide concurrency governor for LLM provider calls.
+
+Every Anthropic/OpenAI call acquires a slot from a distributed semaphore
+shared by all workers through the Django cache (Valkey in deployed
+environments). Slots are leases (``cache.add`` with a timeout), so a
+worker that dies while holding one only leaks it for
+``LLM_GOVERNOR_LEASE_SECONDS``.
+
+Callers belong to a priority class. A class may only acquire a slot while
+total usage is below its share of the provider limit, so lower classes
+always leave headroom for higher ones, and a class does not take a slot
+while a higher class is queued. Waiters poll with jittered backoff until
+their deadline and then fail with ``GovernorTimeoutError``.
+
+A queued caller is marked by a waiting key that expires after
+``WAITING_TTL`` seconds unless the caller refreshes it on its next poll,
+so a worker that dies while queued stops holding back lower classes
+almost immediately. Each class has as many waiting keys as the provider
+has slots; a caller that finds them all taken polls without one.
+
+Usage::
+
+    with governed("openai", GENERATION):
+        client.chat.completions.create(...)
+
+    async with agoverned("anthropic", INTERACTIVE):
+        async with client.messages.stream(...) as stream:
+            ...
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "llm:gov:"
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+GRADING = "grading"
+GENERATION = "generation"
+BATCH = "batch"
+
+PRIORITIES = [INTERACTIVE, GRADING, GENERATION, BATCH]
+
+# Fraction of a provider's slots each class may fill
+PRIORITY_SHARES = {
+    INTERACTIVE: 1.0,
+    GRADING: 0.75,
+    GENERATION: 0.5,
+    BATCH: 0.25,
+}
+
+# Seconds a caller of each class waits in the queue before giving up
+DEFAULT_DEADLINES = {
+    INTERACTIVE: 10,
+    GRADING: 15,
+    GENERATION: 60,
+    BATCH: 600,
+}
+
+# Backoff between acquire attempts, in seconds
+POLL_INITIAL = 0.05
+POLL_MAX = 1.0
+
+# Seconds a waiting marker outlives the last poll of its waiter (must be
+# longer than POLL_MAX, the longest gap between polls)
+WAITING_TTL = 5
+
+# Deletes KEYS[1] only while it still holds ARGV[1], in one step
+COMPARE_AND_DELETE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class GovernorTimeoutError(Exception):
+    """Raised when no slot could be acquired before the deadline."""
+
+    def __init__(self, provider, priority, waited):
+        self.provider = provider
+        self.priority = priority
+        self.waited = waited
+        super().__init__(
+            f"No {provider} capacity for {priority} request after {waited:.1f}s"
+        )
+
+
+def _slot_key(provider, index):
+    return f"{KEY_PREFIX}{provider}:slot:{index}"
+
+
+def _waiting_key(provider, priority, index):
+    return f"{KEY_PREFIX}{provider}:waiting:{priority}:{index}"
+
+
+def _waiting_keys(provider, priority):
+    return [_waiting_key(provider, priority, i) for i in range(get_limit(provider))]
+
+
+def get_limit(provider):
+    """Return the concurrent call limit configured for ``provider``."""
+    return settings.LLM_CONCURRENCY_LIMITS.get(provider, 1)
+
+
+def get_class_capacity(provider, priority):
+    """Return how many slots ``priority`` may fill for ``provider``."""
+    return max(1, int(get_limit(provider) * PRIORITY_SHARES[priority]))
+
+
+def try_acquire(provider, priority):
+    """Try once to acquire a slot without waiting.
+
+    Returns:
+        A ``(slot_key, token)`` lease, or None if no slot is available to
+        this priority class right now.
+    """
+    limit = get_limit(provider)
+    slot_keys = [_slot_key(provider, i) for i in range(limit)]
+    higher = PRIORITIES[: PRIORITIES.index(priority)]
+    waiting_keys = [key for p in higher for key in _waiting_keys(provider, p)]
+
+    state = cache.get_many(slot_keys + waiting_keys)
+    if any(key in state for key in waiting_keys):
+        return None
+
+    in_flight = sum(1 for key in slot_keys if key in state)
+    if in_flight >= get_class_capacity(provider, priority):
+        return None
+
+    token = uuid.uuid4().hex
+    free = [key for key in slot_keys if key not in state]
+    random.shuffle(free)  # noqa: S311
+    for key in free:
+        if cache.add(key, token, settings.LLM_GOVERNOR_LEASE_SECONDS):
+            return key, token
+    return None
+
+
+def release(lease):
+    """Release a lease returned by ``try_acquire``.
+
+    The key is deleted only if it still holds the lease's token, so a lease
+    that expired and was taken by another caller is left alone. On Valkey
+    the check and the delete are one atomic script.
+    """
+    key, token = lease
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        backend._cache.get_client(key, write=True).eval(
+            COMPARE_AND_DELETE,
+            1,
+            backend.make_and_validate_key(key),
+            backend._cache._serializer.dumps(token),
+        )
+    elif cache.get(key) == token:
+        # Other backends only serve single-process development and tests
+        cache.delete(key)
+
+
+def _mark_waiting(provider, priority, marker):
+    """Claim or refresh a waiting marker for a queued caller.
+
+    Args:
+        marker: The ``(key, token)`` returned by the previous call, or
+            None if the caller holds no marker yet.
+
+    Returns:
+        The held ``(key, token)`` marker, or None if every waiting key of
+        the class is taken by other callers.
+    """
+    if marker is not None and cache.touch(marker[0], WAITING_TTL):
+        return marker
+    token = uuid.uuid4().hex
+    for key in _waiting_keys(provider, priority):
+        if cache.add(key, token, WAITING_TTL):
+            return key, token
+    return None
+
+
+def _clear_waiting(marker):
+    if marker is not None:
+        release(marker)
+
+
+def _backoff(attempt):
+    jitter = random.uniform(0.5, 1.0)  # noqa: S311
+    return min(POLL_MAX, POLL_INITIAL * 2**attempt) * jitter
+
+
+def _log_wait(provider, priority, waited):
+    logger.info(
+        "LLM governor: %s %s request waited %.0f ms for a slot",
+        provider,
+        priority,
+        waited * 1000,
+    )
+
+
+@contextmanager
+def governed(provider, priority, deadline=None):
+    """Hold a ``provider`` slot for the duration of the block.
+
+    Args:
+        provider: Provider name, e.g. "anthropic" or "openai".
+        priority: One of the priority class constants.
+        deadline: Seconds to wait for a slot (defaults per class).
+
+    Raises:
+        GovernorTimeoutError: If no slot became available before the deadline.
+    """
+    lease = try_acquire(provider, priority)
+    if lease is None:
+        lease = _wait_for_slot(provider, priority, deadline)
+    try:
+        yield
+    finally:
+        release(lease)
+
+
+def _wait_for_slot(provider, priority, deadline):
+    if deadline is None:
+        deadline = DEFAULT_DEADLINES[priority]
+    start = time.monotonic()
+    marker = _mark_waiting(provider, priority, None)
+    try:
+        attempt = 0
+        while True:
+            waited = time.monotonic() - start
+            if waited >= deadline:
+                raise GovernorTimeoutError(provider, priority, waited)
+            time.sleep(min(_backoff(attempt), deadline - waited))
+            attempt += 1
+            lease = try_acquire(provider, priority)
+            if lease is not None:
+                _log_wait(provider, priority, time.monotonic() - start)
+                return lease
+            marker = _mark_waiting(provider, priority, marker)
+    finally:
+        _clear_waiting(marker)
+
+
+@asynccontextmanager
+async def agoverned(provider, priority, deadline=None):
+    """Async version of ``governed`` for use in async views and generators."""
+    lease = await sync_to_async(try_acquire)(provider, priority)
+    if lease is None:
+        lease = await _await_slot(provider, priority, deadline)
+    try:
+        yield
+    finally:
+        await sync_to_async(release)(lease)
+
+
+async def _await_slot(provider, priority, deadline):
+    if deadline is None:
+        deadline = DEFAULT_DEADLINES[priority]
+    start = time.monotonic()
+    marker = await sync_to_async(_mark_waiting)(provider, priority, None)
+    try:
+        attempt = 0
+        while True:
+            waited = time.monotonic() - start
+            if waited >= deadline:
+                raise GovernorTimeoutError(provider, priority, waited)
+            await asyncio.sleep(min(_backoff(attempt), deadline - waited))
+            attempt += 1
+            lease = await sync_to_async(try_acquire)(provider, priority)
+            if lease is not None:
+                _log_wait(provider, priority, time.monotonic() - start)
+                return lease
+            marker = await sync_to_async(_mark_waiting)(provider, priority, marker)
+    finally:
+        await sync_to_async(_clear_waiting)(marker)
+
+
+def get_governor_stats(provider):
+    """Return in-flight and queue-depth metrics for ``provider``.
+
+    Queue depth is counted from waiting markers, so it is at most the limit.
+    """
+    limit = get_limit(provider)
+    slot_keys = [_slot_key(provider, i) for i in range(limit)]
+    waiting_keys = {p: _waiting_keys(provider, p) for p in PRIORITIES}
+    state = cache.get_many(
+        slot_keys + [key for keys in waiting_keys.values() for key in keys]
+    )
+    return {
+        "limit": limit,
+        "in_flight": sum(1 for key in slot_keys if key in state),
+        "waiting": {
+            p: sum(1 for key in keys if key in state)
+            for p, keys in waiting_keys.items()
+        },
+        "capacity": {p: get_class_capacity(provider, p) for p in PRIORITIES},
+    }
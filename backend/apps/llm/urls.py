@@ -0,0 +1,11 @@
+"""URL configuration for the llm app."""
+
+from django.urls import path
+
+from . import views
+
+app_name = "llm"
+
+urlpatterns = [
+    path("status/", views.llm_status, name="status"),
+]
@@ -0,0 +1,50 @@
+"""API views for the llm app."""
+
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .breaker import get_breaker
+from .budget import get_global_usage
+from .governor import get_governor_stats
+
+
+def configured_models():
+    """Return the models in use, keyed by provider."""
+    return {
+        "anthropic": sorted(
+            {tier["model"] for tier in settings.CHAT_MODEL_TIERS.values()}
+        ),
+        "openai": [settings.OPENAI_MODEL],
+    }
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def llm_status(request):
+    """Report LLM provider capacity for operators.
+
+    GET /api/llm/status/
+
+    Returns, per provider, the concurrency limit, in-flight calls, queue
+    depth per priority class and each class's slot capacity, plus the
+    circuit breaker state of each configured model. Also returns today's
+    global token usage against the daily budget. Staff only.
+    """
+    models = configured_models()
+    return Response(
+        {
+            "providers": {
+                provider: {
+                    "governor": get_governor_stats(provider),
+                    "breakers": {
+                        model: get_breaker(provider, model).stats()
+                        for model in models.get(provider, [])
+                    },
+                }
+                for provider in settings.LLM_CONCURRENCY_LIMITS
+            },
+            "budget": get_global_usage(),
+        }
+    )
@@ -2,7 +2,7 @@
 
 from django.contrib import admin
 
-from .models import Quiz, QuizQuestion
+from .models import BankQuestion, Quiz, QuizQuestion, ReviewItem
 
 
 class QuizQuestionInline(admin.TabularInline):
@@ -90,3 +90,51 @@ class QuizQuestionAdmin(admin.ModelAdmin):
     readonly_fields = [
         "created_at",
     ]
+
+
+@admin.register(BankQuestion)
+class BankQuestionAdmin(admin.ModelAdmin):
+    """Admin for the quiz question bank."""
+
+    list_display = [
+        "id",
+        "era",
+        "difficulty",
+        "question_type",
+        "created_at",
+    ]
+    list_filter = [
+        "difficulty",
+        "question_type",
+        "era",
+    ]
+    search_fields = [
+        "question_text",
+    ]
+    readonly_fields = [
+        "fingerprint",
+        "created_at",
+    ]
+
+
+@admin.register(ReviewItem)
+class ReviewItemAdmin(admin.ModelAdmin):
+    """Admin for users' spaced repetition review schedules."""
+
+    list_display = [
+        "id",
+        "user",
+        "question_text",
+        "repetitions",
+        "interval_days",
+        "due_at",
+    ]
+    search_fields = [
+        "user__email",
+        "question_text",
+    ]
+    raw_id_fields = ["user", "bank_question", "era", "source"]
+    readonly_fields = [
+        "fingerprint",
+        "updated_at",
+    ]
@@ -5,3 +5,7 @@ class QuizConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.quiz"
     verbose_name = "Quiz"
+
+    def ready(self):
+        """Import signal handlers when app is ready."""
+        import apps.quiz.signals  # noqa: F401
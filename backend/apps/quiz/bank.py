@@ -0,0 +1,235 @@
+"""Question bank for quiz creation.
+
+Generating every quiz with a fresh OpenAI call is slow and makes LLM spend
+grow with the number of quizzes, although the generation prompt only
+depends on the era and difficulty. Instead, validated and deduplicated
+questions are kept in ``BankQuestion`` per (era, difficulty, type):
+
+- ``fill_quiz_from_bank`` builds a quiz by sampling questions the user
+  has not been given before, which takes a few queries and no LLM call.
+- ``add_to_bank`` stores questions generated by OpenAI, both for quizzes
+  the bank could not fill and for background top-ups.
+- ``top_up_bank`` asks OpenAI for the questions a pool is missing, up to
+  ``QUIZ_BANK_TARGET_PER_TYPE`` per type, so spend is bounded by the
+  size of the bank rather than by traffic.
+"""
+
+import hashlib
+import logging
+import random
+import re
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import BankQuestion, Quiz, QuizQuestion
+
+logger = logging.getLogger(__name__)
+
+QuestionType = QuizQuestion.QuestionType
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def question_mix(question_count):
+    """Return the number of questions of each type in a quiz."""
+    return {
+        QuestionType.MULTIPLE_CHOICE: question_count - 2,
+        QuestionType.TRUE_FALSE: 1,
+        QuestionType.SHORT_ANSWER: 1,
+    }
+
+
+def fingerprint(question_text):
+    """Return a hash of the question text that ignores case and punctuation."""
+    normalized = _NON_WORD.sub(" ", question_text.lower()).strip()
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def validate_question(data):
+    """Check a generated question and return its cleaned fields.
+
+    Args:
+        data: A question dict as produced by the generation prompt.
+
+    Returns:
+        A dict of BankQuestion fields, or None if the question is
+        malformed (missing text, wrong option count, out of range answer).
+    """
+    try:
+        question_type = data["question_type"]
+        text = data["question_text"].strip()
+        explanation = data["explanation"].strip()
+        correct = str(data["correct_answer"]).strip()
+        options = data.get("options") or []
+        source_id = data.get("source_id")
+    except (KeyError, AttributeError, TypeError):
+        return None
+    if not text or not explanation or not correct:
+        return None
+
+    if question_type == QuestionType.MULTIPLE_CHOICE:
+        if len(options) != 4 or correct not in {"0", "1", "2", "3"}:
+            return None
+        if not all(isinstance(o, str) and o.strip() for o in options):
+            return None
+    elif question_type == QuestionType.TRUE_FALSE:
+        options = ["True", "False"]
+        if correct not in {"0", "1"}:
+            return None
+    elif question_type == QuestionType.SHORT_ANSWER:
+        options = []
+    else:
+        return None
+
+    return {
+        "question_type": question_type,
+        "question_text": text,
+        "options": options,
+        "correct_answer": correct,
+        "explanation": explanation,
+        "source_id": source_id if isinstance(source_id, int) else None,
+        "fingerprint": fingerprint(text),
+    }
+
+
+def add_to_bank(era, difficulty, questions_data):
+    """Store the valid, new questions among ``questions_data``.
+
+    Args:
+        era: The Era the questions are about, or None for all eras.
+        difficulty: Quiz difficulty the questions were generated for.
+        questions_data: Question dicts as produced by the generation prompt.
+
+    Returns:
+        A dict mapping the fingerprint of every valid question to its
+        BankQuestion (new or already in the bank).
+    """
+    cleaned = [q for q in map(validate_question, questions_data) if q is not None]
+    if len(cleaned) < len(questions_data):
+        logger.warning(
+            "Rejected %d malformed generated question(s)",
+            len(questions_data) - len(cleaned),
+        )
+    if not cleaned:
+        return {}
+
+    BankQuestion.objects.bulk_create(
+        [BankQuestion(era=era, difficulty=difficulty, **q) for q in cleaned],
+        ignore_conflicts=True,
+    )
+    return {
+        q.fingerprint: q
+        for q in BankQuestion.objects.filter(
+            era=era,
+            difficulty=difficulty,
+            fingerprint__in=[q["fingerprint"] for q in cleaned],
+        )
+    }
+
+
+def fill_quiz_from_bank(quiz):
+    """Create a quiz's questions from the bank, if it has enough of them.
+
+    Only questions the user has not been given in an earlier quiz are
+    drawn. On success the quiz is marked ready.
+
+    Args:
+        quiz: A saved Quiz without questions.
+
+    Returns:
+        True if the quiz was filled, False if the bank is disabled or does
+        not hold enough unseen questions of every type.
+    """
+    if not settings.QUIZ_BANK_ENABLED:
+        return False
+
+    seen = QuizQuestion.objects.filter(
+        quiz__user_id=quiz.user_id, bank_question__isnull=False
+    ).values("bank_question")
+    picked = []
+    for question_type, count in question_mix(quiz.total_questions).items():
+        candidates = list(
+            BankQuestion.objects.filter(
+                era=quiz.era, difficulty=quiz.difficulty, question_type=question_type
+            )
+            .exclude(id__in=seen)
+            .values_list("id", flat=True)
+        )
+        if len(candidates) < count:
+            return False
+        picked.extend(random.sample(candidates, count))
+
+    bank = BankQuestion.objects.in_bulk(picked)
+    QuizQuestion.objects.bulk_create(
+        [
+            QuizQuestion(
+                quiz=quiz,
+                bank_question=bank[bank_id],
+                question_text=bank[bank_id].question_text,
+                question_type=bank[bank_id].question_type,
+                options=bank[bank_id].options,
+                correct_answer=bank[bank_id].correct_answer,
+                explanation=bank[bank_id].explanation,
+                source_id=bank[bank_id].source_id,
+                order=i + 1,
+            )
+            for i, bank_id in enumerate(picked)
+        ]
+    )
+    quiz.status = Quiz.Status.READY
+    quiz.save(update_fields=["status"])
+    return True
+
+
+def missing_questions(era_id, difficulty):
+    """Return how many questions of each type a pool needs to reach its target.
+
+    Returns:
+        A dict mapping question type to the number missing (only types
+        below ``QUIZ_BANK_TARGET_PER_TYPE``, at most
+        ``QUIZ_BANK_BATCH_PER_TYPE`` each).
+    """
+    counts = dict(
+        BankQuestion.objects.filter(era_id=era_id, difficulty=difficulty)
+        .values("question_type")
+        .annotate(n=Count("id"))
+        .values_list("question_type", "n")
+    )
+    missing = {}
+    for question_type in QuestionType.values:
+        short = settings.QUIZ_BANK_TARGET_PER_TYPE - counts.get(question_type, 0)
+        if short > 0:
+            missing[question_type] = min(short, settings.QUIZ_BANK_BATCH_PER_TYPE)
+    return missing
+
+
+def top_up_bank(era, difficulty):
+    """Generate one batch of the questions a pool is missing.
+
+    The call is charged to the global token budget only.
+
+    Args:
+        era: The Era of the pool, or None for the "All Eras" pool.
+        difficulty: Difficulty of the pool.
+
+    Returns:
+        The number of questions added to the bank.
+    """
+    from .services import request_questions
+
+    missing = missing_questions(era.id if era else None, difficulty)
+    if not missing:
+        return 0
+
+    before = BankQuestion.objects.filter(era=era, difficulty=difficulty).count()
+    questions_data, _usage = request_questions(era, difficulty, missing)
+    add_to_bank(era, difficulty, questions_data)
+    added = BankQuestion.objects.filter(era=era, difficulty=difficulty).count() - before
+    logger.info(
+        "Question bank top-up: era=%s difficulty=%s added=%d",
+        era.id if era else None,
+        difficulty,
+        added,
+    )
+    return added
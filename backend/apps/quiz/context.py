@@ -0,0 +1,81 @@
+"""Cached era context for quiz generation prompts.
+
+The era context (description, key events and key figures) only changes
+when eras are edited, but building it costs several queries per quiz, and
+for "All Eras" quizzes it walks every era. ``get_era_context`` caches the
+text per era and for all eras under a version stamp. Saving or deleting
+an Era, KeyEvent or KeyFigure replaces the stamp (see ``signals``), so
+stale entries are never read again and simply expire.
+
+Since the text is identical between edits, it is also placed at the start
+of the generation prompt, where the provider can reuse it as a cached
+prompt prefix.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.eras.models import Era
+
+VERSION_KEY = "quiz:era-context:version"
+
+
+def context_version():
+    """Return the current era context version stamp."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_context_version():
+    """Invalidate every cached era context."""
+    # A timestamp rather than a counter: a stamp lost to eviction can never
+    # be handed out again and revive entries cached under it
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_era_context(era):
+    """Return the prompt context for an era, or for all eras if None."""
+    key = f"quiz:era-context:{context_version()}:{era.id if era else 'all'}"
+    context = cache.get(key)
+    if context is None:
+        context = build_era_context(era)
+        cache.set(key, context, settings.QUIZ_ERA_CONTEXT_CACHE_SECONDS)
+    return context
+
+
+def build_era_context(era):
+    """Build the prompt context for an era, or for all eras if None."""
+    if era is None:
+        eras = Era.objects.all().prefetch_related("key_events", "key_figures")
+        return "\n\n".join(_format_era(era) for era in eras)
+    return _format_era(era)
+
+
+def _format_era(era):
+    context_parts = [
+        f"Era: {era.name} ({era.start_year}-{era.end_year or 'present'})",
+        f"Description: {era.description}",
+        "",
+        "Key Events:",
+    ]
+
+    for event in era.key_events.all()[:10]:  # Limit to 10 events
+        context_parts.append(f"- {event.year}: {event.title}")
+        if event.description:
+            context_parts.append(f"  {event.description[:200]}")
+
+    context_parts.extend(["", "Key Figures:"])
+    for figure in era.key_figures.all()[:10]:  # Limit to 10 figures
+        years = ""
+        if figure.birth_year and figure.death_year:
+            years = f" ({figure.birth_year}-{figure.death_year})"
+        context_parts.append(f"- {figure.name}{years}: {figure.title}")
+        if figure.description:
+            context_parts.append(f"  {figure.description[:200]}")
+
+    return "\n".join(context_parts)
@@ -0,0 +1,227 @@
+"""Short answer grading pipeline.
+
+Grading every short answer with GPT-4o blocks the submission on an LLM
+round trip, although many answers are either repeats or clearly right or
+wrong. ``grade_answer`` tries the cheap checks first:
+
+1. A cache of earlier grades, keyed by the question and the normalized
+   answer, shared by every quiz that contains the same question.
+2. A local pre-grader comparing the embedding of the answer with the
+   embedding of the reference answer. Answers above
+   ``QUIZ_GRADE_ACCEPT_SIMILARITY`` are accepted and answers below
+   ``QUIZ_GRADE_REJECT_SIMILARITY`` rejected without an LLM call.
+3. The LLM grader (``services.grade_short_answer``) for the ambiguous
+   rest, with its token usage added to the quiz's grading counters. When
+   a quiz's answers are graded as a batch (``grade_quiz_answers``), all
+   ambiguous answers share one combined request
+   (``services.grade_short_answers``).
+
+Fallback grades (budget exhausted, OpenAI unavailable) are not cached, so
+the answer is graded properly next time.
+"""
+
+import hashlib
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from apps.content.retrieval import get_query_embedding
+
+from .bank import fingerprint
+from .models import Quiz, QuizQuestion
+from .services import grade_short_answer, grade_short_answers
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED_FEEDBACK = (
+    "Correct! Your answer covers the key points of the reference answer."
+)
+REJECTED_FEEDBACK = (
+    "Your answer doesn't match the reference answer. Review the explanation "
+    "for the key points."
+)
+
+
+def grade_answer(question, answer, user_id=None):
+    """Grade a short answer, calling the LLM only when needed.
+
+    Args:
+        question: The short answer QuizQuestion.
+        answer: The user's submitted answer.
+        user_id: User any LLM call is charged to.
+
+    Returns:
+        Tuple of (is_correct, feedback).
+    """
+    return grade_answers([(question, answer)], user_id=user_id)[0]
+
+
+def grade_answers(submissions, user_id=None):
+    """Grade several short answers with at most one LLM call.
+
+    Answers that are neither cached nor confidently pre-graded are sent to
+    the LLM together, and its token usage is added to the quiz of the
+    first of them.
+
+    Args:
+        submissions: (QuizQuestion, answer) pairs.
+        user_id: User any LLM call is charged to.
+
+    Returns:
+        A list of (is_correct, feedback) tuples, one per submission.
+    """
+    keys = [grade_cache_key(question, answer) for question, answer in submissions]
+    grades = [None] * len(submissions)
+    new_grades = {}
+    ambiguous = []
+
+    cached = cache.get_many(keys)
+    for i, (question, answer) in enumerate(submissions):
+        grades[i] = cached.get(keys[i])
+        if grades[i] is None:
+            grades[i] = pre_grade(question.correct_answer, answer)
+            if grades[i] is None:
+                ambiguous.append(i)
+            else:
+                new_grades[keys[i]] = grades[i]
+
+    if ambiguous:
+        llm_grades, usage = _grade_with_llm(
+            [submissions[i] for i in ambiguous], user_id
+        )
+        for i, grade in zip(ambiguous, llm_grades, strict=True):
+            grades[i] = grade
+            if usage is not None:
+                new_grades[keys[i]] = grade
+        if usage is not None:
+            Quiz.objects.filter(pk=submissions[ambiguous[0]][0].quiz_id).update(
+                grading_input_tokens=F("grading_input_tokens") + usage.prompt_tokens,
+                grading_output_tokens=F("grading_output_tokens")
+                + usage.completion_tokens,
+            )
+
+    # Fallback grades (usage None) are left out so they are retried
+    cache.set_many(new_grades, settings.QUIZ_GRADE_CACHE_SECONDS)
+    return grades
+
+
+def _grade_with_llm(submissions, user_id):
+    """Return (grades, usage) from the single or the combined LLM grader."""
+    if len(submissions) == 1:
+        question, answer = submissions[0]
+        is_correct, feedback, usage = grade_short_answer(
+            question.question_text, question.correct_answer, answer, user_id=user_id
+        )
+        return [(is_correct, feedback)], usage
+    return grade_short_answers(
+        [
+            (question.question_text, question.correct_answer, answer)
+            for question, answer in submissions
+        ],
+        user_id=user_id,
+    )
+
+
+def grade_quiz_answers(quiz, answers, user_id=None):
+    """Record and grade a batch of answers to a quiz's questions.
+
+    Multiple choice and true/false answers are compared with the stored
+    answer, short answers go through ``grade_answers`` together, and all
+    questions are saved with one ``bulk_update``.
+
+    Args:
+        quiz: The Quiz being answered.
+        answers: Dicts with ``question_id`` and ``answer``.
+        user_id: User any LLM call is charged to.
+
+    Returns:
+        The graded QuizQuestions, in the order of ``answers``.
+
+    Raises:
+        QuizQuestion.DoesNotExist: If a question is not part of the quiz.
+    """
+    questions = quiz.questions.in_bulk([a["question_id"] for a in answers])
+    graded = []
+    for a in answers:
+        question = questions.get(a["question_id"])
+        if question is None:
+            raise QuizQuestion.DoesNotExist(
+                f"Question {a['question_id']} is not part of quiz {quiz.id}"
+            )
+        question.user_answer = a["answer"]
+        if question.question_type != QuizQuestion.QuestionType.SHORT_ANSWER:
+            question.is_correct = question.user_answer == question.correct_answer
+        graded.append(question)
+
+    short = [
+        question
+        for question in graded
+        if question.question_type == QuizQuestion.QuestionType.SHORT_ANSWER
+    ]
+    if short:
+        grades = grade_answers(
+            [(question, question.user_answer) for question in short],
+            user_id=user_id,
+        )
+        for question, (is_correct, feedback) in zip(short, grades, strict=True):
+            question.is_correct = is_correct
+            question.feedback = feedback
+
+    QuizQuestion.objects.bulk_update(graded, ["user_answer", "is_correct", "feedback"])
+    return graded
+
+
+def grade_cache_key(question, answer):
+    """Return the cache key of a grade.
+
+    The key covers the question and reference answer texts rather than the
+    question id, so grades are shared by every quiz built from the same
+    (bank) question. Answers differing only in case, whitespace or
+    punctuation share a grade.
+    """
+    digest = hashlib.sha256(
+        "\0".join(
+            [question.question_text, question.correct_answer, fingerprint(answer)]
+        ).encode()
+    ).hexdigest()
+    return f"quiz:grade:{digest}"
+
+
+def pre_grade(correct_answer, answer):
+    """Grade an answer locally by its similarity to the reference answer.
+
+    Returns:
+        A tuple of (is_correct, feedback) if the similarity is above the
+        accept or below the reject threshold, or None if the answer is
+        ambiguous (or embeddings are unavailable) and needs the LLM.
+    """
+    try:
+        similarity = cosine_similarity(
+            get_answer_embedding(correct_answer), get_answer_embedding(answer)
+        )
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning("Short answer pre-grading failed: %s", e)
+        return None
+
+    if similarity >= settings.QUIZ_GRADE_ACCEPT_SIMILARITY:
+        return True, ACCEPTED_FEEDBACK
+    if similarity <= settings.QUIZ_GRADE_REJECT_SIMILARITY:
+        return False, REJECTED_FEEDBACK
+    return None
+
+
+def get_answer_embedding(text):
+    """Embed text with the sentence-transformers model used for search."""
+    return get_query_embedding(text)
+
+
+def cosine_similarity(a, b):
+    """Return the cosine similarity of two vectors (0 if either is zero)."""
+    dot = sum(x * y for x, y in zip(a, b, strict=True))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
@@ -0,0 +1,167 @@
+"""Source grounding for quiz generation.
+
+Quiz prompts used to carry only the era description and a few truncated
+events and figures. ``get_grounding_chunks`` adds excerpts from the
+embedded content corpus the chat retrieves from, without an embedding
+call per quiz and without letting the prompt grow with the corpus:
+
+- Each era has one query vector: the centroid of its chunk embeddings,
+  computed once in the database (``era_centroid``).
+- The chunks nearest to it are diversified with MMR (``mmr_select``, as
+  in chat retrieval) and packed, in that order, into up to
+  ``QUIZ_GROUNDING_ROTATIONS`` sets of at most
+  ``QUIZ_GROUNDING_TOKEN_BUDGET`` tokens.
+- The sets are cached per era, and successive quizzes for an (era,
+  difficulty) pair rotate through them, so the bank is not filled from
+  the same few excerpts.
+
+Cached entries are stamped with the era context version (see
+``apps.quiz.context``); newly processed content is picked up when they
+expire after ``QUIZ_GROUNDING_CACHE_SECONDS``.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg
+from pgvector.django import CosineDistance, VectorField
+
+from apps.chat.ranking import mmr_select
+from apps.content.models import ContentChunk
+from apps.content.retrieval import fetch_candidates
+from apps.eras.models import Era
+from apps.llm.budget import estimate_tokens
+
+from .context import context_version
+
+
+def get_grounding_chunks(era, difficulty):
+    """Return the source chunks for the next quiz of an (era, difficulty).
+
+    Args:
+        era: The Era of the quiz, or None for "All Eras" (which combines
+            a share of the token budget from every era).
+        difficulty: Quiz difficulty; each difficulty rotates separately.
+
+    Returns:
+        A list of ContentChunk instances with their content items, empty
+        when the era has no embedded content.
+    """
+    era_key = era.id if era else "all"
+    key = f"quiz:grounding:{context_version()}:{era_key}"
+    chunk_sets = cache.get(key)
+    if chunk_sets is None:
+        chunk_sets = build_chunk_sets(era)
+        cache.set(key, chunk_sets, settings.QUIZ_GROUNDING_CACHE_SECONDS)
+    if not chunk_sets:
+        return []
+
+    turn = _next_turn(f"quiz:grounding:turn:{era_key}:{difficulty}")
+    chunk_ids = chunk_sets[turn % len(chunk_sets)]
+    chunks = ContentChunk.objects.select_related("content_item").in_bulk(chunk_ids)
+    return [chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks]
+
+
+def build_chunk_sets(era):
+    """Select the rotation sets of chunk ids for an era, or for all eras."""
+    if era is not None:
+        return _era_chunk_sets(era, settings.QUIZ_GROUNDING_TOKEN_BUDGET)
+
+    eras = list(Era.objects.all())
+    if not eras:
+        return []
+    budget = settings.QUIZ_GROUNDING_TOKEN_BUDGET // len(eras)
+    per_era = [sets for sets in (_era_chunk_sets(e, budget) for e in eras) if sets]
+    rotations = max((len(sets) for sets in per_era), default=0)
+    return [
+        [chunk_id for sets in per_era for chunk_id in sets[i % len(sets)]]
+        for i in range(rotations)
+    ]
+
+
+def era_centroid(era):
+    """Return the mean embedding of an era's chunks, or None if it has none."""
+    key = f"quiz:grounding:centroid:{context_version()}:{era.id}"
+    centroid = cache.get(key)
+    if centroid is None:
+        mean = _era_chunks(era).aggregate(
+            mean=Avg("embedding", output_field=VectorField())
+        )["mean"]
+        # An empty list caches "no content" as well
+        centroid = [float(x) for x in mean] if mean is not None else []
+        cache.set(key, centroid, settings.QUIZ_GROUNDING_CACHE_SECONDS)
+    return centroid or None
+
+
+def format_sources(chunks):
+    """Format chunks as labelled prompt excerpts.
+
+    Returns:
+        Tuple of (text, labels), where ``labels`` maps each excerpt label
+        ("S1", "S2", ...) to the id of its ContentItem.
+    """
+    parts = []
+    labels = {}
+    for i, chunk in enumerate(chunks, start=1):
+        item = chunk.content_item
+        label = f"S{i}"
+        labels[label] = item.id
+        parts.append(
+            f"[{label}] {item.title} by {item.author or 'Unknown'}\n{chunk.chunk_text}"
+        )
+    return "\n\n".join(parts), labels
+
+
+def _era_chunks(era):
+    return ContentChunk.objects.filter(
+        content_item__tags__slug=era.slug,
+        content_item__tags__tag_type="era",
+    )
+
+
+def _era_chunk_sets(era, budget):
+    """Pack an era's most central, diverse chunks into token-budgeted sets."""
+    centroid = era_centroid(era)
+    if centroid is None or budget <= 0:
+        return []
+
+    candidates = fetch_candidates(
+        _era_chunks(era)
+        .annotate(distance=CosineDistance("embedding", centroid))
+        .order_by("distance"),
+        settings.QUIZ_GROUNDING_CANDIDATES,
+        settings.QUIZ_GROUNDING_CANDIDATES,
+        min_score=0.0,
+    )
+    order = mmr_select(
+        centroid,
+        [chunk.embedding for chunk in candidates],
+        len(candidates),
+        lambda_mult=settings.CHAT_MMR_LAMBDA,
+    )
+
+    chunk_sets = [[]]
+    used = 0
+    for index in order:
+        chunk = candidates[index]
+        tokens = chunk.token_count or estimate_tokens(chunk.chunk_text)
+        if tokens > budget:
+            continue
+        if used + tokens > budget:
+            if len(chunk_sets) == settings.QUIZ_GROUNDING_ROTATIONS:
+                break
+            chunk_sets.append([])
+            used = 0
+        chunk_sets[-1].append(chunk.id)
+        used += tokens
+    return [chunk_ids for chunk_ids in chunk_sets if chunk_ids]
+
+
+def _next_turn(key):
+    """Return 0, 1, 2, ... on successive calls for ``key``."""
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key) - 1
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 0
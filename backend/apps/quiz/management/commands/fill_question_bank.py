@@ -0,0 +1,58 @@
+"""
+Django management command to fill the quiz question bank.
+
+Generates questions until every (era, difficulty) pool holds
+QUIZ_BANK_TARGET_PER_TYPE questions of each type, so quizzes can be
+created from the bank from the start. Pools are otherwise topped up in
+the background as quizzes are created.
+
+Usage examples:
+    python manage.py fill_question_bank
+    python manage.py fill_question_bank --era 3 --difficulty beginner
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.eras.models import Era
+from apps.quiz.bank import top_up_bank
+from apps.quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    """Generate questions for the quiz question bank."""
+
+    help = "Fill quiz question bank pools up to QUIZ_BANK_TARGET_PER_TYPE"
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            "--era",
+            type=int,
+            help="Only fill the pools of this era id (default: all eras and "
+            "the 'All Eras' pool)",
+        )
+        parser.add_argument(
+            "--difficulty",
+            choices=Quiz.Difficulty.values,
+            help="Only fill pools of this difficulty (default: all)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command."""
+        if options["era"] is not None:
+            eras = [Era.objects.get(pk=options["era"])]
+        else:
+            eras = [*Era.objects.all(), None]
+        difficulties = (
+            [options["difficulty"]] if options["difficulty"] else Quiz.Difficulty.values
+        )
+
+        total = 0
+        for era in eras:
+            for difficulty in difficulties:
+                while added := top_up_bank(era, difficulty):
+                    total += added
+                name = era.name if era else "All Eras"
+                self.stdout.write(f"  {name} / {difficulty}: filled")
+
+        self.stdout.write(self.style.SUCCESS(f"Added {total} question(s) to the bank"))
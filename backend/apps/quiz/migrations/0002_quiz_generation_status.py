@@ -0,0 +1,67 @@
+# Track asynchronous quiz generation and idempotent creation
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("quiz", "0001_initial"),
+    ]
+
+    operations = [
+        # Existing quizzes were generated synchronously, so they are ready
+        migrations.AddField(
+            model_name="quiz",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("generating", "Generating"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="ready",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="quiz",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("generating", "Generating"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="quiz",
+            name="generation_error",
+            field=models.TextField(
+                blank=True, help_text="User-facing reason generation failed"
+            ),
+        ),
+        migrations.AddField(
+            model_name="quiz",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True,
+                help_text="Idempotency-Key header of the create request",
+                max_length=64,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quiz",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("idempotency_key", ""), _negated=True),
+                fields=("user", "idempotency_key"),
+                name="quiz_unique_idempotency_key",
+            ),
+        ),
+    ]
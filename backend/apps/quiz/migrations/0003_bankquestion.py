@@ -0,0 +1,95 @@
+# Question bank sampled by quiz creation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("eras", "0001_initial"),
+        ("quiz", "0002_quiz_generation_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BankQuestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "difficulty",
+                    models.CharField(
+                        choices=[
+                            ("beginner", "Beginner"),
+                            ("intermediate", "Intermediate"),
+                            ("advanced", "Advanced"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "question_type",
+                    models.CharField(
+                        choices=[
+                            ("mc", "Multiple Choice"),
+                            ("tf", "True/False"),
+                            ("sa", "Short Answer"),
+                        ],
+                        max_length=2,
+                    ),
+                ),
+                ("question_text", models.TextField()),
+                ("options", models.JSONField(blank=True, default=list)),
+                ("correct_answer", models.TextField()),
+                ("explanation", models.TextField()),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "era",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Null for 'All Eras' questions",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bank_questions",
+                        to="eras.era",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["era", "difficulty", "question_type"],
+                        name="quiz_bankqu_era_id_0c493d_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("era", "difficulty", "fingerprint"),
+                        name="quiz_bank_unique_question",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="quizquestion",
+            name="bank_question",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Question bank entry this question was drawn from",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="quiz_questions",
+                to="quiz.bankquestion",
+            ),
+        ),
+    ]
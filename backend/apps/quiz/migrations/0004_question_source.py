@@ -0,0 +1,38 @@
+# Source excerpt a generated question is grounded on
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("content", "0001_initial"),
+        ("quiz", "0003_bankquestion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bankquestion",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Source excerpt the question was generated from",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="bank_questions",
+                to="content.contentitem",
+            ),
+        ),
+        migrations.AddField(
+            model_name="quizquestion",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Source excerpt the question was generated from",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="quiz_questions",
+                to="content.contentitem",
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Spaced repetition schedule of missed questions
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("quiz", "0004_question_source"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("ease_factor", models.FloatField(default=2.5)),
+                ("interval_days", models.PositiveIntegerField(default=0)),
+                (
+                    "repetitions",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Correct answers in a row"
+                    ),
+                ),
+                ("due_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="review_items",
+                        to="quiz.quizquestion",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="review_items",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["due_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "due_at"], name="quiz_review_user_id_6ea5f9_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "fingerprint"),
+                        name="quiz_review_unique_question",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Start time of a quiz's generation attempt, for the stale quiz sweep
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("quiz", "0005_reviewitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quiz",
+            name="generation_started_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the current generation attempt was claimed",
+                null=True,
+            ),
+        ),
+    ]
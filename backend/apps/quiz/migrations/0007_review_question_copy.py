@@ -0,0 +1,128 @@
+# Review items keep their own copy of the question instead of pointing at a
+# quiz's copy, and at most one review quiz per user is open at a time
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+QUESTION_FIELDS = [
+    "bank_question_id",
+    "question_text",
+    "question_type",
+    "options",
+    "correct_answer",
+    "explanation",
+    "source_id",
+]
+
+
+def copy_questions(apps, schema_editor):
+    ReviewItem = apps.get_model("quiz", "ReviewItem")
+
+    items = list(ReviewItem.objects.select_related("question__quiz"))
+    for item in items:
+        for field in QUESTION_FIELDS:
+            setattr(item, field, getattr(item.question, field))
+        item.era_id = item.question.quiz.era_id
+    ReviewItem.objects.bulk_update(items, [*QUESTION_FIELDS, "era_id"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("content", "0001_initial"),
+        ("eras", "0001_initial"),
+        ("quiz", "0006_quiz_generation_started_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quiz",
+            name="is_review",
+            field=models.BooleanField(
+                default=False, help_text="Built from the user's due review items"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quiz",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("completed_at__isnull", True), ("is_review", True)),
+                fields=("user",),
+                name="quiz_unique_open_review",
+            ),
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="bank_question",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Bank question the quiz question was drawn from",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="review_items",
+                to="quiz.bankquestion",
+            ),
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="era",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Era of the quiz the question was last answered in",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="review_items",
+                to="eras.era",
+            ),
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="question_text",
+            field=models.TextField(default=""),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="question_type",
+            field=models.CharField(
+                choices=[
+                    ("mc", "Multiple Choice"),
+                    ("tf", "True/False"),
+                    ("sa", "Short Answer"),
+                ],
+                default="",
+                max_length=2,
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="options",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="correct_answer",
+            field=models.TextField(default=""),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="explanation",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="reviewitem",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="review_items",
+                to="content.contentitem",
+            ),
+        ),
+        migrations.RunPython(copy_questions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="reviewitem",
+            name="question",
+        ),
+    ]
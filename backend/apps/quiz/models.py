@@ -12,9 +12,17 @@ class Quiz(models.Model):
     """A quiz attempt by a user.
 
     Stores quiz metadata, score, and completion status. Questions are
-    generated via OpenAI based on era content and difficulty level.
+    generated via OpenAI based on era content and difficulty level, in a
+    Celery task (``apps.quiz.tasks``) that moves the quiz from ``pending``
+    to ``ready`` or ``failed``.
     """
 
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        GENERATING = "generating", "Generating"
+        READY = "ready", "Ready"
+        FAILED = "failed", "Failed"
+
     class Difficulty(models.TextChoices):
         BEGINNER = "beginner", "Beginner"
         INTERMEDIATE = "intermediate", "Intermediate"
@@ -43,6 +51,29 @@ class Quiz(models.Model):
         help_text="Number of correct answers",
     )
     total_questions = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    generation_error = models.TextField(
+        blank=True,
+        help_text="User-facing reason generation failed",
+    )
+    generation_started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the current generation attempt was claimed",
+    )
+    idempotency_key = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Idempotency-Key header of the create request",
+    )
+    is_review = models.BooleanField(
+        default=False,
+        help_text="Built from the user's due review items",
+    )
     completed_at = models.DateTimeField(
         null=True,
         blank=True,
@@ -62,6 +93,18 @@ class Quiz(models.Model):
             models.Index(fields=["user", "-created_at"]),
             models.Index(fields=["user", "era"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                condition=~models.Q(idempotency_key=""),
+                name="quiz_unique_idempotency_key",
+            ),
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(is_review=True, completed_at__isnull=True),
+                name="quiz_unique_open_review",
+            ),
+        ]
 
     def __str__(self):
         era_name = self.era.name if self.era else "All Eras"
@@ -135,6 +178,22 @@ class QuizQuestion(models.Model):
     order = models.PositiveIntegerField(
         help_text="Question order within the quiz",
     )
+    bank_question = models.ForeignKey(
+        "BankQuestion",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="quiz_questions",
+        help_text="Question bank entry this question was drawn from",
+    )
+    source = models.ForeignKey(
+        "content.ContentItem",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="quiz_questions",
+        help_text="Source excerpt the question was generated from",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -145,3 +204,131 @@ class QuizQuestion(models.Model):
 
     def __str__(self):
         return f"Q{self.order}: {self.question_text[:50]}"
+
+
+class BankQuestion(models.Model):
+    """A validated question in the question bank.
+
+    The bank holds deduplicated questions per (era, difficulty, type).
+    Quizzes are filled by sampling it (``apps.quiz.bank``) instead of
+    calling OpenAI, and it is topped up in the background whenever a
+    pool runs low. ``fingerprint`` is a hash of the normalized question
+    text, used to reject duplicates.
+    """
+
+    era = models.ForeignKey(
+        "eras.Era",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="bank_questions",
+        help_text="Null for 'All Eras' questions",
+    )
+    difficulty = models.CharField(max_length=20, choices=Quiz.Difficulty.choices)
+    question_type = models.CharField(
+        max_length=2,
+        choices=QuizQuestion.QuestionType.choices,
+    )
+    question_text = models.TextField()
+    options = models.JSONField(default=list, blank=True)
+    correct_answer = models.TextField()
+    explanation = models.TextField()
+    source = models.ForeignKey(
+        "content.ContentItem",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="bank_questions",
+        help_text="Source excerpt the question was generated from",
+    )
+    fingerprint = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["era", "difficulty", "question_type"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["era", "difficulty", "fingerprint"],
+                name="quiz_bank_unique_question",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"[{self.difficulty}/{self.question_type}] {self.question_text[:50]}"
+
+
+class ReviewItem(models.Model):
+    """A missed question in a user's spaced repetition schedule.
+
+    Created the first time a user answers a question wrongly, and
+    rescheduled with SM-2 each time the question (matched by
+    ``fingerprint``, across quizzes) is answered again; see
+    ``apps.quiz.review``. The item keeps its own copy of the latest version
+    of the question, so review quizzes can be built after the quizzes it
+    was answered in are deleted.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="review_items",
+    )
+    bank_question = models.ForeignKey(
+        BankQuestion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="review_items",
+        help_text="Bank question the quiz question was drawn from",
+    )
+    era = models.ForeignKey(
+        "eras.Era",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="review_items",
+        help_text="Era of the quiz the question was last answered in",
+    )
+    question_text = models.TextField()
+    question_type = models.CharField(
+        max_length=2,
+        choices=QuizQuestion.QuestionType.choices,
+    )
+    options = models.JSONField(default=list, blank=True)
+    correct_answer = models.TextField()
+    explanation = models.TextField(blank=True)
+    source = models.ForeignKey(
+        "content.ContentItem",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="review_items",
+    )
+    fingerprint = models.CharField(max_length=64)
+    ease_factor = models.FloatField(default=2.5)
+    interval_days = models.PositiveIntegerField(default=0)
+    repetitions = models.PositiveIntegerField(
+        default=0,
+        help_text="Correct answers in a row",
+    )
+    due_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["due_at"]
+        indexes = [
+            models.Index(fields=["user", "due_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "fingerprint"],
+                name="quiz_review_unique_question",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} - due {self.due_at:%Y-%m-%d}"
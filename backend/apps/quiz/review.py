@@ -0,0 +1,183 @@
+"""Spaced repetition review of missed questions.
+
+Each question a user gets wrong enters their review schedule as a
+``ReviewItem``. ``record_answers`` updates the schedule as answers are
+graded, with one query for the affected items, so due questions never
+have to be found by scanning the user's answer history:
+
+- A wrong answer to a question not yet in the schedule adds it.
+- Every later answer to the same question (matched by its fingerprint,
+  in any quiz, including review quizzes) reschedules it with SM-2: the
+  interval grows with each correct answer in a row, by a per-item ease
+  factor that drops with each lapse, and a wrong answer starts over.
+
+Only the first grade of each quiz question is recorded: the quiz views
+leave out questions that were already graded, so answering one again
+before completing the quiz does not reschedule it.
+
+Each item keeps a copy of the latest version of its question, and
+``create_review_quiz`` builds a ready quiz from the items that are due
+out of these copies, so a review session needs no LLM call. A user has at
+most one open review quiz; starting another returns it instead.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .bank import fingerprint
+from .models import Quiz, QuizQuestion, ReviewItem
+
+# SM-2 answer quality (0-5) of a correct and of a wrong answer; grading is
+# binary, so these stand in for a self-assessed recall score
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 2
+MIN_EASE_FACTOR = 1.3
+
+# Question fields copied onto a review item, and from it into review quizzes
+QUESTION_FIELDS = [
+    "bank_question_id",
+    "question_text",
+    "question_type",
+    "options",
+    "correct_answer",
+    "explanation",
+    "source_id",
+]
+
+
+def schedule(item, is_correct, now):
+    """Reschedule a review item after an answer, in place (SM-2)."""
+    if is_correct:
+        item.repetitions += 1
+        if item.repetitions == 1:
+            item.interval_days = 1
+        elif item.repetitions == 2:
+            item.interval_days = 6
+        else:
+            item.interval_days = round(item.interval_days * item.ease_factor)
+        quality = CORRECT_QUALITY
+    else:
+        item.repetitions = 0
+        item.interval_days = 1
+        quality = WRONG_QUALITY
+
+    lapse = 5 - quality
+    item.ease_factor = max(
+        MIN_EASE_FACTOR, item.ease_factor + 0.1 - lapse * (0.08 + lapse * 0.02)
+    )
+    item.due_at = now + timedelta(days=item.interval_days)
+
+
+def record_answers(user, questions):
+    """Update a user's review schedule with graded questions.
+
+    Args:
+        user: The user who answered.
+        questions: QuizQuestions graded for the first time; unanswered
+            ones are ignored.
+    """
+    answered = {
+        fingerprint(question.question_text): question
+        for question in questions
+        if question.is_correct is not None
+    }
+    if not answered:
+        return
+
+    items = {
+        item.fingerprint: item
+        for item in ReviewItem.objects.filter(user=user, fingerprint__in=answered)
+    }
+    now = timezone.now()
+    created = []
+    for key, question in answered.items():
+        item = items.get(key)
+        if item is None:
+            if question.is_correct:
+                continue
+            item = ReviewItem(user=user, fingerprint=key)
+            created.append(item)
+        for field in QUESTION_FIELDS:
+            setattr(item, field, getattr(question, field))
+        item.era_id = question.quiz.era_id
+        item.updated_at = now
+        schedule(item, question.is_correct, now)
+
+    # A concurrent answer to the same question may have added it already
+    ReviewItem.objects.bulk_create(created, ignore_conflicts=True)
+    ReviewItem.objects.bulk_update(
+        list(items.values()),
+        [
+            *QUESTION_FIELDS,
+            "era_id",
+            "ease_factor",
+            "interval_days",
+            "repetitions",
+            "due_at",
+            "updated_at",
+        ],
+    )
+
+
+def create_review_quiz(user):
+    """Start a review of the user's due review items.
+
+    Returns the user's open review quiz if they have not completed it yet.
+    Otherwise takes up to ``QUIZ_REVIEW_SESSION_SIZE`` items, the most
+    overdue first, into a new quiz. The quiz is about their era when they
+    share one, and is ready as soon as it is created.
+
+    Returns:
+        A (quiz, created) tuple; quiz is None if nothing is open or due.
+    """
+    existing = get_open_review_quiz(user)
+    if existing is not None:
+        return existing, False
+
+    items = list(
+        ReviewItem.objects.filter(user=user, due_at__lte=timezone.now()).order_by(
+            "due_at"
+        )[: settings.QUIZ_REVIEW_SESSION_SIZE]
+    )
+    if not items:
+        return None, False
+
+    era_ids = {item.era_id for item in items}
+    try:
+        with transaction.atomic():
+            quiz = Quiz.objects.create(
+                user=user,
+                era_id=era_ids.pop() if len(era_ids) == 1 else None,
+                total_questions=len(items),
+                status=Quiz.Status.READY,
+                is_review=True,
+            )
+            QuizQuestion.objects.bulk_create(
+                [
+                    QuizQuestion(
+                        quiz=quiz,
+                        order=i + 1,
+                        **{field: getattr(item, field) for field in QUESTION_FIELDS},
+                    )
+                    for i, item in enumerate(items)
+                ]
+            )
+    except IntegrityError:
+        # A concurrent request started the review first
+        existing = get_open_review_quiz(user)
+        if existing is None:
+            raise
+        return existing, False
+    return quiz, True
+
+
+def get_open_review_quiz(user):
+    """Return the user's uncompleted review quiz, or None."""
+    return (
+        Quiz.objects.filter(user=user, is_review=True, completed_at__isnull=True)
+        .select_related("era")
+        .first()
+    )
@@ -23,6 +23,13 @@ class QuizQuestionSerializer(serializers.ModelSerializer):
 class QuizQuestionDetailSerializer(serializers.ModelSerializer):
     """Serializer for QuizQuestion with full details (for completed quizzes)."""
 
+    source_title = serializers.CharField(
+        source="source.title", read_only=True, default=None
+    )
+    source_url = serializers.CharField(
+        source="source.url", read_only=True, default=None
+    )
+
     class Meta:
         model = QuizQuestion
         fields = [
@@ -35,17 +42,25 @@ class QuizQuestionDetailSerializer(serializers.ModelSerializer):
             "is_correct",
             "explanation",
             "feedback",
+            "source_title",
+            "source_url",
             "order",
         ]
         read_only_fields = ["id"]
 
 
 class QuizListSerializer(serializers.ModelSerializer):
-    """Serializer for Quiz list view (no questions embedded)."""
+    """Serializer for Quiz list view (no questions embedded).
+
+    ``questions_answered`` and ``correct_answers`` are annotated by the
+    list queryset.
+    """
 
     era_name = serializers.CharField(source="era.name", read_only=True, default=None)
     percentage_score = serializers.IntegerField(read_only=True)
     passed = serializers.BooleanField(read_only=True)
+    questions_answered = serializers.IntegerField(read_only=True)
+    correct_answers = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Quiz
@@ -58,12 +73,16 @@ class QuizListSerializer(serializers.ModelSerializer):
             "total_questions",
             "percentage_score",
             "passed",
+            "questions_answered",
+            "correct_answers",
+            "status",
             "completed_at",
             "created_at",
         ]
         read_only_fields = [
             "id",
             "score",
+            "status",
             "completed_at",
             "created_at",
         ]
@@ -92,6 +111,8 @@ class QuizSerializer(serializers.ModelSerializer):
             "total_questions",
             "percentage_score",
             "passed",
+            "status",
+            "generation_error",
             "completed_at",
             "created_at",
             "questions",
@@ -99,6 +120,8 @@ class QuizSerializer(serializers.ModelSerializer):
         read_only_fields = [
             "id",
             "score",
+            "status",
+            "generation_error",
             "completed_at",
             "created_at",
         ]
@@ -112,6 +135,27 @@ class QuizSerializer(serializers.ModelSerializer):
         return serializer.data
 
 
+class QuizStatusSerializer(serializers.ModelSerializer):
+    """Serializer for polling the generation status of a quiz.
+
+    ``questions_ready`` counts the questions saved so far, which can be
+    answered before generation finishes.
+    """
+
+    questions_ready = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Quiz
+        fields = [
+            "id",
+            "status",
+            "generation_error",
+            "total_questions",
+            "questions_ready",
+        ]
+        read_only_fields = fields
+
+
 class QuizCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a new quiz."""
 
@@ -155,3 +199,16 @@ class QuizAnswerSerializer(serializers.Serializer):
 
     question_id = serializers.IntegerField()
     answer = serializers.CharField()
+
+
+class QuizAnswersSerializer(serializers.Serializer):
+    """Serializer for submitting several answers at once."""
+
+    answers = QuizAnswerSerializer(many=True, allow_empty=False)
+
+    def validate_answers(self, value):
+        """Reject batches answering the same question twice."""
+        question_ids = [a["question_id"] for a in value]
+        if len(set(question_ids)) != len(question_ids):
+            raise serializers.ValidationError("Each question can be answered once.")
+        return value
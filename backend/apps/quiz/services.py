@@ -6,19 +6,89 @@ and grading short answer questions using AI.
 
 import json
 import logging
+from collections import Counter
+from collections.abc import Callable
 from typing import Any
 
 import openai
 from django.conf import settings
+from django.db import transaction
+from openai.types import CompletionUsage
 
 from apps.eras.models import Era
-
+from apps.llm import breaker
+from apps.llm.budget import (
+    BudgetExceededError,
+    estimate_tokens,
+    get_global_usage,
+    get_reset_time,
+    get_user_usage,
+    reconcile,
+    reserve,
+)
+from apps.llm.governor import GENERATION, GRADING, governed
+
+from .bank import add_to_bank, question_mix, validate_question
+from .context import get_era_context
+from .grounding import format_sources, get_grounding_chunks
 from .models import Quiz, QuizQuestion
+from .streaming import QuestionStreamParser
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+
+class QuizGenerationAbandonedError(Exception):
+    """Raised when a quiz stops being ``generating`` while it is generated.
+
+    The stale quiz sweep (``apps.quiz.tasks.fail_stale_quizzes``) may fail
+    a quiz whose worker is slow rather than dead; the worker then stops
+    instead of adding questions to, or readying, the failed quiz.
+    """
+
+
+# Initialize OpenAI client. Retries are left to the circuit breaker so that
+# they stop as soon as the provider is known to be down.
+client = openai.OpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    timeout=settings.OPENAI_TIMEOUT,
+    max_retries=0,
+)
+
+GENERATION_MAX_TOKENS = 3000
+GRADING_MAX_TOKENS = 200
+
+# How each question type is requested in the generation prompt
+QUESTION_TYPE_LABELS = {
+    QuizQuestion.QuestionType.MULTIPLE_CHOICE: (
+        "multiple choice question(s) (4 options each)"
+    ),
+    QuizQuestion.QuestionType.TRUE_FALSE: "true/false question(s)",
+    QuizQuestion.QuestionType.SHORT_ANSWER: "short answer question(s)",
+}
+
+
+def check_generation_available(user_id: int) -> None:
+    """Fail fast if a quiz for ``user_id`` could not be generated now.
+
+    Lets quiz creation be refused up front instead of queueing a
+    generation task that is bound to fail.
+
+    Raises:
+        CircuitOpenError: If the OpenAI circuit breaker is open.
+        BudgetExceededError: If the user's or the global daily token
+            budget is already used up.
+    """
+    stats = breaker.get_breaker("openai", settings.OPENAI_MODEL).stats()
+    if stats["state"] == breaker.OPEN:
+        raise breaker.CircuitOpenError(
+            f"openai:{settings.OPENAI_MODEL}", stats["retry_after"]
+        )
+    for scope, usage in (
+        ("user", get_user_usage(user_id)),
+        ("global", get_global_usage()),
+    ):
+        if usage["remaining"] == 0:
+            raise BudgetExceededError(scope, usage["limit"], get_reset_time())
 
 
 def generate_quiz_questions(quiz: Quiz) -> None:
@@ -29,116 +99,247 @@ def generate_quiz_questions(quiz: Quiz) -> None:
     - Quiz difficulty
     - Era content (description, key events, key figures)
 
+    The response is streamed and each valid question is saved as soon as
+    it has been generated, so clients polling the quiz can show the first
+    questions while the rest are on their way. Once the stream ends the
+    token counts are saved and the quiz is marked ``ready``, with
+    ``total_questions`` set to the number of questions actually created.
+    Valid questions are also added to the question bank, linked from the
+    quiz so they are not drawn for this user again. Questions saved by an
+    earlier, interrupted attempt are kept and only the missing ones of
+    each type are requested.
+
+    Questions are only added, and the quiz only readied, while it is still
+    ``generating``.
+
     Args:
         quiz: The Quiz instance to generate questions for.
 
     Raises:
         openai.APIError: If OpenAI API call fails.
+        CircuitOpenError: If the OpenAI circuit breaker is open.
+        BudgetExceededError: If the user's or the global daily token
+            budget is exhausted.
+        ValueError: If OpenAI returned no valid question.
+        QuizGenerationAbandonedError: If the quiz was failed meanwhile.
     """
-    # Gather era content
-    if quiz.era:
-        era_context = _build_era_context(quiz.era)
-        scope = f"the {quiz.era.name} era ({quiz.era.start_year}-{quiz.era.end_year or 'present'})"
+    saved = Counter(quiz.questions.values_list("question_type", flat=True))
+    order = sum(saved.values())
+    missing = {
+        question_type: max(0, count - saved[question_type])
+        for question_type, count in question_mix(quiz.total_questions).items()
+    }
+
+    def publish(question_data):
+        nonlocal order
+        cleaned = validate_question(question_data)
+        if cleaned is None:
+            logger.warning("Skipping malformed question for quiz %s", quiz.id)
+            return
+        banked = add_to_bank(quiz.era, quiz.difficulty, [cleaned])
+        with transaction.atomic():
+            # The lock orders this against the sweep failing the quiz
+            if (
+                not Quiz.objects.select_for_update()
+                .filter(pk=quiz.pk, status=Quiz.Status.GENERATING)
+                .exists()
+            ):
+                raise QuizGenerationAbandonedError(
+                    f"Quiz {quiz.id} is no longer generating"
+                )
+            order += 1
+            QuizQuestion.objects.create(
+                quiz=quiz,
+                bank_question=banked.get(cleaned["fingerprint"]),
+                question_text=cleaned["question_text"],
+                question_type=cleaned["question_type"],
+                options=cleaned["options"],
+                correct_answer=cleaned["correct_answer"],
+                explanation=cleaned["explanation"],
+                source_id=cleaned["source_id"],
+                order=order,
+            )
+
+    if any(missing.values()):
+        _questions, usage = request_questions(
+            quiz.era,
+            quiz.difficulty,
+            missing,
+            user_id=quiz.user_id,
+            on_question=publish,
+        )
+        # Track tokens
+        quiz.generation_input_tokens += usage.prompt_tokens
+        quiz.generation_output_tokens += usage.completion_tokens
+    if not order:
+        raise ValueError("OpenAI returned no valid quiz questions")
+
+    quiz.total_questions = order
+    updated = Quiz.objects.filter(pk=quiz.pk, status=Quiz.Status.GENERATING).update(
+        generation_input_tokens=quiz.generation_input_tokens,
+        generation_output_tokens=quiz.generation_output_tokens,
+        total_questions=order,
+        status=Quiz.Status.READY,
+    )
+    if not updated:
+        raise QuizGenerationAbandonedError(f"Quiz {quiz.id} is no longer generating")
+    quiz.status = Quiz.Status.READY
+
+
+def request_questions(
+    era: Era | None,
+    difficulty: str,
+    type_counts: dict[str, int],
+    user_id: int | None = None,
+    on_question: Callable[[dict[str, Any]], None] | None = None,
+) -> tuple[list[dict[str, Any]], CompletionUsage]:
+    """Ask OpenAI for questions about an era.
+
+    Args:
+        era: The Era to ask about, or None for all eras.
+        difficulty: Quiz difficulty level.
+        type_counts: Number of questions wanted per question type.
+        user_id: User the call is charged to, or None to charge only the
+            global token budget (background work).
+        on_question: Called with each question dict as soon as it has
+            been streamed, before the rest of the response arrives.
+
+    Returns:
+        Tuple of (question dicts, OpenAI usage). The usage is estimated
+        if the stream did not report it.
+
+    Raises:
+        openai.APIError: If OpenAI API call fails.
+        CircuitOpenError: If the OpenAI circuit breaker is open.
+        BudgetExceededError: If a daily token budget is exhausted.
+    """
+    # Gather era content (cached until eras are edited)
+    era_context = get_era_context(era)
+    if era:
+        scope = f"the {era.name} era ({era.start_year}-{era.end_year or 'present'})"
     else:
         # "All Eras" quiz
-        eras = Era.objects.all().prefetch_related("key_events", "key_figures")
-        era_context = "\n\n".join([_build_era_context(era) for era in eras])
         scope = "all eras of church history"
 
+    # Excerpts from the content corpus, rotated between quizzes
+    chunks = (
+        get_grounding_chunks(era, difficulty) if settings.QUIZ_GROUNDING_ENABLED else []
+    )
+    sources, source_labels = format_sources(chunks)
+
     # Build prompt
     prompt = _build_generation_prompt(
         era_context=era_context,
         scope=scope,
-        difficulty=quiz.difficulty,
-        question_count=quiz.total_questions,
+        difficulty=difficulty,
+        type_counts=type_counts,
+        sources=sources,
     )
 
-    try:
-        # Call OpenAI
-        response = client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a church history quiz generator. Generate questions in valid JSON format.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7,
-            max_tokens=3000,
-        )
+    # Hold an upper estimate against the daily token budgets
+    reservation = reserve(user_id, estimate_tokens(prompt) + GENERATION_MAX_TOKENS)
+    circuit = breaker.get_breaker("openai", settings.OPENAI_MODEL)
+    parser = QuestionStreamParser()
+    questions: list[dict[str, Any]] = []
+    output: list[str] = []
+    usage = None
 
-        # Track tokens
-        quiz.generation_input_tokens = response.usage.prompt_tokens
-        quiz.generation_output_tokens = response.usage.completion_tokens
-        quiz.save(update_fields=["generation_input_tokens", "generation_output_tokens"])
-
-        # Parse response
-        questions_data = json.loads(response.choices[0].message.content)
+    try:
+        # Call OpenAI (waits for a generation slot behind interactive work)
+        with governed("openai", GENERATION):
+            stream = breaker.call(
+                circuit,
+                client.chat.completions.create,
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are a church history quiz generator. "
+                            "Generate questions in valid JSON format."
+                        ),
+                    },
+                    {"role": "user", "content": prompt},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=GENERATION_MAX_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
 
-        # Create QuizQuestion instances
-        _create_quiz_questions(quiz, questions_data["questions"])
+            try:
+                for chunk in stream:
+                    # The final chunk carries the usage and no choices
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content or ""
+                    output.append(text)
+                    for question in parser.feed(text):
+                        label = question.get("source")
+                        if isinstance(label, str):
+                            question["source_id"] = source_labels.get(label)
+                        questions.append(question)
+                        if on_question is not None:
+                            on_question(question)
+            except Exception as e:
+                if breaker.is_provider_failure(e):
+                    circuit.record_failure()
+                raise
+
+        if usage is None:
+            prompt_tokens = estimate_tokens(prompt)
+            completion_tokens = estimate_tokens("".join(output))
+            usage = CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            )
+        return questions, usage
 
     except openai.APIError as e:
         logger.exception("OpenAI API error during quiz generation: %s", e)
         raise
-    except json.JSONDecodeError as e:
-        logger.exception("Failed to parse OpenAI JSON response: %s", e)
-        raise
-    except KeyError as e:
-        logger.exception("Unexpected OpenAI response structure: %s", e)
-        raise
-
-
-def _build_era_context(era: Era) -> str:
-    """Build context text for an era."""
-    context_parts = [
-        f"Era: {era.name} ({era.start_year}-{era.end_year or 'present'})",
-        f"Description: {era.description}",
-        "",
-        "Key Events:",
-    ]
-
-    for event in era.key_events.all()[:10]:  # Limit to 10 events
-        context_parts.append(f"- {event.year}: {event.title}")
-        if event.description:
-            context_parts.append(f"  {event.description[:200]}")
-
-    context_parts.extend(["", "Key Figures:"])
-    for figure in era.key_figures.all()[:10]:  # Limit to 10 figures
-        years = ""
-        if figure.birth_year and figure.death_year:
-            years = f" ({figure.birth_year}-{figure.death_year})"
-        context_parts.append(f"- {figure.name}{years}: {figure.title}")
-        if figure.description:
-            context_parts.append(f"  {figure.description[:200]}")
-
-    return "\n".join(context_parts)
+    finally:
+        if usage is not None:
+            used_tokens = usage.prompt_tokens + usage.completion_tokens
+        elif output:
+            # Stream cut off: charge what was generated so far
+            used_tokens = estimate_tokens(prompt) + estimate_tokens("".join(output))
+        else:
+            used_tokens = 0
+        reconcile(reservation, used_tokens)
 
 
 def _build_generation_prompt(
     era_context: str,
     scope: str,
     difficulty: str,
-    question_count: int,
+    type_counts: dict[str, int],
+    sources: str = "",
 ) -> str:
-    """Build the prompt for quiz generation."""
-    return f"""Generate a church history quiz with {question_count} questions about {scope}.
+    """Build the prompt for quiz generation.
 
-**Difficulty Level:** {difficulty}
+    The era content and the instructions that do not depend on the quiz
+    come first, so that quizzes about the same era share a prompt prefix
+    the provider can cache. The rotating source excerpts follow them.
+    """
+    question_count = sum(type_counts.values())
+    distribution = "\n".join(
+        f"- {count} {QUESTION_TYPE_LABELS[question_type]}"
+        for question_type, count in type_counts.items()
+        if count
+    )
+    return f"""**Era Content:**
+{era_context}
+
+**Difficulty Levels:**
 - Beginner: Basic facts, key dates, major figures
 - Intermediate: Conceptual understanding, cause-effect, significance
 - Advanced: Analysis, comparison, theological nuance
 
-**Question Type Distribution:**
-- {question_count - 2} multiple choice questions (4 options each)
-- 1 true/false question
-- 1 short answer question
-
-**Era Content:**
-{era_context}
-
 **Output Format (JSON):**
 {{
   "questions": [
@@ -147,7 +348,8 @@ def _build_generation_prompt(
       "question_type": "mc",
       "options": ["313", "325", "381", "451"],
       "correct_answer": "1",
-      "explanation": "The Council of Nicaea convened in 325 AD..."
+      "explanation": "The Council of Nicaea convened in 325 AD...",
+      "source": "S1"
     }},
     {{
       "question_text": "Augustine was the Bishop of Hippo.",
@@ -160,8 +362,10 @@ def _build_generation_prompt(
       "question_text": "Explain the significance of the Edict of Milan.",
       "question_type": "sa",
       "options": [],
-      "correct_answer": "The Edict of Milan (313 AD) legalized Christianity in the Roman Empire, ending persecution and marking a turning point...",
-      "explanation": "A complete answer should mention: legalization of Christianity, end of persecution, Emperor Constantine, turning point for church growth."
+      "correct_answer": "The Edict of Milan (313 AD) legalized Christianity in the \
+Roman Empire, ending persecution and marking a turning point...",
+      "explanation": "A complete answer should mention: legalization of Christianity, \
+end of persecution, Emperor Constantine, turning point for church growth."
     }}
   ]
 }}
@@ -173,46 +377,45 @@ def _build_generation_prompt(
 - For TF questions, correct_answer is "0" (True) or "1" (False)
 - For SA questions, correct_answer is a reference answer (2-3 sentences)
 - Each question must have a detailed explanation (2-3 sentences)
-- Vary difficulty appropriately for the {difficulty} level
+- Vary difficulty appropriately for the requested difficulty level
 - Ensure questions are clear, unambiguous, and educational
+- Base questions on the source excerpts where possible, and set "source" to
+  the label of the excerpt a question is based on (omit it otherwise)
 
-Generate the quiz now in valid JSON format:"""
+**Source Excerpts:**
+{sources or "(none)"}
 
+Generate a church history quiz with {question_count} questions about {scope}.
 
-def _create_quiz_questions(quiz: Quiz, questions_data: list[dict[str, Any]]) -> None:
-    """Create QuizQuestion instances from parsed JSON."""
-    question_instances = []
+**Difficulty Level:** {difficulty}
 
-    for i, q_data in enumerate(questions_data):
-        question_instances.append(
-            QuizQuestion(
-                quiz=quiz,
-                question_text=q_data["question_text"],
-                question_type=q_data["question_type"],
-                options=q_data.get("options", []),
-                correct_answer=q_data["correct_answer"],
-                explanation=q_data["explanation"],
-                order=i + 1,
-            )
-        )
+**Question Type Distribution:**
+{distribution}
 
-    QuizQuestion.objects.bulk_create(question_instances)
+Generate the quiz now in valid JSON format:"""
 
 
 def grade_short_answer(
     question_text: str,
     correct_answer: str,
     user_answer: str,
-) -> tuple[bool, str]:
+    user_id: int | None = None,
+) -> tuple[bool, str, CompletionUsage | None]:
     """Grade a short answer question using OpenAI.
 
+    Callers should go through ``apps.quiz.grading.grade_answer``, which
+    only calls this for answers it cannot grade from its cache or locally.
+
     Args:
         question_text: The question text.
         correct_answer: The reference answer.
         user_answer: The user's submitted answer.
+        user_id: If given, the call is charged to this user's daily token
+            budget, and is skipped once the budget is exhausted.
 
     Returns:
-        Tuple of (is_correct, feedback).
+        Tuple of (is_correct, feedback, usage). ``usage`` is None when the
+        answer could not be graded and a fallback grade is returned.
     """
     prompt = f"""Grade this short answer question:
 
@@ -223,7 +426,8 @@ def grade_short_answer(
 **Student Answer:** {user_answer}
 
 **Instructions:**
-- Evaluate if the student's answer is correct (substantially matches the reference answer)
+- Evaluate if the student's answer is correct (substantially matches the reference \
+answer)
 - Be lenient with wording differences
 - Focus on key concepts, not exact phrasing
 - Provide constructive feedback (1-2 sentences)
@@ -231,40 +435,159 @@ def grade_short_answer(
 **Output Format (JSON):**
 {{
   "is_correct": true,
-  "feedback": "Excellent! You correctly identified the key significance of the Edict of Milan."
+  "feedback": "Excellent! You correctly identified the key significance of the Edict \
+of Milan."
 }}
 
 or
 
 {{
   "is_correct": false,
-  "feedback": "Your answer misses the key point about legalization. The Edict of Milan legalized Christianity, ending persecution."
+  "feedback": "Your answer misses the key point about legalization. The Edict of Milan \
+legalized Christianity, ending persecution."
 }}
 
 Grade the answer now in valid JSON format:"""
 
+    reservation = None
+    used_tokens = 0
     try:
-        response = client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a church history teaching assistant grading student answers.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3,  # Lower temperature for consistent grading
-            max_tokens=200,
-        )
+        if user_id is not None:
+            reservation = reserve(user_id, estimate_tokens(prompt) + GRADING_MAX_TOKENS)
+        with governed("openai", GRADING):
+            response = breaker.call(
+                breaker.get_breaker("openai", settings.OPENAI_MODEL),
+                client.chat.completions.create,
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are a church history teaching assistant "
+                            "grading student answers."
+                        ),
+                    },
+                    {"role": "user", "content": prompt},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.3,  # Lower temperature for consistent grading
+                max_tokens=GRADING_MAX_TOKENS,
+            )
+        used_tokens = response.usage.prompt_tokens + response.usage.completion_tokens
 
         result = json.loads(response.choices[0].message.content)
-        return result["is_correct"], result["feedback"]
+        return result["is_correct"], result["feedback"], response.usage
 
+    except BudgetExceededError:
+        return (
+            False,
+            "You've reached today's AI usage limit, so your answer couldn't be "
+            "graded automatically. Please review the reference answer.",
+            None,
+        )
     except Exception as e:
         logger.exception("OpenAI API error during short answer grading: %s", e)
         # Fallback: mark as incorrect with generic feedback
         return (
             False,
-            "We couldn't grade your answer automatically. Please review the reference answer.",
+            "We couldn't grade your answer automatically. "
+            "Please review the reference answer.",
+            None,
+        )
+    finally:
+        if reservation is not None:
+            reconcile(reservation, used_tokens)
+
+
+def grade_short_answers(
+    items: list[tuple[str, str, str]],
+    user_id: int | None = None,
+) -> tuple[list[tuple[bool, str]], CompletionUsage | None]:
+    """Grade several short answers in one OpenAI call.
+
+    Args:
+        items: (question_text, correct_answer, user_answer) tuples.
+        user_id: If given, the call is charged to this user's daily token
+            budget, and is skipped once the budget is exhausted.
+
+    Returns:
+        Tuple of (grades, usage): one (is_correct, feedback) per item, in
+        order, and the OpenAI usage. ``usage`` is None when the answers
+        could not be graded and fallback grades are returned.
+    """
+    answers = "\n\n".join(
+        f"""### Answer {i}
+**Question:** {question_text}
+
+**Reference Answer:** {correct_answer}
+
+**Student Answer:** {user_answer}"""
+        for i, (question_text, correct_answer, user_answer) in enumerate(items)
+    )
+    prompt = f"""Grade these {len(items)} short answer questions:
+
+{answers}
+
+**Instructions:**
+- Evaluate each student answer on its own against its reference answer
+- An answer is correct if it substantially matches the reference answer
+- Be lenient with wording differences
+- Focus on key concepts, not exact phrasing
+- Provide constructive feedback for each answer (1-2 sentences)
+
+**Output Format (JSON):**
+{{
+  "grades": [
+    {{"answer": 0, "is_correct": true, "feedback": "Excellent! ..."}},
+    {{"answer": 1, "is_correct": false, "feedback": "Your answer misses ..."}}
+  ]
+}}
+
+Grade all {len(items)} answers now in valid JSON format:"""
+
+    max_tokens = GRADING_MAX_TOKENS * len(items)
+    reservation = None
+    used_tokens = 0
+    try:
+        if user_id is not None:
+            reservation = reserve(user_id, estimate_tokens(prompt) + max_tokens)
+        with governed("openai", GRADING):
+            response = breaker.call(
+                breaker.get_breaker("openai", settings.OPENAI_MODEL),
+                client.chat.completions.create,
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a church history teaching assistant "
+                        "grading student answers.",
+                    },
+                    {"role": "user", "content": prompt},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.3,  # Lower temperature for consistent grading
+                max_tokens=max_tokens,
+            )
+        used_tokens = response.usage.prompt_tokens + response.usage.completion_tokens
+
+        grades = {
+            grade["answer"]: (bool(grade["is_correct"]), grade["feedback"])
+            for grade in json.loads(response.choices[0].message.content)["grades"]
+        }
+        return [grades[i] for i in range(len(items))], response.usage
+
+    except BudgetExceededError:
+        feedback = (
+            "You've reached today's AI usage limit, so your answer couldn't be "
+            "graded automatically. Please review the reference answer."
+        )
+    except Exception as e:
+        logger.exception("OpenAI API error during short answer grading: %s", e)
+        feedback = (
+            "We couldn't grade your answer automatically. "
+            "Please review the reference answer."
         )
+    finally:
+        if reservation is not None:
+            reconcile(reservation, used_tokens)
+    return [(False, feedback)] * len(items), None
@@ -0,0 +1,23 @@
+"""Signal handlers for the quiz app.
+
+Invalidate the cached era context used by quiz generation prompts when
+era content changes.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.eras.models import Era, KeyEvent, KeyFigure
+
+from .context import bump_context_version
+
+
+@receiver(post_save, sender=Era)
+@receiver(post_delete, sender=Era)
+@receiver(post_save, sender=KeyEvent)
+@receiver(post_delete, sender=KeyEvent)
+@receiver(post_save, sender=KeyFigure)
+@receiver(post_delete, sender=KeyFigure)
+def invalidate_era_context(sender, **kwargs):
+    """Replace the era context version when an era or its content changes."""
+    bump_context_version()
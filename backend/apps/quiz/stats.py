@@ -0,0 +1,85 @@
+"""Quiz statistics computed in the database.
+
+``get_quiz_stats`` returns a user's totals and the per-era breakdown from
+one query grouped by era, however many quizzes the user has taken; the
+totals are the sums of the (at most one per era) groups. ``Quiz.passed``
+and the current streak used to be evaluated by loading every completed
+quiz; both are expressed as SQL conditions here.
+"""
+
+from django.db.models import Count, Exists, F, FloatField, Q, Subquery, Sum
+from django.db.models.functions import Cast, NullIf
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .models import Quiz
+
+COMPLETED = Q(completed_at__isnull=False)
+
+# Quiz.passed is round(score / total * 100) >= 70, which for integers holds
+# exactly when score * 200 >= total * 139 (i.e. at least 69.5%, which
+# rounds to 70)
+PASSED = (
+    COMPLETED
+    & Q(total_questions__gt=0)
+    & Q(GreaterThanOrEqual(F("score") * 200, F("total_questions") * 139))
+)
+
+PERCENTAGE_SCORE = (
+    Cast(F("score"), FloatField())
+    * 100.0
+    / NullIf(Cast(F("total_questions"), FloatField()), 0.0)
+)
+
+
+def get_quiz_stats(user):
+    """Return the quiz statistics of a user.
+
+    The current streak counts the completed quizzes after the most recent
+    failed one, i.e. the run of passed quizzes ending with the latest.
+
+    Returns:
+        Dict with total_quizzes, total_completed, average_score,
+        quizzes_passed, current_streak and by_era.
+    """
+    quizzes = Quiz.objects.filter(user=user)
+    failures = quizzes.filter(COMPLETED).exclude(PASSED)
+    last_failure = failures.order_by("-completed_at").values("completed_at")[:1]
+    streak = COMPLETED & (
+        Q(completed_at__gt=Subquery(last_failure)) | ~Q(Exists(failures))
+    )
+
+    groups = list(
+        quizzes.values("era__id", "era__name")
+        .annotate(
+            quizzes=Count("id"),
+            completed=Count("id", filter=COMPLETED),
+            # Quizzes without questions have no percentage score
+            scored=Count("id", filter=COMPLETED & Q(total_questions__gt=0)),
+            score_sum=Sum(PERCENTAGE_SCORE, filter=COMPLETED),
+            passed=Count("id", filter=PASSED),
+            streak=Count("id", filter=streak),
+        )
+        .order_by("era__id")
+    )
+
+    scored = sum(group["scored"] for group in groups)
+    score_sum = sum(group["score_sum"] or 0.0 for group in groups)
+    return {
+        "total_quizzes": sum(group["quizzes"] for group in groups),
+        "total_completed": sum(group["completed"] for group in groups),
+        "average_score": round(score_sum / scored if scored else 0.0, 1),
+        "quizzes_passed": sum(group["passed"] for group in groups),
+        "current_streak": sum(group["streak"] for group in groups),
+        "by_era": [
+            {
+                "era_id": group["era__id"],
+                "era_name": group["era__name"] or "All Eras",
+                "quizzes_completed": group["completed"],
+                "average_score": round(
+                    group["score_sum"] / group["scored"] if group["scored"] else 0, 1
+                ),
+            }
+            for group in groups
+            if group["completed"]
+        ],
+    }
@@ -0,0 +1,76 @@
+"""Incremental parsing of streamed quiz generation output.
+
+The generation prompt asks for ``{"questions": [{...}, {...}]}``. Instead
+of waiting for the whole document, ``QuestionStreamParser`` is fed the
+streamed text and returns each question object as soon as its closing
+brace arrives, so the question can be saved and shown while the rest of
+the quiz is still being generated. A response cut off by the token limit
+still yields the questions that were completed before it.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nesting depth of a question object: document -> "questions" array -> question
+QUESTION_DEPTH = 3
+
+
+class QuestionStreamParser:
+    """Extract complete question objects from streamed JSON text.
+
+    Only nesting and string boundaries are tracked, so each chunk is
+    scanned once and only the text of the question being streamed is kept.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current = None
+
+    def feed(self, text):
+        """Consume the next chunk of streamed text.
+
+        Args:
+            text: The next piece of the model's output.
+
+        Returns:
+            A list of the question dicts completed by this chunk.
+        """
+        completed = []
+        for char in text:
+            if self._current is not None:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "{" and self._depth == QUESTION_DEPTH:
+                    self._current = [char]
+            elif char in "}]":
+                self._depth -= 1
+                if self._current is not None and self._depth < QUESTION_DEPTH:
+                    question = self._decode("".join(self._current))
+                    self._current = None
+                    if question is not None:
+                        completed.append(question)
+        return completed
+
+    @staticmethod
+    def _decode(text):
+        try:
+            question = json.loads(text)
+        except ValueError:
+            logger.warning("Skipping unparseable generated question: %.200s", text)
+            return None
+        return question if isinstance(question, dict) else None
@@ -0,0 +1,168 @@
+"""Celery tasks for the quiz app.
+
+Quiz creation only stores a ``pending`` Quiz and queues
+``generate_quiz`` once the transaction commits, so the request returns
+immediately and no database transaction or web worker is held during the
+OpenAI call. Clients follow progress through the quiz ``status`` action.
+
+``top_up_question_bank`` refills a question bank pool in the background
+(see ``apps.quiz.bank``), and ``fail_stale_quizzes`` runs on the beat
+schedule to fail quizzes whose generation task died or was lost.
+"""
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.eras.models import Era
+from apps.llm.breaker import CircuitOpenError
+from apps.llm.budget import BudgetExceededError
+
+from .bank import missing_questions, top_up_bank
+from .models import Quiz
+from .services import QuizGenerationAbandonedError, generate_quiz_questions
+
+logger = logging.getLogger(__name__)
+
+# Retries while the OpenAI circuit breaker is open, spaced by its
+# retry_after, before the quiz is marked failed
+MAX_UNAVAILABLE_RETRIES = 3
+
+# Only one top-up per pool runs at a time; the lock expires on its own if
+# a worker dies holding it
+TOP_UP_LOCK_SECONDS = 300
+
+
+@shared_task(bind=True, max_retries=MAX_UNAVAILABLE_RETRIES)
+def generate_quiz(self, quiz_id):
+    """Generate the questions of a pending quiz.
+
+    The quiz is claimed by moving it from ``pending`` to ``generating``
+    under a row lock, so a task delivered twice generates it only once.
+    While the OpenAI circuit breaker is open the task is retried, keeping
+    the questions saved so far; a quiz that fails loses its partial
+    questions.
+
+    Args:
+        quiz_id: Primary key of the Quiz.
+    """
+    with transaction.atomic():
+        quiz = (
+            Quiz.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(pk=quiz_id, status=Quiz.Status.PENDING)
+            .select_related("era", "user")
+            .first()
+        )
+        if quiz is None:
+            # Already generated, being generated, or deleted
+            return
+        quiz.status = Quiz.Status.GENERATING
+        quiz.generation_started_at = timezone.now()
+        quiz.save(update_fields=["status", "generation_started_at"])
+
+    try:
+        generate_quiz_questions(quiz)
+    except QuizGenerationAbandonedError as e:
+        logger.warning("Stopped generating quiz %s: %s", quiz_id, e)
+    except CircuitOpenError as e:
+        if self.request.retries < self.max_retries:
+            logger.warning("Requeueing quiz %s generation: %s", quiz_id, e)
+            Quiz.objects.filter(pk=quiz_id, status=Quiz.Status.GENERATING).update(
+                status=Quiz.Status.PENDING
+            )
+            raise self.retry(countdown=max(1, int(e.retry_after))) from e
+        _fail(quiz, "The AI service is temporarily unavailable. Please try again.")
+    except BudgetExceededError:
+        _fail(quiz, "Daily AI usage limit reached. Try again after the reset.")
+    except Exception as e:
+        logger.exception("Failed to generate quiz %s: %s", quiz_id, e)
+        _fail(quiz, "Failed to generate quiz questions. Please try again.")
+
+
+def _fail(quiz, message):
+    with transaction.atomic():
+        quiz.questions.all().delete()
+        quiz.status = Quiz.Status.FAILED
+        quiz.generation_error = message
+        quiz.save(update_fields=["status", "generation_error"])
+
+
+@shared_task
+def fail_stale_quizzes():
+    """Fail quizzes whose generation has stalled.
+
+    A worker that dies while generating leaves its quiz ``generating``
+    forever, and a lost task or retry leaves it ``pending``. Quizzes in
+    either state whose last generation attempt started (or, if none has,
+    that were created) more than ``QUIZ_GENERATION_TIMEOUT_SECONDS`` ago
+    are marked failed, so clients stop polling them. A worker that is
+    still generating a swept quiz stops at its next question.
+
+    Returns:
+        The number of quizzes failed.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.QUIZ_GENERATION_TIMEOUT_SECONDS
+    )
+    unfinished = [Quiz.Status.PENDING, Quiz.Status.GENERATING]
+    stale_ids = list(
+        Quiz.objects.annotate(
+            attempt_started_at=Coalesce("generation_started_at", "created_at")
+        )
+        .filter(status__in=unfinished, attempt_started_at__lt=cutoff)
+        .values_list("id", flat=True)
+    )
+    failed = 0
+    for quiz_id in stale_ids:
+        with transaction.atomic():
+            quiz = (
+                Quiz.objects.select_for_update(skip_locked=True)
+                .filter(pk=quiz_id, status__in=unfinished)
+                .first()
+            )
+            if quiz is None:
+                continue
+            logger.warning("Failing quiz %s: generation timed out", quiz_id)
+            _fail(quiz, "Failed to generate quiz questions. Please try again.")
+            failed += 1
+    return failed
+
+
+def schedule_bank_top_up(era_id, difficulty):
+    """Queue a top-up of a question bank pool if it is below its target."""
+    if missing_questions(era_id, difficulty):
+        top_up_question_bank.delay(era_id, difficulty)
+
+
+@shared_task
+def top_up_question_bank(era_id, difficulty):
+    """Fill a question bank pool up to its target, one batch per call.
+
+    Requeues itself while the pool is still short and the last batch
+    added questions, so a pool that OpenAI keeps answering with
+    duplicates does not loop.
+
+    Args:
+        era_id: Era of the pool, or None for the "All Eras" pool.
+        difficulty: Difficulty of the pool.
+    """
+    lock = f"quiz:bank-top-up:{era_id}:{difficulty}"
+    if not cache.add(lock, 1, TOP_UP_LOCK_SECONDS):
+        return
+    try:
+        era = Era.objects.get(pk=era_id) if era_id is not None else None
+        added = top_up_bank(era, difficulty)
+    except (Era.DoesNotExist, CircuitOpenError, BudgetExceededError) as e:
+        logger.info("Skipping question bank top-up: %s", e)
+        return
+    finally:
+        cache.delete(lock)
+
+    if added and missing_questions(era_id, difficulty):
+        top_up_question_bank.delay(era_id, difficulty)
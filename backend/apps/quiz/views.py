@@ -6,29 +6,52 @@ completing quizzes, and viewing quiz statistics.
 
 import logging
 
-from django.db import transaction
-from django.db.models import Avg, Count, F, FloatField
-from django.db.models.functions import Cast
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from apps.llm.breaker import CircuitOpenError
+from apps.llm.budget import BudgetExceededError
+from apps.llm.exceptions import ProviderUnavailableError, UsageLimitExceededError
+
+from .bank import fill_quiz_from_bank
+from .grading import grade_answer, grade_quiz_answers
 from .models import Quiz, QuizQuestion
+from .review import create_review_quiz, record_answers
 from .serializers import (
     QuizAnswerSerializer,
+    QuizAnswersSerializer,
     QuizCreateSerializer,
     QuizListSerializer,
     QuizSerializer,
+    QuizStatusSerializer,
 )
-from .services import generate_quiz_questions, grade_short_answer
+from .services import check_generation_available
+from .stats import get_quiz_stats
+from .tasks import generate_quiz, schedule_bank_top_up
 from .throttles import QuizBurstThrottle, QuizRateThrottle
 
 logger = logging.getLogger(__name__)
 
+# Quiz columns read by QuizListSerializer
+LIST_FIELDS = [
+    "id",
+    "era",
+    "era__name",
+    "difficulty",
+    "score",
+    "total_questions",
+    "status",
+    "completed_at",
+    "created_at",
+]
+
 
 class QuizViewSet(viewsets.ModelViewSet):
     """ViewSet for managing quizzes.
@@ -37,8 +60,11 @@ class QuizViewSet(viewsets.ModelViewSet):
     - GET    /api/quiz/quizzes/                  - List user's quizzes
     - POST   /api/quiz/quizzes/                  - Create a new quiz
     - GET    /api/quiz/quizzes/{id}/             - Retrieve a quiz
+    - GET    /api/quiz/quizzes/{id}/status/      - Poll question generation
     - POST   /api/quiz/quizzes/{id}/submit-answer/ - Submit an answer
+    - POST   /api/quiz/quizzes/{id}/submit-answers/ - Submit several answers
     - POST   /api/quiz/quizzes/{id}/complete/    - Mark quiz as completed
+    - POST   /api/quiz/quizzes/review/           - Start a review of due questions
 
     All endpoints require authentication and only return quizzes
     belonging to the authenticated user.
@@ -48,8 +74,8 @@ class QuizViewSet(viewsets.ModelViewSet):
     http_method_names = ["get", "post"]
 
     def get_throttles(self):
-        """Apply rate limiting only to quiz creation."""
-        if self.action == "create":
+        """Apply rate limiting only to quiz creation, reviews included."""
+        if self.action in ("create", "review"):
             return [QuizBurstThrottle(), QuizRateThrottle()]
         return []
 
@@ -59,11 +85,18 @@ class QuizViewSet(viewsets.ModelViewSet):
             return QuizCreateSerializer
         elif self.action == "list":
             return QuizListSerializer
+        elif self.action == "status":
+            return QuizStatusSerializer
         return QuizSerializer
 
     def get_queryset(self):
-        """Return quizzes for the authenticated user."""
-        queryset = Quiz.objects.filter(user=self.request.user).select_related("era")
+        """Return quizzes for the authenticated user.
+
+        Each action loads only what it uses: ``list`` selects the list
+        columns and counts answers in subqueries, ``status`` counts the saved
+        questions, and only ``retrieve`` prefetches the questions.
+        """
+        queryset = Quiz.objects.filter(user=self.request.user)
 
         # Filter by era if specified
         era_id = self.request.query_params.get("era")
@@ -77,24 +110,94 @@ class QuizViewSet(viewsets.ModelViewSet):
         elif completed == "false":
             queryset = queryset.filter(completed_at__isnull=True)
 
-        return queryset.prefetch_related("questions")
+        if self.action == "list":
+            return (
+                queryset.select_related("era")
+                .only(*LIST_FIELDS)
+                .annotate(
+                    questions_answered=_question_count(is_correct__isnull=False),
+                    correct_answers=_question_count(is_correct=True),
+                )
+            )
+        if self.action == "status":
+            return queryset.annotate(questions_ready=Count("questions"))
+        if self.action == "retrieve":
+            return queryset.select_related("era").prefetch_related(
+                Prefetch(
+                    "questions", queryset=QuizQuestion.objects.select_related("source")
+                )
+            )
+        return queryset.select_related("era")
+
+    def create(self, request, *args, **kwargs):
+        """Create a quiz from the question bank, or queue its generation.
+
+        When the question bank holds enough questions the user has not
+        seen, returns 201 with a ``ready`` quiz. Otherwise returns 201 with
+        the quiz in ``pending`` status; clients poll the ``status`` action
+        until it is ``ready`` (or ``failed``), and can answer questions as
+        soon as ``questions_ready`` shows them, before the rest are
+        generated. Either way the bank pool is topped up in the background
+        if it is running low. Requests
+        carrying an ``Idempotency-Key`` header that was already used by
+        this user return the existing quiz with 200 instead of creating a
+        second one, so retried requests are safe.
+        """
+        key = request.headers.get("Idempotency-Key", "").strip()[:64]
+        if key:
+            existing = self._get_idempotent(key)
+            if existing is not None:
+                return Response(QuizSerializer(existing).data)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-    def perform_create(self, serializer):
-        """Create quiz and generate questions via OpenAI."""
         try:
             with transaction.atomic():
-                quiz = serializer.save(user=self.request.user)
-                generate_quiz_questions(quiz)
-        except Exception as e:
-            logger.exception("Failed to generate quiz questions: %s", e)
-            raise ValidationError(
-                {"detail": "Failed to generate quiz questions. Please try again."}
-            )
+                quiz = serializer.save(user=request.user, idempotency_key=key)
+                if not fill_quiz_from_bank(quiz):
+                    check_generation_available(request.user.id)
+                    transaction.on_commit(lambda: generate_quiz.delay(quiz.id))
+                transaction.on_commit(
+                    lambda: schedule_bank_top_up(quiz.era_id, quiz.difficulty)
+                )
+        except CircuitOpenError as e:
+            logger.warning("Refusing quiz creation: %s", e)
+            raise ProviderUnavailableError() from e
+        except BudgetExceededError as e:
+            raise UsageLimitExceededError(e.reset_at, e.retry_after) from e
+        except IntegrityError:
+            # A concurrent request with the same key created it first
+            if not key:
+                raise
+            existing = self._get_idempotent(key)
+            if existing is None:
+                raise
+            return Response(QuizSerializer(existing).data)
+
+        return Response(QuizSerializer(quiz).data, status=status.HTTP_201_CREATED)
+
+    def _get_idempotent(self, key):
+        return (
+            Quiz.objects.filter(user=self.request.user, idempotency_key=key)
+            .select_related("era")
+            .first()
+        )
+
+    @action(detail=True, methods=["get"])
+    def status(self, request, pk=None):
+        """Return the question generation status of a quiz."""
+        return Response(QuizStatusSerializer(self.get_object()).data)
 
     @action(detail=True, methods=["post"])
     def submit_answer(self, request, pk=None):
         """Submit an answer to a question."""
         quiz = self.get_object()
+        if quiz.completed_at:
+            return Response(
+                {"error": "Quiz already completed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         serializer = QuizAnswerSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -110,12 +213,12 @@ class QuizViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
+        first_grade = question.is_correct is None
+
         # Grade the answer
         if question.question_type == QuizQuestion.QuestionType.SHORT_ANSWER:
-            is_correct, feedback = grade_short_answer(
-                question.question_text,
-                question.correct_answer,
-                answer,
+            is_correct, feedback = grade_answer(
+                question, answer, user_id=request.user.id
             )
             question.feedback = feedback
         else:
@@ -123,25 +226,90 @@ class QuizViewSet(viewsets.ModelViewSet):
 
         question.user_answer = answer
         question.is_correct = is_correct
-        question.save()
+        question.save(update_fields=["user_answer", "is_correct", "feedback"])
+        if first_grade:
+            record_answers(request.user, [question])
+
+        return Response(self._answer_result(question))
+
+    @action(detail=True, methods=["post"])
+    def submit_answers(self, request, pk=None):
+        """Submit and grade several answers in one request.
+
+        Short answers that need the LLM are graded in one combined call.
+        Returns ``{"results": [...]}`` with one ``submit_answer`` response
+        per answer.
+        """
+        quiz = self.get_object()
+        if quiz.completed_at:
+            return Response(
+                {"error": "Quiz already completed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = QuizAnswersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        graded_before = _graded_question_ids(quiz)
+        try:
+            questions = grade_quiz_answers(
+                quiz, serializer.validated_data["answers"], user_id=request.user.id
+            )
+        except QuizQuestion.DoesNotExist:
+            return Response(
+                {"error": "Question not found in this quiz."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        record_answers(
+            request.user, [q for q in questions if q.id not in graded_before]
+        )
 
+        return Response({"results": [self._answer_result(q) for q in questions]})
+
+    @action(detail=False, methods=["post"])
+    def review(self, request):
+        """Create a quiz from the user's questions due for review.
+
+        Questions the user answered wrongly come back on a spaced
+        repetition schedule (see ``apps.quiz.review``). Returns 201 with a
+        ``ready`` quiz, built without an LLM call, or 400 if nothing is
+        due. While the user has an uncompleted review quiz, returns it with
+        200 instead of starting another one. Rate limited like quiz
+        creation.
+        """
+        quiz, created = create_review_quiz(request.user)
+        if quiz is None:
+            return Response(
+                {"error": "No questions are due for review."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         return Response(
-            {
-                "question_id": question.id,
-                "is_correct": is_correct,
-                "correct_answer": question.correct_answer,
-                "explanation": question.explanation,
-                "feedback": (
-                    question.feedback
-                    if question.question_type == QuizQuestion.QuestionType.SHORT_ANSWER
-                    else None
-                ),
-            }
+            QuizSerializer(quiz).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
         )
 
+    @staticmethod
+    def _answer_result(question):
+        return {
+            "question_id": question.id,
+            "is_correct": question.is_correct,
+            "correct_answer": question.correct_answer,
+            "explanation": question.explanation,
+            "feedback": (
+                question.feedback
+                if question.question_type == QuizQuestion.QuestionType.SHORT_ANSWER
+                else None
+            ),
+        }
+
     @action(detail=True, methods=["post"])
     def complete(self, request, pk=None):
-        """Mark quiz as completed and calculate score."""
+        """Mark quiz as completed and calculate score.
+
+        The request may carry the quiz's answers (same body as
+        ``submit_answers``), so that they are graded and the quiz completed
+        in one round trip; their results are returned under ``results``.
+        """
         quiz = self.get_object()
 
         if quiz.completed_at:
@@ -149,22 +317,76 @@ class QuizViewSet(viewsets.ModelViewSet):
                 {"error": "Quiz already completed."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if quiz.status != Quiz.Status.READY:
+            return Response(
+                {"error": "Quiz questions are still being generated."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        questions = None
+        if "answers" in request.data:
+            serializer = QuizAnswersSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            graded_before = _graded_question_ids(quiz)
+            try:
+                questions = grade_quiz_answers(
+                    quiz, serializer.validated_data["answers"], user_id=request.user.id
+                )
+            except QuizQuestion.DoesNotExist:
+                return Response(
+                    {"error": "Question not found in this quiz."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            record_answers(
+                request.user, [q for q in questions if q.id not in graded_before]
+            )
 
         # Calculate score
         quiz.score = quiz.questions.filter(is_correct=True).count()
         quiz.completed_at = timezone.now()
-        quiz.save()
+        # Grading adds its token usage with F() updates; don't overwrite them
+        quiz.save(update_fields=["score", "completed_at"])
+
+        data = {
+            "id": quiz.id,
+            "score": quiz.score,
+            "total_questions": quiz.total_questions,
+            "percentage_score": quiz.percentage_score,
+            "passed": quiz.passed,
+            "completed_at": quiz.completed_at,
+        }
+        if questions is not None:
+            data["results"] = [self._answer_result(q) for q in questions]
+        return Response(data)
+
+
+def _graded_question_ids(quiz):
+    """Return the ids of a quiz's questions that have already been graded.
+
+    Only the first grade of a question goes into the review schedule, so
+    answering it again before completing the quiz cannot reschedule it.
+    """
+    return set(
+        quiz.questions.filter(is_correct__isnull=False).values_list("id", flat=True)
+    )
 
-        return Response(
-            {
-                "id": quiz.id,
-                "score": quiz.score,
-                "total_questions": quiz.total_questions,
-                "percentage_score": quiz.percentage_score,
-                "passed": quiz.passed,
-                "completed_at": quiz.completed_at,
-            }
-        )
+
+def _question_count(**filters):
+    """Count a quiz's questions matching ``filters`` in a subquery.
+
+    Unlike a joined Count, the subquery is left out of the pagination
+    count and only evaluated for the quizzes on the page.
+    """
+    return Coalesce(
+        Subquery(
+            QuizQuestion.objects.filter(quiz=OuterRef("pk"), **filters)
+            .order_by()
+            .values("quiz")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
 
 
 class QuizStatsView(GenericAPIView):
@@ -180,71 +402,4 @@ class QuizStatsView(GenericAPIView):
 
     def get(self, request):
         """Get user's quiz statistics."""
-        user = request.user
-
-        # Get all completed quizzes for the user
-        completed_quizzes = Quiz.objects.filter(
-            user=user, completed_at__isnull=False
-        ).select_related("era")
-
-        total_quizzes = Quiz.objects.filter(user=user).count()
-        total_completed = completed_quizzes.count()
-
-        # Calculate average percentage score
-        avg_score = (
-            completed_quizzes.aggregate(
-                avg=Avg(
-                    Cast(F("score"), FloatField())
-                    * 100.0
-                    / Cast(F("total_questions"), FloatField())
-                )
-            )["avg"]
-            or 0.0
-        )
-
-        # Count quizzes passed (>=70%)
-        quizzes_passed = sum(1 for q in completed_quizzes if q.passed)
-
-        # Calculate current streak (consecutive passed quizzes from most recent)
-        current_streak = 0
-        for quiz in completed_quizzes.order_by("-completed_at"):
-            if quiz.passed:
-                current_streak += 1
-            else:
-                break
-
-        # Get stats by era
-        by_era = []
-        era_stats = (
-            completed_quizzes.values("era__id", "era__name")
-            .annotate(
-                quizzes_completed=Count("id"),
-                avg_score=Avg(
-                    Cast(F("score"), FloatField())
-                    * 100.0
-                    / Cast(F("total_questions"), FloatField())
-                ),
-            )
-            .order_by("era__id")
-        )
-
-        for stat in era_stats:
-            by_era.append(
-                {
-                    "era_id": stat["era__id"],
-                    "era_name": stat["era__name"] or "All Eras",
-                    "quizzes_completed": stat["quizzes_completed"],
-                    "average_score": round(stat["avg_score"] or 0, 1),
-                }
-            )
-
-        return Response(
-            {
-                "total_quizzes": total_quizzes,
-                "total_completed": total_completed,
-                "average_score": round(avg_score, 1),
-                "quizzes_passed": quizzes_passed,
-                "current_streak": current_streak,
-                "by_era": by_era,
-            }
-        )
+        return Response(get_quiz_stats(request.user))
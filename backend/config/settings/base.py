@@ -51,6 +51,7 @@ LOCAL_APPS = [
     "apps.quiz",
     "apps.progress",
     "apps.sharing",
+    "apps.llm",
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -232,10 +233,175 @@ CSRF_TRUSTED_ORIGINS = config(
 # Anthropic API (Claude)
 ANTHROPIC_API_KEY = config("ANTHROPIC_API_KEY", default="")
 ANTHROPIC_MODEL = config("ANTHROPIC_MODEL", default="claude-haiku-4-5-20251001")
+# Optional API base URL override (e.g. a proxy or a local test server)
+ANTHROPIC_BASE_URL = config("ANTHROPIC_BASE_URL", default="")
+# Seconds to wait for a connection or the next streamed chunk
+ANTHROPIC_TIMEOUT = config("ANTHROPIC_TIMEOUT", default=30.0, cast=float)
+
+# Chat retrieval (RAG)
+# Candidates fetched from pgvector before MMR diversification selects top_k
+CHAT_RETRIEVAL_FETCH_K = config("CHAT_RETRIEVAL_FETCH_K", default=30, cast=int)
+CHAT_MMR_LAMBDA = config("CHAT_MMR_LAMBDA", default=0.7, cast=float)
+CHAT_MMR_MAX_PER_ITEM = config("CHAT_MMR_MAX_PER_ITEM", default=2, cast=int)
+# Adaptive candidate widening when the min_score/era filters starve results.
+# Each round doubles the window and raises hnsw.ef_search up to the caps.
+CHAT_RETRIEVAL_ADAPTIVE = config("CHAT_RETRIEVAL_ADAPTIVE", default=True, cast=bool)
+CHAT_RETRIEVAL_MAX_CANDIDATES = config(
+    "CHAT_RETRIEVAL_MAX_CANDIDATES", default=400, cast=int
+)
+CHAT_HNSW_EF_SEARCH = config("CHAT_HNSW_EF_SEARCH", default=40, cast=int)
+CHAT_HNSW_MAX_EF_SEARCH = config("CHAT_HNSW_MAX_EF_SEARCH", default=1000, cast=int)
+# pgvector >= 0.8 only: "strict_order" or "relaxed_order" enables iterative
+# index scans; leave empty on older pgvector versions.
+CHAT_HNSW_ITERATIVE_SCAN = config("CHAT_HNSW_ITERATIVE_SCAN", default="")
+# Optional CPU cross-encoder re-rank stage (falls back to vector order
+# when the latency budget is exceeded)
+CHAT_RERANK_ENABLED = config("CHAT_RERANK_ENABLED", default=False, cast=bool)
+CHAT_RERANK_MODEL = config(
+    "CHAT_RERANK_MODEL", default="cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+CHAT_RERANK_CANDIDATES = config("CHAT_RERANK_CANDIDATES", default=20, cast=int)
+CHAT_RERANK_BUDGET_MS = config("CHAT_RERANK_BUDGET_MS", default=150, cast=int)
+CHAT_RERANK_BATCH_SIZE = config("CHAT_RERANK_BATCH_SIZE", default=16, cast=int)
+# Chat model routing (apps.chat.routing): each turn is sent to a model tier
+# chosen from the message length, retrieval scores and conversation depth.
+# With routing disabled every turn uses the standard tier. Every tier
+# defaults to ANTHROPIC_MODEL, so routing only varies max_tokens until
+# CHAT_MODEL_LIGHT or CHAT_MODEL_DEEP is set.
+CHAT_ROUTING_ENABLED = config("CHAT_ROUTING_ENABLED", default=True, cast=bool)
+CHAT_MODEL_TIERS = {
+    "light": {
+        "model": config("CHAT_MODEL_LIGHT", default=ANTHROPIC_MODEL),
+        "max_tokens": config("CHAT_MAX_TOKENS_LIGHT", default=512, cast=int),
+    },
+    "standard": {
+        "model": ANTHROPIC_MODEL,
+        "max_tokens": config("CHAT_MAX_TOKENS_STANDARD", default=2048, cast=int),
+    },
+    "deep": {
+        "model": config("CHAT_MODEL_DEEP", default=ANTHROPIC_MODEL),
+        "max_tokens": config("CHAT_MAX_TOKENS_DEEP", default=4096, cast=int),
+    },
+}
+# Messages up to SHORT tokens whose best source scores below LIGHT_MAX_SCORE
+# go to the light tier. Messages of LONG tokens or more, questions whose
+# sources span MULTI_SOURCE items within FLAT_SPREAD of each other, and
+# conversations at least DEEP_HISTORY messages deep go to the deep tier.
+CHAT_ROUTING_SHORT_QUERY_TOKENS = config(
+    "CHAT_ROUTING_SHORT_QUERY_TOKENS", default=12, cast=int
+)
+CHAT_ROUTING_LONG_QUERY_TOKENS = config(
+    "CHAT_ROUTING_LONG_QUERY_TOKENS", default=80, cast=int
+)
+CHAT_ROUTING_LIGHT_MAX_SCORE = config(
+    "CHAT_ROUTING_LIGHT_MAX_SCORE", default=0.45, cast=float
+)
+CHAT_ROUTING_MULTI_SOURCE = config("CHAT_ROUTING_MULTI_SOURCE", default=3, cast=int)
+CHAT_ROUTING_FLAT_SPREAD = config("CHAT_ROUTING_FLAT_SPREAD", default=0.05, cast=float)
+CHAT_ROUTING_DEEP_HISTORY = config("CHAT_ROUTING_DEEP_HISTORY", default=12, cast=int)
+# Resumable chat SSE streams: events are buffered in the cache for
+# Last-Event-ID replay, and generation continues for RESUME_GRACE seconds
+# after the last client detaches so that a reconnect can resume it. A longer
+# grace spends more tokens on clients that never come back; 0 cancels
+# generation as soon as the last client leaves.
+CHAT_STREAM_BUFFER_TTL = config("CHAT_STREAM_BUFFER_TTL", default=300, cast=int)
+CHAT_STREAM_RESUME_GRACE = config("CHAT_STREAM_RESUME_GRACE", default=10.0, cast=float)
+# Consecutive text deltas are merged into one SSE event until this many
+# bytes are buffered or this many ms have passed (0 ms disables merging).
+CHAT_STREAM_COALESCE_BYTES = config("CHAT_STREAM_COALESCE_BYTES", default=256, cast=int)
+CHAT_STREAM_COALESCE_MS = config("CHAT_STREAM_COALESCE_MS", default=50, cast=int)
+# Idle seconds before a ": ping" comment frame keeps proxies from timing out
+CHAT_STREAM_HEARTBEAT_SECONDS = config(
+    "CHAT_STREAM_HEARTBEAT_SECONDS", default=15.0, cast=float
+)
+
+# Archived chat sessions untouched for this many days have their messages
+# moved to compressed cold storage by `manage.py archive_chat_sessions`
+CHAT_ARCHIVE_AFTER_DAYS = config("CHAT_ARCHIVE_AFTER_DAYS", default=30, cast=int)
 
 # OpenAI API (Quiz Generation)
 OPENAI_API_KEY = config("OPENAI_API_KEY", default="")
 OPENAI_MODEL = config("OPENAI_MODEL", default="gpt-4o")
+# Seconds to wait for a (non-streamed) completion
+OPENAI_TIMEOUT = config("OPENAI_TIMEOUT", default=90.0, cast=float)
+
+# Quiz question bank (apps.quiz.bank): quizzes are sampled from stored
+# questions, and each (era, difficulty) pool is topped up in the background
+# to TARGET_PER_TYPE questions per type, BATCH_PER_TYPE per OpenAI call.
+QUIZ_BANK_ENABLED = config("QUIZ_BANK_ENABLED", default=True, cast=bool)
+QUIZ_BANK_TARGET_PER_TYPE = config("QUIZ_BANK_TARGET_PER_TYPE", default=40, cast=int)
+QUIZ_BANK_BATCH_PER_TYPE = config("QUIZ_BANK_BATCH_PER_TYPE", default=5, cast=int)
+
+# Quizzes still generating this long after creation are failed by the
+# fail_stale_quizzes beat task; must exceed OPENAI_TIMEOUT plus the retries
+# made while the OpenAI circuit breaker is open.
+QUIZ_GENERATION_TIMEOUT_SECONDS = config(
+    "QUIZ_GENERATION_TIMEOUT_SECONDS", default=15 * 60, cast=int
+)
+
+# Review quizzes (apps.quiz.review) ask at most this many of the user's
+# missed questions that are due on their spaced repetition schedule.
+QUIZ_REVIEW_SESSION_SIZE = config("QUIZ_REVIEW_SESSION_SIZE", default=10, cast=int)
+
+# Era context in quiz generation prompts (apps.quiz.context) is cached per
+# era and invalidated when eras are edited; this only bounds stale entries.
+QUIZ_ERA_CONTEXT_CACHE_SECONDS = config(
+    "QUIZ_ERA_CONTEXT_CACHE_SECONDS", default=24 * 60 * 60, cast=int
+)
+
+# Source grounding of quiz generation (apps.quiz.grounding): up to
+# ROTATIONS sets of corpus excerpts per era, each within TOKEN_BUDGET, are
+# picked by MMR among the CANDIDATES chunks nearest the era's centroid and
+# rotated between quizzes. CACHE_SECONDS bounds how long new content waits.
+QUIZ_GROUNDING_ENABLED = config("QUIZ_GROUNDING_ENABLED", default=True, cast=bool)
+QUIZ_GROUNDING_TOKEN_BUDGET = config(
+    "QUIZ_GROUNDING_TOKEN_BUDGET", default=1500, cast=int
+)
+QUIZ_GROUNDING_ROTATIONS = config("QUIZ_GROUNDING_ROTATIONS", default=4, cast=int)
+QUIZ_GROUNDING_CANDIDATES = config("QUIZ_GROUNDING_CANDIDATES", default=40, cast=int)
+QUIZ_GROUNDING_CACHE_SECONDS = config(
+    "QUIZ_GROUNDING_CACHE_SECONDS", default=6 * 60 * 60, cast=int
+)
+
+# Short answer grading (apps.quiz.grading): grades are cached per question
+# and normalized answer; answers whose embedding similarity to the reference
+# answer is at least ACCEPT (or at most REJECT) are graded without the LLM.
+QUIZ_GRADE_CACHE_SECONDS = config(
+    "QUIZ_GRADE_CACHE_SECONDS", default=7 * 24 * 60 * 60, cast=int
+)
+QUIZ_GRADE_ACCEPT_SIMILARITY = config(
+    "QUIZ_GRADE_ACCEPT_SIMILARITY", default=0.85, cast=float
+)
+QUIZ_GRADE_REJECT_SIMILARITY = config(
+    "QUIZ_GRADE_REJECT_SIMILARITY", default=0.3, cast=float
+)
+
+# LLM concurrency governor (apps.llm.governor): fleet-wide limit on
+# simultaneous calls per provider, shared through the cache
+LLM_CONCURRENCY_LIMITS = {
+    "anthropic": config("LLM_ANTHROPIC_CONCURRENCY", default=16, cast=int),
+    "openai": config("LLM_OPENAI_CONCURRENCY", default=8, cast=int),
+}
+# Slot leases expire after this many seconds if a worker dies holding one
+LLM_GOVERNOR_LEASE_SECONDS = config("LLM_GOVERNOR_LEASE_SECONDS", default=300, cast=int)
+
+# LLM circuit breakers (apps.llm.breaker), one per provider/model. A breaker
+# opens when, over the window, at least MIN_CALLS calls were made and the
+# failure or slow-call rate reaches its threshold.
+LLM_BREAKER_WINDOW_SECONDS = config("LLM_BREAKER_WINDOW_SECONDS", default=60, cast=int)
+LLM_BREAKER_MIN_CALLS = config("LLM_BREAKER_MIN_CALLS", default=10, cast=int)
+LLM_BREAKER_ERROR_RATE = config("LLM_BREAKER_ERROR_RATE", default=0.5, cast=float)
+LLM_BREAKER_SLOW_RATE = config("LLM_BREAKER_SLOW_RATE", default=0.8, cast=float)
+LLM_BREAKER_SLOW_SECONDS = config("LLM_BREAKER_SLOW_SECONDS", default=10.0, cast=float)
+# Seconds an open breaker fails fast before letting one probe call through
+LLM_BREAKER_OPEN_SECONDS = config("LLM_BREAKER_OPEN_SECONDS", default=30, cast=int)
+# Retries of transient provider failures (jittered exponential backoff)
+LLM_MAX_RETRIES = config("LLM_MAX_RETRIES", default=2, cast=int)
+LLM_RETRY_BASE_DELAY = config("LLM_RETRY_BASE_DELAY", default=0.5, cast=float)
+
+# Daily LLM token budgets (apps.llm.budget), reset at UTC midnight; 0 disables
+LLM_USER_DAILY_TOKENS = config("LLM_USER_DAILY_TOKENS", default=250000, cast=int)
+LLM_GLOBAL_DAILY_TOKENS = config("LLM_GLOBAL_DAILY_TOKENS", default=20000000, cast=int)
 
 # Celery - uses Valkey (BSD-3-Clause, drop-in Redis replacement)
 # Connection URLs use redis:// protocol (Valkey is wire-compatible)
@@ -247,6 +413,36 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
+# Periodic tasks, run by the celery-beat service
+CELERY_BEAT_SCHEDULE = {
+    # Commit chat turns left in the outbox (apps.chat.persistence)
+    "flush-chat-outbox": {
+        "task": "apps.chat.tasks.flush_chat_outbox",
+        "schedule": 60.0,
+    },
+    # Fail quizzes left generating by a dead worker (apps.quiz.tasks)
+    "fail-stale-quizzes": {
+        "task": "apps.quiz.tasks.fail_stale_quizzes",
+        "schedule": 300.0,
+    },
+}
+
+# Cache - Valkey when REDIS_URL is set, per-process memory otherwise
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "toledot",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
 
 # Social sharing
 SHARE_BASE_URL = config("SHARE_BASE_URL", default="http://localhost:8000")
@@ -33,6 +33,7 @@ urlpatterns = [
     path("api/quiz/", include("apps.quiz.urls")),
     path("api/progress/", include("apps.progress.urls")),
     path("api/sharing/", include("apps.sharing.urls")),
+    path("api/llm/", include("apps.llm.urls")),
     path("accounts/", include("allauth.urls")),
     path("api/auth/", include("dj_rest_auth.urls")),
     path("api/auth/registration/", include("dj_rest_auth.registration.urls")),
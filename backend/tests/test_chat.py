@@ -4,7 +4,12 @@ Tests cover models, serializers, API endpoints, and service functions
 for the chat app's RAG-based AI teaching assistant.
 """
 
+import asyncio
+import json
+import threading
+import time
 from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
@@ -252,6 +257,66 @@ class TestChatSessionModel:
         assert chat_session.era is None
 
 
+@pytest.mark.django_db
+class TestChatSessionCounters:
+    """Test the denormalized message_count and last_message_at counters."""
+
+    def test_committed_turns_increment_counters(self, chat_session_no_era):
+        """Test that each committed turn adds its messages to the counters."""
+        from apps.chat.persistence import commit_chat_turn, enqueue_user_message
+
+        for content in ("First", "Second"):
+            turn = enqueue_user_message(chat_session_no_era, content)
+            assert commit_chat_turn(turn.id) is True
+
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.message_count == 2
+        assert chat_session_no_era.last_message_at == (
+            ChatMessage.objects.get(content="Second").created_at
+        )
+
+    def test_repair_chat_counters_command(self, chat_session_no_era, chat_session):
+        """Test that the repair command recomputes drifted counters."""
+        from django.core.management import call_command
+
+        for content in ("One", "Two", "Three"):
+            last = ChatMessage.objects.create(
+                session=chat_session_no_era,
+                role=ChatMessage.Role.USER,
+                content=content,
+            )
+        ChatSession.objects.filter(pk=chat_session.pk).update(message_count=5)
+
+        call_command("repair_chat_counters")
+
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.message_count == 3
+        assert chat_session_no_era.last_message_at == last.created_at
+        chat_session.refresh_from_db()
+        assert chat_session.message_count == 0
+        assert chat_session.last_message_at is None
+
+    def test_repair_keeps_archived_session_counters(self, chat_session):
+        """Test that repair does not reset sessions moved to the archive."""
+        from django.core.management import call_command
+
+        from apps.chat.archive import archive_session
+        from apps.chat.persistence import commit_chat_turn, enqueue_user_message
+
+        for content in ("One", "Two"):
+            commit_chat_turn(enqueue_user_message(chat_session, content).id)
+        chat_session.refresh_from_db()
+        last_message_at = chat_session.last_message_at
+        ChatSession.objects.filter(pk=chat_session.pk).update(is_archived=True)
+        assert archive_session(chat_session.id) == 2
+
+        call_command("repair_chat_counters")
+
+        chat_session.refresh_from_db()
+        assert chat_session.message_count == 2
+        assert chat_session.last_message_at == last_message_at
+
+
 @pytest.mark.django_db
 class TestChatMessageModel:
     """Test ChatMessage model."""
@@ -426,30 +491,19 @@ class TestChatSessionSerializer:
         assert "message_count" in data
 
     def test_session_serializer_message_count(self, chat_session):
-        """Test message_count annotated field."""
-        ChatMessage.objects.create(
-            session=chat_session,
-            role=ChatMessage.Role.USER,
-            content="Hello",
-        )
-        ChatMessage.objects.create(
-            session=chat_session,
-            role=ChatMessage.Role.ASSISTANT,
-            content="Hi there",
-        )
-
-        from django.db.models import Count
+        """Test message_count and last_message_at counter fields."""
+        chat_session.message_count = 2
+        chat_session.save()
 
-        annotated = ChatSession.objects.annotate(
-            message_count=Count("messages")
-        ).get(pk=chat_session.pk)
-        serializer = ChatSessionSerializer(annotated)
+        serializer = ChatSessionSerializer(chat_session)
         assert serializer.data["message_count"] == 2
+        assert "last_message_at" in serializer.data
 
     def test_session_serializer_zero_messages(self, chat_session):
-        """Test message_count defaults to 0 for unannotated instance."""
+        """Test message_count defaults to 0 for a new session."""
         serializer = ChatSessionSerializer(chat_session)
         assert serializer.data["message_count"] == 0
+        assert serializer.data["last_message_at"] is None
 
     def test_session_serializer_era_name(self, chat_session):
         """Test era_name field shows era name."""
@@ -636,6 +690,22 @@ class TestChatSessionAPI:
         assert response.data["era_name"] == "Reformation"
         assert "message_count" in response.data
 
+    def test_session_list_does_not_join_messages(
+        self, authenticated_client, chat_session
+    ):
+        """Test that listing sessions reads the stored counters."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        ChatSession.objects.filter(pk=chat_session.pk).update(message_count=4)
+        url = reverse("chat:session-list")
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"][0]["message_count"] == 4
+        assert not any("chat_chatmessage" in q["sql"] for q in queries)
+
     def test_retrieve_other_users_session(
         self, other_authenticated_client, chat_session
     ):
@@ -689,8 +759,8 @@ class TestChatMessageAPI:
         response = authenticated_client.get(url)
 
         assert response.status_code == status.HTTP_200_OK
-        # Messages endpoint has no pagination - returns a plain list
-        assert len(response.data) == 2
+        assert len(response.data["results"]) == 2
+        assert response.data["has_more"] is False
 
     def test_list_messages_chronological_order(
         self, authenticated_client, chat_session
@@ -713,8 +783,8 @@ class TestChatMessageAPI:
         )
         response = authenticated_client.get(url)
 
-        assert response.data[0]["content"] == "First"
-        assert response.data[1]["content"] == "Second"
+        assert response.data["results"][0]["content"] == "First"
+        assert response.data["results"][1]["content"] == "Second"
 
     def test_list_messages_other_user_empty(
         self, other_authenticated_client, chat_session, user_message
@@ -727,7 +797,7 @@ class TestChatMessageAPI:
         response = other_authenticated_client.get(url)
 
         # The view filters by user, so it returns empty results
-        assert len(response.data) == 0
+        assert len(response.data["results"]) == 0
 
     def test_list_messages_unauthenticated(self, api_client, chat_session):
         """Test that unauthenticated access is denied."""
@@ -749,11 +819,201 @@ class TestChatMessageAPI:
         )
         response = authenticated_client.get(url)
 
-        assistant_data = [r for r in response.data if r["role"] == "assistant"][0]
+        results = response.data["results"]
+        assistant_data = [r for r in results if r["role"] == "assistant"][0]
         assert len(assistant_data["citations"]) == 1
         assert assistant_data["citations"][0]["title"] == "Luther's 95 Theses Explained"
 
 
+@pytest.mark.django_db
+class TestChatMessageHistoryPagination:
+    """Test keyset pagination and ETags on the message history endpoint."""
+
+    @pytest.fixture
+    def history(self, chat_session):
+        """Create 7 messages, several sharing one timestamp."""
+        messages = ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(
+                    session=chat_session, role=ChatMessage.Role.USER, content=f"m{i}"
+                )
+                for i in range(7)
+            ]
+        )
+        # Ties on created_at must be broken by id
+        ChatMessage.objects.filter(id__in=[m.id for m in messages[2:5]]).update(
+            created_at=messages[2].created_at
+        )
+        return list(ChatMessage.objects.order_by("created_at", "id"))
+
+    def _get(self, client, session, **params):
+        url = reverse("chat:session-messages", kwargs={"session_id": session.id})
+        return client.get(url, params)
+
+    def _contents(self, response):
+        return [m["content"] for m in response.data["results"]]
+
+    def test_default_page_is_newest(self, authenticated_client, chat_session, history):
+        """Test the newest messages are returned in chronological order."""
+        response = self._get(authenticated_client, chat_session, limit=3)
+
+        assert self._contents(response) == ["m4", "m5", "m6"]
+        assert response.data["has_more"] is True
+
+    def test_load_older(self, authenticated_client, chat_session, history):
+        """Test walking back through history with before=<id>."""
+        response = self._get(
+            authenticated_client, chat_session, before=history[4].id, limit=3
+        )
+        assert self._contents(response) == ["m1", "m2", "m3"]
+        assert response.data["has_more"] is True
+
+        response = self._get(
+            authenticated_client, chat_session, before=history[1].id, limit=3
+        )
+        assert self._contents(response) == ["m0"]
+        assert response.data["has_more"] is False
+
+    def test_since_message(self, authenticated_client, chat_session, history):
+        """Test fetching only the messages after a known one."""
+        response = self._get(authenticated_client, chat_session, after=history[2].id)
+
+        assert self._contents(response) == ["m3", "m4", "m5", "m6"]
+        assert response.data["has_more"] is False
+
+    def test_unknown_cursor_rejected(
+        self, authenticated_client, other_user, chat_session, history
+    ):
+        """Test a cursor from another session is rejected."""
+        other = ChatSession.objects.create(user=other_user, title="Other")
+        foreign = ChatMessage.objects.create(
+            session=other, role=ChatMessage.Role.USER, content="x"
+        )
+
+        response = self._get(authenticated_client, chat_session, before=foreign.id)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_etag_not_modified(self, authenticated_client, chat_session, history):
+        """Test revalidating an unchanged page returns an empty 304."""
+        url = reverse("chat:session-messages", kwargs={"session_id": chat_session.id})
+        first = authenticated_client.get(url)
+        etag = first["ETag"]
+
+        second = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+        assert second.content == b""
+
+        ChatMessage.objects.create(
+            session=chat_session, role=ChatMessage.Role.USER, content="new"
+        )
+        third = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert third.status_code == status.HTTP_200_OK
+        assert third["ETag"] != etag
+        assert self._contents(third)[-1] == "new"
+
+
+@pytest.mark.django_db
+class TestChatSessionArchive:
+    """Test moving archived sessions' messages to cold storage."""
+
+    def _list(self, client, session, **params):
+        url = reverse("chat:session-messages", kwargs={"session_id": session.id})
+        return client.get(url, params)
+
+    def test_archive_reads_through(
+        self, authenticated_client, chat_session, user_message, citation
+    ):
+        """Test archived messages are served from the archive unchanged."""
+        from apps.chat.archive import archive_session
+
+        before = self._list(authenticated_client, chat_session).data
+
+        assert archive_session(chat_session.id) == 2
+        assert not ChatMessage.objects.exists()
+        assert not MessageCitation.objects.exists()
+
+        after = self._list(authenticated_client, chat_session)
+        assert after.status_code == status.HTTP_200_OK
+        assert after.data == before
+
+        older = self._list(
+            authenticated_client, chat_session, before=citation.message_id
+        )
+        assert [m["id"] for m in older.data["results"]] == [user_message.id]
+
+    def test_archive_not_readable_by_other_user(
+        self, other_authenticated_client, chat_session, user_message
+    ):
+        """Test the archive read-through keeps the ownership check."""
+        from apps.chat.archive import archive_session
+
+        archive_session(chat_session.id)
+        response = self._list(other_authenticated_client, chat_session)
+
+        assert response.data["results"] == []
+
+    def test_unarchive_restores_messages(
+        self, authenticated_client, chat_session, user_message, citation
+    ):
+        """Test unarchiving moves messages back with ids and timestamps."""
+        from apps.chat.archive import archive_session
+        from apps.chat.models import ChatSessionArchive
+
+        chunk = ContentChunk.objects.create(
+            content_item=citation.content_item,
+            chunk_text="Luther chunk",
+            chunk_index=0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        citation.message.retrieved_chunks.add(chunk)
+        ChatSession.objects.filter(pk=chat_session.pk).update(is_archived=True)
+        archive_session(chat_session.id)
+
+        url = reverse("chat:session-detail", kwargs={"pk": chat_session.id})
+        response = authenticated_client.patch(url, {"is_archived": False})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not ChatSessionArchive.objects.exists()
+        restored = ChatMessage.objects.get(id=user_message.id)
+        assert restored.created_at == user_message.created_at
+        assistant = ChatMessage.objects.get(id=citation.message_id)
+        assert assistant.citations.get().title == citation.title
+        assert list(assistant.retrieved_chunks.all()) == [chunk]
+
+    def test_archive_command_selects_stale_archived_sessions(
+        self, chat_session, chat_session_no_era, user_message
+    ):
+        """Test only archived, idle sessions are moved."""
+        from datetime import timedelta
+
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        from apps.chat.models import ChatSessionArchive
+
+        ChatMessage.objects.create(
+            session=chat_session_no_era, role=ChatMessage.Role.USER, content="Hi"
+        )
+        ChatSession.objects.update(
+            is_archived=True,
+            message_count=1,
+            updated_at=timezone.now() - timedelta(days=40),
+        )
+        ChatSession.objects.filter(pk=chat_session_no_era.pk).update(
+            updated_at=timezone.now()
+        )
+
+        call_command("archive_chat_sessions", "--older-than-days", "30")
+
+        assert list(ChatSessionArchive.objects.values_list("session", flat=True)) == [
+            chat_session.id
+        ]
+        assert ChatMessage.objects.filter(session=chat_session_no_era).exists()
+
+
 @pytest.mark.django_db
 class TestChatStreamAPI:
     """Test the chat stream endpoint."""
@@ -810,6 +1070,27 @@ class TestChatStreamAPI:
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
+    def test_stream_token_budget_exhausted(
+        self, authenticated_client, chat_session, settings
+    ):
+        """Test a fast 429 that saves nothing once the daily budget is used."""
+        from apps.chat.models import PendingChatTurn
+
+        settings.LLM_USER_DAILY_TOKENS = 100
+        url = reverse("chat:chat-stream")
+
+        response = authenticated_client.post(
+            url,
+            {"session_id": chat_session.id, "message": "Hello"},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert "reset_at" in response.data
+        assert int(response["Retry-After"]) > 0
+        assert not chat_session.messages.exists()
+        assert not PendingChatTurn.objects.exists()
+
 
 # =============================================================================
 # Service Tests
@@ -1050,3 +1331,1521 @@ class TestRetrieveRelevantChunks:
             assert len(results) <= 3
         except Exception:
             pytest.skip("pgvector not available in test database")
+
+
+class TestMMRSelect:
+    """Test the mmr_select re-ranking function."""
+
+    def test_empty_candidates(self):
+        """Test that no candidates yields an empty selection."""
+        from apps.chat.ranking import mmr_select
+
+        assert mmr_select([1.0, 0.0], [], top_k=3) == []
+
+    def test_lambda_one_is_relevance_order(self):
+        """Test that lambda=1.0 reduces to plain similarity ordering."""
+        from apps.chat.ranking import mmr_select
+
+        query = [1.0, 0.0]
+        candidates = [[0.5, 0.5], [1.0, 0.0], [0.0, 1.0], [0.9, 0.1]]
+        order = mmr_select(query, candidates, top_k=4, lambda_mult=1.0)
+        assert order == [1, 3, 0, 2]
+
+    def test_prefers_diverse_candidate(self):
+        """Test that near-duplicates are skipped in favour of a distinct chunk."""
+        from apps.chat.ranking import mmr_select
+
+        query = [1.0, 0.3, 0.0]
+        candidates = [
+            [1.0, 0.0, 0.0],
+            [0.99, 0.01, 0.0],
+            [0.98, 0.02, 0.0],
+            [0.3, 1.0, 0.0],
+        ]
+        order = mmr_select(query, candidates, top_k=2, lambda_mult=0.5)
+        assert order[0] in (0, 1, 2)
+        assert order[1] == 3
+
+    def test_per_group_cap(self):
+        """Test that no group contributes more than max_per_group items."""
+        from apps.chat.ranking import mmr_select
+
+        query = [1.0, 0.0]
+        candidates = [[1.0, 0.0], [0.99, 0.1], [0.98, 0.2], [0.1, 1.0]]
+        groups = ["a", "a", "a", "b"]
+        order = mmr_select(
+            query,
+            candidates,
+            top_k=4,
+            lambda_mult=1.0,
+            group_ids=groups,
+            max_per_group=2,
+        )
+        assert order == [0, 1, 3]
+
+    def test_top_k_larger_than_candidates(self):
+        """Test that top_k beyond the candidate count returns all candidates."""
+        from apps.chat.ranking import mmr_select
+
+        order = mmr_select([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], top_k=10)
+        assert sorted(order) == [0, 1]
+
+    @pytest.mark.benchmark
+    def test_benchmark_n100_under_one_millisecond(self):
+        """Micro-benchmark: selecting 6 of 100 384-d candidates stays sub-ms."""
+        import statistics
+        import time
+
+        import numpy as np
+
+        from apps.chat.ranking import mmr_select
+
+        rng = np.random.default_rng(0)
+        candidates = rng.standard_normal((100, 384)).astype(np.float32)
+        query = rng.standard_normal(384).astype(np.float32)
+        groups = rng.integers(0, 20, size=100)
+
+        timings = []
+        for _ in range(200):
+            start = time.perf_counter()
+            mmr_select(query, candidates, 6, group_ids=groups, max_per_group=2)
+            timings.append(time.perf_counter() - start)
+
+        assert statistics.median(timings) < 0.001
+
+
+@pytest.mark.django_db
+class TestRetrieveDiversification:
+    """Test MMR diversification inside retrieve_relevant_chunks."""
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_caps_chunks_per_content_item(
+        self, mock_embedding, content_item, content_item_2, settings
+    ):
+        """Test that one content item cannot fill every retrieved slot."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        settings.CHAT_MMR_MAX_PER_ITEM = 2
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+
+        for i in range(5):
+            ContentChunk.objects.create(
+                content_item=content_item,
+                chunk_text=f"Luther chunk {i}",
+                chunk_index=i,
+                embedding=[1.0, 0.01 * i] + [0.0] * 382,
+            )
+        ContentChunk.objects.create(
+            content_item=content_item_2,
+            chunk_text="Calvin chunk",
+            chunk_index=0,
+            embedding=[0.8, 0.6] + [0.0] * 382,
+        )
+
+        results = retrieve_relevant_chunks("Reformation", top_k=3)
+
+        item_ids = [chunk.content_item_id for chunk in results]
+        assert item_ids.count(content_item.id) == 2
+        assert content_item_2.id in item_ids
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_diversify_disabled_returns_distance_order(
+        self, mock_embedding, content_item
+    ):
+        """Test that diversify=False keeps the raw nearest-neighbour order."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        for i in range(4):
+            ContentChunk.objects.create(
+                content_item=content_item,
+                chunk_text=f"Chunk {i}",
+                chunk_index=i,
+                embedding=[1.0, 0.1 * i] + [0.0] * 382,
+            )
+
+        results = retrieve_relevant_chunks("Luther", top_k=3, diversify=False)
+
+        assert [chunk.chunk_index for chunk in results] == [0, 1, 2]
+
+
+class _FakeCrossEncoder:
+    """Stand-in cross-encoder scoring passages by a keyword match."""
+
+    def __init__(self, keyword, delay=0.0):
+        self.keyword = keyword
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        import time
+
+        self.calls += 1
+        time.sleep(self.delay)
+        # Like CrossEncoder.predict, return sigmoid-activated probabilities
+        return [0.995 if self.keyword in passage else 0.005 for _, passage in pairs]
+
+
+class TestCrossEncoderScores:
+    """Test the budgeted cross_encoder_scores stage."""
+
+    def test_scores_within_budget(self):
+        """Test that scores are returned as probabilities when on budget."""
+        from apps.chat.ranking import cross_encoder_scores
+
+        model = _FakeCrossEncoder("Calvin")
+        with patch("apps.chat.ranking.get_cross_encoder", return_value=model):
+            scores, elapsed_ms = cross_encoder_scores(
+                "Who wrote the Institutes?",
+                ["Luther text", "Calvin text"],
+                model_name="fake",
+                budget_ms=1000,
+            )
+
+        assert scores is not None
+        assert scores[1] > 0.99
+        assert scores[0] < 0.01
+        assert elapsed_ms >= 0
+
+    def test_budget_exceeded_returns_none(self):
+        """Test that a slow model stops early and signals fallback."""
+        from apps.chat.ranking import cross_encoder_scores
+
+        model = _FakeCrossEncoder("Calvin", delay=0.02)
+        with patch("apps.chat.ranking.get_cross_encoder", return_value=model):
+            scores, _ = cross_encoder_scores(
+                "query",
+                [f"passage {i}" for i in range(8)],
+                model_name="fake",
+                budget_ms=30,
+                batch_size=2,
+            )
+
+        assert scores is None
+        # The stage stops before running every batch
+        assert model.calls < 4
+
+
+@pytest.mark.django_db
+class TestRetrieveRerank:
+    """Test the cross-encoder stage inside retrieve_relevant_chunks."""
+
+    @pytest.fixture
+    def chunks(self, content_item, content_item_2):
+        """Create two chunks where vector order disagrees with the re-ranker."""
+        luther = ContentChunk.objects.create(
+            content_item=content_item,
+            chunk_text="Luther nailed the theses.",
+            chunk_index=0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        calvin = ContentChunk.objects.create(
+            content_item=content_item_2,
+            chunk_text="Calvin wrote the Institutes.",
+            chunk_index=0,
+            embedding=[0.9, 0.3] + [0.0] * 382,
+        )
+        return luther, calvin
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_rerank_reorders_and_records_stats(self, mock_embedding, chunks):
+        """Test that cross-encoder scores override vector order."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        with patch(
+            "apps.chat.ranking.get_cross_encoder",
+            return_value=_FakeCrossEncoder("Calvin"),
+        ):
+            results = retrieve_relevant_chunks(
+                "Institutes", top_k=2, rerank=True, stats=stats
+            )
+
+        assert results[0] == chunks[1]
+        assert stats["rerank_applied"] is True
+        assert "rerank_ms" in stats
+        assert "ann_ms" in stats
+        assert "mmr_ms" in stats
+        assert stats["candidates"] == 2
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_rerank_budget_fallback_keeps_vector_order(
+        self, mock_embedding, chunks, settings
+    ):
+        """Test that exceeding the budget falls back to vector order."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        settings.CHAT_RERANK_BUDGET_MS = 1
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        with patch(
+            "apps.chat.ranking.get_cross_encoder",
+            return_value=_FakeCrossEncoder("Calvin", delay=0.01),
+        ):
+            results = retrieve_relevant_chunks(
+                "Institutes", top_k=2, rerank=True, stats=stats
+            )
+
+        assert results[0] == chunks[0]
+        assert stats["rerank_applied"] is False
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_rerank_disabled_by_default(self, mock_embedding, chunks):
+        """Test that the cross-encoder is not loaded unless enabled."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        with patch("apps.chat.ranking.get_cross_encoder") as mock_loader:
+            retrieve_relevant_chunks("Institutes", top_k=2, stats=stats)
+
+        assert not mock_loader.called
+        assert "rerank_ms" not in stats
+
+
+@pytest.mark.django_db
+class TestAdaptiveRetrieval:
+    """Test adaptive candidate widening in retrieve_relevant_chunks."""
+
+    @pytest.fixture
+    def luther_chunks(self, content_item):
+        """Create four chunks close to the test query."""
+        return [
+            ContentChunk.objects.create(
+                content_item=content_item,
+                chunk_text=f"Chunk {i}",
+                chunk_index=i,
+                embedding=[1.0, 0.05 * i] + [0.0] * 382,
+            )
+            for i in range(4)
+        ]
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_records_achieved_k_and_work(self, mock_embedding, luther_chunks):
+        """Test that a satisfied first round is recorded without widening."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        results = retrieve_relevant_chunks(
+            "Luther", top_k=3, diversify=False, stats=stats
+        )
+
+        assert len(results) == 3
+        assert stats["achieved_k"] == 3
+        assert stats["rounds"] == 1
+        assert stats["rows_scanned"] == 3
+        assert stats["ef_search"] >= 3
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_widens_window_when_starved(self, mock_embedding, luther_chunks):
+        """Test that a starved index scan is retried with a wider window."""
+        from apps.chat import services
+        from apps.content import retrieval
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        real_scan = retrieval._scan_candidates
+        calls = []
+
+        def starved_scan(queryset, window, ef_search=None):
+            # Simulate HNSW returning only one row after the era filter
+            # until ef_search is raised above the initial value.
+            calls.append((window, ef_search))
+            rows = real_scan(queryset, window, ef_search)
+            return rows[:1] if len(calls) == 1 else rows
+
+        stats = {}
+        with patch.object(retrieval, "_scan_candidates", side_effect=starved_scan):
+            results = services.retrieve_relevant_chunks(
+                "Luther", top_k=3, diversify=False, stats=stats
+            )
+
+        assert len(results) == 3
+        assert stats["rounds"] == 2
+        assert calls[1][0] > calls[0][0]
+        assert calls[1][1] > calls[0][1]
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_stops_when_tail_below_min_score(self, mock_embedding, content_item):
+        """Test that widening stops once candidates fall below min_score."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        ContentChunk.objects.create(
+            content_item=content_item,
+            chunk_text="Relevant",
+            chunk_index=0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        ContentChunk.objects.create(
+            content_item=content_item,
+            chunk_text="Unrelated",
+            chunk_index=1,
+            embedding=[0.0, 1.0] + [0.0] * 382,
+        )
+
+        stats = {}
+        results = retrieve_relevant_chunks(
+            "Luther", top_k=3, diversify=False, stats=stats
+        )
+
+        assert len(results) == 1
+        assert stats["rounds"] == 1
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_stops_when_matching_rows_run_out(self, mock_embedding, luther_chunks):
+        """Test that an era with fewer than top_k chunks is not widened to the caps."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        results = retrieve_relevant_chunks(
+            "Luther", top_k=6, diversify=False, stats=stats
+        )
+
+        assert len(results) == 4
+        # The second, wider round found no new rows
+        assert stats["rounds"] == 2
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_stops_after_short_round_with_iterative_scan(
+        self, mock_embedding, luther_chunks, settings
+    ):
+        """Test that with iterative scans one short round ends widening."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        settings.CHAT_HNSW_ITERATIVE_SCAN = "relaxed_order"
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        with patch("apps.content.retrieval._scan_candidates") as scan:
+            scan.return_value = list(ContentChunk.objects.all())[:2]
+            for chunk in scan.return_value:
+                chunk.distance = 0.0
+            retrieve_relevant_chunks("Luther", top_k=6, diversify=False, stats=stats)
+
+        assert stats["rounds"] == 1
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_respects_candidate_cap(self, mock_embedding, content_item, settings):
+        """Test that widening never exceeds the configured cost caps."""
+        from apps.chat import services
+        from apps.content import retrieval
+
+        settings.CHAT_RETRIEVAL_MAX_CANDIDATES = 12
+        settings.CHAT_HNSW_MAX_EF_SEARCH = 50
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+
+        stats = {}
+        with patch.object(retrieval, "_scan_candidates", return_value=[]) as scan:
+            results = services.retrieve_relevant_chunks(
+                "Luther", top_k=3, diversify=False, stats=stats
+            )
+
+        assert results == []
+        assert all(call.args[1] <= 12 for call in scan.call_args_list)
+        assert stats["ef_search"] <= 50
+        assert stats["achieved_k"] == 0
+
+    @patch("apps.chat.services.get_query_embedding")
+    def test_adaptive_disabled_single_round(self, mock_embedding, luther_chunks):
+        """Test that adaptive=False issues exactly one query."""
+        from apps.chat.services import retrieve_relevant_chunks
+
+        mock_embedding.return_value = [1.0] + [0.0] * 383
+        stats = {}
+        retrieve_relevant_chunks(
+            "Luther", top_k=3, diversify=False, adaptive=False, stats=stats
+        )
+
+        assert stats["rounds"] == 1
+        assert "ef_search" not in stats
+
+
+class TestCitationMatcher:
+    """Test the incremental CitationMatcher."""
+
+    @pytest.fixture
+    def chunks(self, content_item, content_item_2):
+        """Return stand-in chunks for two different content items."""
+        chunk1 = MagicMock()
+        chunk1.content_item = content_item
+        chunk2 = MagicMock()
+        chunk2.content_item = content_item_2
+        return [chunk1, chunk2]
+
+    @pytest.mark.django_db
+    def test_title_split_across_deltas(self, chunks):
+        """Test that a title spanning several deltas is still matched."""
+        from apps.chat.citations import CitationMatcher
+
+        matcher = CitationMatcher(chunks)
+        assert matcher.feed("As Calvin's Inst") == []
+        new = matcher.feed("itutes Overview explains...")
+        assert [c["title"] for c in new] == ["Calvin's Institutes Overview"]
+
+    @pytest.mark.django_db
+    def test_partial_source_notation(self, chunks):
+        """Test that [Source: ...] with part of a title matches on close."""
+        from apps.chat.citations import CitationMatcher
+
+        matcher = CitationMatcher(chunks)
+        assert matcher.feed("Indulgences were criticised [Source: Luther's 95") == []
+        new = matcher.feed(" Theses]")
+        assert [c["title"] for c in new] == ["Luther's 95 Theses Explained"]
+
+    @pytest.mark.django_db
+    def test_each_source_reported_once(self, chunks):
+        """Test that repeated references do not produce repeated citations."""
+        from apps.chat.citations import CitationMatcher
+
+        matcher = CitationMatcher(chunks)
+        matcher.feed("Calvin's Institutes Overview ")
+        assert matcher.feed("and again Calvin's Institutes Overview") == []
+        assert len(matcher.citations) == 1
+
+    @pytest.mark.django_db
+    def test_citations_in_first_reference_order(self, chunks):
+        """Test that streamed citations follow the order of first mention."""
+        from apps.chat.citations import CitationMatcher
+
+        matcher = CitationMatcher(chunks)
+        matcher.feed("Calvin's Institutes Overview, then Luther's 95 Theses Explained")
+        assert [c["title"] for c in matcher.citations] == [
+            "Calvin's Institutes Overview",
+            "Luther's 95 Theses Explained",
+        ]
+        assert [c["title"] for c in matcher.citations_in_context_order()] == [
+            "Luther's 95 Theses Explained",
+            "Calvin's Institutes Overview",
+        ]
+
+    def test_aho_corasick_overlapping_patterns(self):
+        """Test that overlapping and nested patterns are all reported."""
+        from apps.chat.citations import AhoCorasick
+
+        automaton = AhoCorasick(["he", "she", "hers"])
+        state = 0
+        found = []
+        for char in "ushers":
+            state, matches = automaton.step(state, char)
+            found.extend(matches)
+        assert sorted(found) == [0, 1, 2]
+
+
+def fake_anthropic_client(deltas, input_tokens=10, output_tokens=20):
+    """Build a stand-in AsyncAnthropic client that streams ``deltas``."""
+
+    async def text_stream():
+        for delta in deltas:
+            yield delta
+
+    stream = MagicMock()
+    stream.text_stream = text_stream()
+    stream.get_final_message = AsyncMock(
+        return_value=MagicMock(
+            usage=MagicMock(input_tokens=input_tokens, output_tokens=output_tokens)
+        )
+    )
+    stream_manager = MagicMock()
+    stream_manager.__aenter__ = AsyncMock(return_value=stream)
+    stream_manager.__aexit__ = AsyncMock(return_value=False)
+
+    client = MagicMock()
+    client.messages.stream.return_value = stream_manager
+    return client
+
+
+def collect_stream_events(session, message, era=None):
+    """Run stream_chat_response to completion and return its events."""
+    from asgiref.sync import async_to_sync
+
+    from apps.chat.services import stream_chat_response
+
+    async def collect():
+        return [event async for event in stream_chat_response(session, message, era)]
+
+    return async_to_sync(collect)()
+
+
+@pytest.mark.django_db
+class TestStreamChatCitations:
+    """Test citation events emitted by stream_chat_response."""
+
+    def test_citation_event_emitted_mid_stream(
+        self, chat_session_no_era, content_item
+    ):
+        """Test that a citation event follows the delta that completes it."""
+        chunk = ContentChunk.objects.create(
+            content_item=content_item,
+            chunk_text="Luther chunk",
+            chunk_index=0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        client = fake_anthropic_client(
+            ["Luther wrote ", "[Source: Luther's 95 Theses", " Explained]", " later."]
+        )
+
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[chunk]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+        ):
+            events = collect_stream_events(chat_session_no_era, "Who was Luther?")
+
+        types = [event["type"] for event in events]
+        assert types == ["delta", "delta", "delta", "citation", "delta", "done"]
+        assert events[3]["citation"]["title"] == "Luther's 95 Theses Explained"
+        assert events[-1]["citations"][0]["source_name"] == "Ryan Reeves"
+
+        message = ChatMessage.objects.get(id=events[-1]["message_id"])
+        citations = list(message.citations.all())
+        assert len(citations) == 1
+        assert citations[0].content_item == content_item
+        assert citations[0].order == 0
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWriteBehindPersistence:
+    """Test the PendingChatTurn outbox used by stream_chat_response."""
+
+    def _enqueue(self, session, content_item, chunk):
+        from apps.chat.citations import build_citation
+        from apps.chat.persistence import enqueue_chat_turn
+
+        return enqueue_chat_turn(
+            session,
+            "Who was Luther?",
+            "Luther was a reformer.",
+            "claude-test",
+            11,
+            22,
+            [chunk],
+            [build_citation(content_item)],
+        )
+
+    def _chunk(self, content_item):
+        return ContentChunk.objects.create(
+            content_item=content_item,
+            chunk_text="Luther chunk",
+            chunk_index=0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+
+    def test_done_emitted_before_commit(self, chat_session_no_era, content_item):
+        """Test done only waits for the outbox row; the commit follows it."""
+        from asgiref.sync import async_to_sync
+
+        from apps.chat.models import PendingChatTurn
+        from apps.chat.services import stream_chat_response
+
+        chunk = self._chunk(content_item)
+        client = fake_anthropic_client(["Luther's 95 Theses Explained."], 5, 7)
+        observed = {}
+
+        async def consume():
+            stream = stream_chat_response(chat_session_no_era, "Who was Luther?")
+            async for event in stream:
+                if event["type"] == "done":
+                    observed["messages"] = await ChatMessage.objects.acount()
+                    observed["pending"] = await PendingChatTurn.objects.acount()
+                    observed["done"] = event
+
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[chunk]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+        ):
+            async_to_sync(consume)()
+
+        assert observed["messages"] == 0
+        assert observed["pending"] == 1
+        assert not PendingChatTurn.objects.exists()
+
+        message = ChatMessage.objects.get(id=observed["done"]["message_id"])
+        assert message.role == ChatMessage.Role.ASSISTANT
+        assert list(message.retrieved_chunks.all()) == [chunk]
+        assert message.citations.get().content_item == content_item
+        user_msg = ChatMessage.objects.get(role=ChatMessage.Role.USER)
+        assert user_msg.id < message.id
+
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.total_input_tokens == 5
+        assert chat_session_no_era.total_output_tokens == 7
+
+    def test_commit_is_idempotent(self, chat_session_no_era, content_item):
+        """Test that a turn is only written once."""
+        from apps.chat.persistence import commit_chat_turn
+
+        chunk = self._chunk(content_item)
+        turn = self._enqueue(chat_session_no_era, content_item, chunk)
+
+        assert commit_chat_turn(turn.id) is True
+        assert commit_chat_turn(turn.id) is False
+        assert ChatMessage.objects.count() == 2
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.total_input_tokens == 11
+        assert chat_session_no_era.message_count == 2
+        assert chat_session_no_era.last_message_at == (
+            ChatMessage.objects.get(id=turn.assistant_message_id).created_at
+        )
+
+    def test_failed_commit_stays_in_outbox(self, chat_session_no_era, content_item):
+        """Test that a failing commit rolls back and records the error."""
+        from apps.chat.persistence import try_commit_chat_turn
+
+        chunk = self._chunk(content_item)
+        turn = self._enqueue(chat_session_no_era, content_item, chunk)
+
+        with patch(
+            "apps.chat.persistence.MessageCitation.objects.bulk_create",
+            side_effect=RuntimeError("boom"),
+        ):
+            assert try_commit_chat_turn(turn.id) is False
+
+        turn.refresh_from_db()
+        assert turn.attempts == 1
+        assert "boom" in turn.last_error
+        assert not ChatMessage.objects.exists()
+
+    def test_flush_command_replays_pending_turns(
+        self, chat_session_no_era, content_item
+    ):
+        """Test that flush_chat_outbox commits turns left behind."""
+        from django.core.management import call_command
+
+        from apps.chat.models import PendingChatTurn
+
+        chunk = self._chunk(content_item)
+        turn = self._enqueue(chat_session_no_era, content_item, chunk)
+
+        call_command("flush_chat_outbox", "--min-age", "0")
+
+        assert not PendingChatTurn.objects.exists()
+        message = ChatMessage.objects.get(id=turn.assistant_message_id)
+        assert message.content == "Luther was a reformer."
+        assert message.citations.count() == 1
+
+    def test_flush_runs_on_beat_schedule(self, settings):
+        """Test that the outbox flush task is scheduled periodically."""
+        from apps.chat.tasks import flush_chat_outbox
+
+        tasks = [entry["task"] for entry in settings.CELERY_BEAT_SCHEDULE.values()]
+        assert flush_chat_outbox.name in tasks
+
+    def test_flush_task_replays_pending_turns(self, chat_session_no_era, content_item):
+        """Test that the periodic task commits turns older than the grace age."""
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from apps.chat.models import PendingChatTurn
+        from apps.chat.tasks import flush_chat_outbox
+
+        chunk = self._chunk(content_item)
+        turn = self._enqueue(chat_session_no_era, content_item, chunk)
+        PendingChatTurn.objects.filter(pk=turn.pk).update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        flush_chat_outbox()
+
+        assert not PendingChatTurn.objects.exists()
+        assert ChatMessage.objects.filter(id=turn.assistant_message_id).exists()
+
+    def test_unanswered_turn_keeps_user_message(self, chat_session_no_era):
+        """Test that a turn without an answer commits only the user message."""
+        from apps.chat.persistence import commit_chat_turn, enqueue_user_message
+
+        turn = enqueue_user_message(chat_session_no_era, "Who was Luther?")
+
+        assert commit_chat_turn(turn.id) is True
+        message = ChatMessage.objects.get()
+        assert message.id == turn.user_message_id
+        assert message.role == ChatMessage.Role.USER
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.message_count == 1
+        assert chat_session_no_era.total_input_tokens == 0
+
+
+class _FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Serve an endless Anthropic-style message stream, one delta per tick."""
+
+    def do_POST(self):  # noqa: N802
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        server = self.server
+        try:
+            self._event(
+                "message_start",
+                {
+                    "type": "message_start",
+                    "message": {
+                        "id": "msg_test",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": "claude-test",
+                        "content": [],
+                        "stop_reason": None,
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 42, "output_tokens": 1},
+                    },
+                },
+            )
+            self._event(
+                "content_block_start",
+                {
+                    "type": "content_block_start",
+                    "index": 0,
+                    "content_block": {"type": "text", "text": ""},
+                },
+            )
+            for _ in range(server.max_deltas):
+                self._event(
+                    "content_block_delta",
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {"type": "text_delta", "text": "word "},
+                    },
+                )
+                server.deltas_sent += 1
+                time.sleep(0.02)
+            self._event(
+                "content_block_stop", {"type": "content_block_stop", "index": 0}
+            )
+            self._event(
+                "message_delta",
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": server.max_deltas},
+                },
+            )
+            self._event("message_stop", {"type": "message_stop"})
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnected.set()
+
+    def _event(self, name, data):
+        self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_anthropic_server(settings):
+    """Run a local streaming server and point the Anthropic client at it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeAnthropicHandler)
+    server.daemon_threads = True
+    server.max_deltas = 500
+    server.deltas_sent = 0
+    server.requests = 0
+    server.disconnected = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.ANTHROPIC_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def asgi_sse_request(
+    path, payload, token, last_event_id=None, disconnect_after_deltas=None
+):
+    """POST to an SSE endpoint through the ASGI handler.
+
+    If ``disconnect_after_deltas`` is set, the client disconnects once that
+    many delta events have been received.
+
+    Returns:
+        A list of ``(event_id, event)`` tuples in the order received.
+    """
+    from django.core.handlers.asgi import ASGIHandler
+
+    body = json.dumps(payload).encode()
+    headers = [
+        (b"host", b"testserver"),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"authorization", f"Bearer {token}".encode()),
+    ]
+    if last_event_id:
+        headers.append((b"last-event-id", last_event_id.encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+    disconnect = asyncio.Event()
+    pending_body = [body]
+    events = []
+    event_id = None
+
+    async def receive():
+        if pending_body:
+            return {
+                "type": "http.request",
+                "body": pending_body.pop(),
+                "more_body": False,
+            }
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal event_id
+        if message["type"] != "http.response.body":
+            return
+        for line in message.get("body", b"").decode().splitlines():
+            if line.startswith("id: "):
+                event_id = line[len("id: ") :]
+            elif line.startswith("data: "):
+                events.append((event_id, json.loads(line[len("data: ") :])))
+        deltas = sum(1 for _, event in events if event["type"] == "delta")
+        if disconnect_after_deltas and deltas >= disconnect_after_deltas:
+            disconnect.set()
+
+    await ASGIHandler()(scope, receive, send)
+    return events
+
+
+def run_asgi_stream(path, payload, token, **kwargs):
+    """Run ``asgi_sse_request`` to completion from synchronous code."""
+    from asgiref.sync import async_to_sync
+
+    return async_to_sync(asgi_sse_request)(path, payload, token, **kwargs)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestStreamCancellation:
+    """Test that a client disconnect cancels generation upstream."""
+
+    def test_record_stream_cancelled_estimates_savings(self):
+        """Test savings are estimated from the average completed response."""
+        from apps.chat.metrics import (
+            get_stream_stats,
+            record_stream_cancelled,
+            record_stream_completed,
+            reset_stream_stats,
+        )
+
+        reset_stream_stats()
+        assert record_stream_cancelled(10, max_tokens=2048) == 2038
+
+        record_stream_completed(300)
+        record_stream_completed(500)
+        assert record_stream_cancelled(100, max_tokens=2048) == 300
+
+        stats = get_stream_stats()
+        assert stats["completed"] == 2
+        assert stats["cancelled"] == 2
+        assert stats["cancelled_output_tokens"] == 110
+        assert stats["output_tokens_saved"] == 2338
+
+    def test_disconnect_cancels_upstream_and_persists_partial(
+        self, settings, user, chat_session_no_era, fake_anthropic_server
+    ):
+        """Test disconnect closes the Anthropic stream and saves a truncated turn."""
+        from apps.chat.metrics import get_stream_stats, reset_stream_stats
+
+        settings.CHAT_STREAM_RESUME_GRACE = 0
+        reset_stream_stats()
+        token = RefreshToken.for_user(user).access_token
+
+        with patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]):
+            events = run_asgi_stream(
+                reverse("chat:chat-stream"),
+                {"session_id": chat_session_no_era.id, "message": "Tell me more"},
+                token,
+                disconnect_after_deltas=3,
+            )
+
+        assert "done" not in [event["type"] for _, event in events]
+        assert fake_anthropic_server.disconnected.wait(timeout=5)
+        assert fake_anthropic_server.deltas_sent < fake_anthropic_server.max_deltas
+
+        message = ChatMessage.objects.get(role=ChatMessage.Role.ASSISTANT)
+        assert message.is_truncated
+        assert message.content.startswith("word word word")
+        assert message.input_tokens == 42
+        assert ChatMessage.objects.filter(role=ChatMessage.Role.USER).count() == 1
+
+        stats = get_stream_stats()
+        assert stats["cancelled"] == 1
+        assert stats["cancelled_output_tokens"] == message.output_tokens
+        assert stats["output_tokens_saved"] > 0
+
+
+@pytest.mark.django_db(transaction=True)
+class TestResumableStream:
+    """Test Last-Event-ID resumption of chat streams."""
+
+    def _payload(self, session):
+        return {"session_id": session.id, "message": "Tell me more"}
+
+    def test_events_carry_stream_ids(
+        self, user, chat_session_no_era, fake_anthropic_server
+    ):
+        """Test that every event has an id of the form <stream_id>:<seq>."""
+        fake_anthropic_server.max_deltas = 3
+        token = RefreshToken.for_user(user).access_token
+
+        with patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]):
+            events = run_asgi_stream(
+                reverse("chat:chat-stream"), self._payload(chat_session_no_era), token
+            )
+
+        ids = [event_id.split(":") for event_id, _ in events]
+        assert len({stream_id for stream_id, _ in ids}) == 1
+        assert [int(seq) for _, seq in ids] == list(range(1, len(events) + 1))
+        assert events[-1][1]["type"] == "done"
+
+    def test_reconnect_attaches_to_running_generation(
+        self, user, chat_session_no_era, fake_anthropic_server
+    ):
+        """Test a reconnect continues the same generation without gaps."""
+        from asgiref.sync import async_to_sync
+
+        fake_anthropic_server.max_deltas = 30
+        token = RefreshToken.for_user(user).access_token
+        url = reverse("chat:chat-stream")
+        payload = self._payload(chat_session_no_era)
+
+        async def scenario():
+            first = await asgi_sse_request(
+                url, payload, token, disconnect_after_deltas=3
+            )
+            second = await asgi_sse_request(
+                url, payload, token, last_event_id=first[-1][0]
+            )
+            return first, second
+
+        with patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]):
+            first, second = async_to_sync(scenario)()
+
+        assert fake_anthropic_server.requests == 1
+        seqs = [int(event_id.rsplit(":", 1)[1]) for event_id, _ in first + second]
+        assert seqs == list(range(1, len(seqs) + 1))
+
+        deltas = [e["content"] for _, e in first + second if e["type"] == "delta"]
+        assert "".join(deltas) == "word " * 30
+        assert second[-1][1]["type"] == "done"
+
+        message = ChatMessage.objects.get(id=second[-1][1]["message_id"])
+        assert not message.is_truncated
+        assert message.content == "word " * 30
+
+    def test_reconnect_replays_completed_buffer(
+        self, user, chat_session_no_era, fake_anthropic_server
+    ):
+        """Test a reconnect after completion replays the buffered tail."""
+        fake_anthropic_server.max_deltas = 5
+        token = RefreshToken.for_user(user).access_token
+        url = reverse("chat:chat-stream")
+        payload = self._payload(chat_session_no_era)
+
+        with patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]):
+            events = run_asgi_stream(url, payload, token)
+            replayed = run_asgi_stream(url, payload, token, last_event_id=events[1][0])
+
+        assert fake_anthropic_server.requests == 1
+        assert replayed == events[2:]
+
+    def test_reconnect_to_unknown_stream_returns_gone(
+        self, authenticated_client, chat_session
+    ):
+        """Test that an expired or foreign stream id returns 410."""
+        from apps.chat.streams import create_stream
+
+        other_stream = create_stream(chat_session.user_id + 1000, chat_session.id)
+        url = reverse("chat:chat-stream")
+
+        for last_event_id in ["missing:3", f"{other_stream}:1", "garbage"]:
+            response = authenticated_client.post(
+                url,
+                {"session_id": chat_session.id, "message": "Hello"},
+                format="json",
+                HTTP_LAST_EVENT_ID=last_event_id,
+            )
+            assert response.status_code == status.HTTP_410_GONE
+
+    def test_stalled_generation_abandoned_without_readers(self, settings):
+        """Test readers are checked on a timer while upstream sends nothing."""
+        from asgiref.sync import async_to_sync
+
+        from apps.chat import streams
+
+        settings.CHAT_STREAM_RESUME_GRACE = 0
+        settings.CHAT_STREAM_COALESCE_MS = 0
+        closed = []
+
+        async def stalled():
+            try:
+                yield {"type": "delta", "content": "word "}
+                await asyncio.sleep(60)
+                yield {"type": "done"}
+            finally:
+                closed.append(True)
+
+        async def scenario():
+            stream_id = streams.create_stream(1, 1)
+            streams.start_stream(stream_id, stalled())
+            await asyncio.wait_for(asyncio.gather(*streams._producer_tasks), 5)
+            return stream_id
+
+        with patch.object(streams, "READER_CHECK_INTERVAL", 0.05):
+            stream_id = async_to_sync(scenario)()
+
+        assert closed == [True]
+        assert streams.cache.get(streams._key(stream_id, "end")) == 1
+
+
+async def _scripted_events(script):
+    """Yield events from ``script``; a float entry sleeps that many seconds."""
+    for entry in script:
+        if isinstance(entry, float):
+            await asyncio.sleep(entry)
+        else:
+            yield entry
+
+
+def _collect_coalesced(script, max_bytes, max_delay_ms):
+    from asgiref.sync import async_to_sync
+
+    from apps.chat.streams import coalesce_deltas
+
+    async def collect():
+        events = coalesce_deltas(_scripted_events(script), max_bytes, max_delay_ms)
+        return [event async for event in events]
+
+    return async_to_sync(collect)()
+
+
+def _delta(text):
+    return {"type": "delta", "content": text}
+
+
+class TestStreamCoalescing:
+    """Test delta coalescing and heartbeats in the SSE stream."""
+
+    def test_merges_deltas_by_size_and_before_other_events(self):
+        """Test deltas merge up to max_bytes and flush before a citation."""
+        citation = {"type": "citation", "citation": {"title": "T"}}
+        script = [_delta("ab"), _delta("cd"), _delta("ef"), citation, _delta("g")]
+        script.append({"type": "done"})
+
+        events = _collect_coalesced(script, max_bytes=4, max_delay_ms=1000)
+
+        assert events == [
+            _delta("abcd"),
+            _delta("ef"),
+            citation,
+            _delta("g"),
+            {"type": "done"},
+        ]
+
+    def test_flushes_after_max_delay(self):
+        """Test a held delta is flushed once max_delay_ms passes."""
+        script = [_delta("a"), _delta("b"), 0.2, _delta("c"), {"type": "done"}]
+
+        events = _collect_coalesced(script, max_bytes=1000, max_delay_ms=20)
+
+        assert events == [_delta("ab"), _delta("c"), {"type": "done"}]
+
+    def test_zero_delay_disables_coalescing(self):
+        """Test that max_delay_ms=0 passes events through unchanged."""
+        script = [_delta("a"), _delta("b"), {"type": "done"}]
+
+        assert _collect_coalesced(script, max_bytes=1000, max_delay_ms=0) == script
+
+    def test_heartbeat_sent_while_idle(self, settings):
+        """Test a comment frame is sent before a slow first token."""
+        from asgiref.sync import async_to_sync
+
+        from apps.chat.streams import (
+            HEARTBEAT_FRAME,
+            create_stream,
+            start_stream,
+            subscribe,
+        )
+
+        settings.CHAT_STREAM_HEARTBEAT_SECONDS = 0.05
+        script = [0.3, _delta("late"), {"type": "done"}]
+
+        async def scenario():
+            stream_id = create_stream(1, 1)
+            start_stream(stream_id, _scripted_events(script))
+            return [frame async for frame in subscribe(stream_id)]
+
+        frames = async_to_sync(scenario)()
+
+        assert frames[0] == HEARTBEAT_FRAME
+        data = [f for f in frames if f != HEARTBEAT_FRAME]
+        assert len(data) == 2
+        assert data[0].endswith('data: {"type": "delta", "content": "late"}\n\n')
+
+    def test_benchmark_frames_bytes_and_cpu_per_answer(self):
+        """Benchmark SSE frames, bytes and CPU for a 2,000-delta answer."""
+        import json as json_module
+
+        from asgiref.sync import async_to_sync
+
+        from apps.chat.streams import coalesce_deltas, format_frame
+
+        words = ["Lu", "ther", " na", "iled", " the", " 95", " The", "ses", ". "]
+        script = [_delta(words[i % len(words)]) for i in range(2000)]
+        script.append({"type": "done", "message_id": "1", "citations": []})
+
+        async def measure(max_delay_ms):
+            start = time.process_time()
+            frames = 0
+            size = 0
+            events = coalesce_deltas(_scripted_events(script), 256, max_delay_ms)
+            async for event in events:
+                frame = format_frame("0" * 32, frames + 1, json_module.dumps(event))
+                frames += 1
+                size += len(frame.encode())
+            return {
+                "frames": frames,
+                "bytes": size,
+                "cpu_ms": (time.process_time() - start) * 1000,
+            }
+
+        raw = async_to_sync(measure)(0)
+        coalesced = async_to_sync(measure)(50)
+
+        assert raw["frames"] == 2001
+        assert coalesced["frames"] <= raw["frames"] // 20
+        assert coalesced["bytes"] < raw["bytes"] / 5
+        # Coalescing overhead is paid back by serializing fewer frames
+        assert coalesced["cpu_ms"] < raw["cpu_ms"] * 1.5
+
+
+@pytest.mark.django_db
+class TestStreamChatGovernor:
+    """Test stream_chat_response when the LLM governor has no capacity."""
+
+    def test_busy_error_when_no_slot(self, chat_session_no_era):
+        """Test a fast error event and no persisted turn on governor timeout."""
+        from contextlib import asynccontextmanager
+
+        from apps.llm.governor import GovernorTimeoutError
+
+        @asynccontextmanager
+        async def no_capacity(provider, priority, deadline=None):
+            raise GovernorTimeoutError(provider, priority, 10.0)
+            yield
+
+        client = fake_anthropic_client(["never sent"])
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+            patch("apps.chat.services.agoverned", no_capacity),
+        ):
+            events = collect_stream_events(chat_session_no_era, "Hello")
+
+        assert events == [
+            {
+                "type": "error",
+                "content": "The AI service is busy. Please try again in a moment.",
+            }
+        ]
+        client.messages.stream.assert_not_called()
+        # The unanswered question stays in the history
+        assert ChatMessage.objects.get().role == ChatMessage.Role.USER
+
+
+def _scored_chunk(score, item_id):
+    """Build a stand-in retrieved chunk with a similarity ``score``."""
+    return MagicMock(distance=1 - score, content_item_id=item_id)
+
+
+class TestChatRouting:
+    """Test the model tier chosen for a chat turn."""
+
+    def test_short_unsourced_message_goes_light(self, settings):
+        """Test that small talk is sent to the light tier."""
+        from apps.chat.routing import route_chat_turn
+
+        route = route_chat_turn("thanks!", [], history_depth=4)
+
+        assert route["tier"] == "light"
+        assert route["reason"] == "short_unsourced"
+        assert route["model"] == settings.CHAT_MODEL_TIERS["light"]["model"]
+        assert route["max_tokens"] == settings.CHAT_MODEL_TIERS["light"]["max_tokens"]
+
+    def test_long_question_goes_deep(self):
+        """Test that a long question is sent to the deep tier."""
+        from apps.chat.routing import route_chat_turn
+
+        route = route_chat_turn("Explain the controversy. " * 20, [], history_depth=0)
+
+        assert route["tier"] == "deep"
+        assert route["reason"] == "long_query"
+
+    def test_flat_scores_across_sources_go_deep(self):
+        """Test that a question drawing evenly on several sources goes deep."""
+        from apps.chat.routing import route_chat_turn
+
+        chunks = [
+            _scored_chunk(0.71, 1),
+            _scored_chunk(0.70, 2),
+            _scored_chunk(0.68, 3),
+        ]
+
+        route = route_chat_turn(
+            "How did Luther and Calvin differ on the Lord's Supper?",
+            chunks,
+            history_depth=0,
+        )
+
+        assert route["tier"] == "deep"
+        assert route["reason"] == "multi_source"
+        assert route["signals"]["sources"] == 3
+        assert route["signals"]["score_spread"] == 0.03
+
+    def test_dominant_source_goes_standard(self):
+        """Test that a question answered by one strong source stays standard."""
+        from apps.chat.routing import route_chat_turn
+
+        chunks = [_scored_chunk(0.9, 1), _scored_chunk(0.5, 2), _scored_chunk(0.4, 3)]
+
+        route = route_chat_turn(
+            "What was decided at the Council of Nicaea?", chunks, history_depth=2
+        )
+
+        assert route["tier"] == "standard"
+
+    def test_deep_conversation_goes_deep(self):
+        """Test that a follow-up late in a long conversation goes deep."""
+        from apps.chat.routing import route_chat_turn
+
+        route = route_chat_turn(
+            "And how did that debate shape the later Reformed confessions?",
+            [],
+            history_depth=14,
+        )
+
+        assert route["tier"] == "deep"
+        assert route["reason"] == "deep_history"
+
+    def test_disabled_routing_uses_standard(self, settings):
+        """Test that every turn uses the standard tier when disabled."""
+        from apps.chat.routing import route_chat_turn
+
+        settings.CHAT_ROUTING_ENABLED = False
+
+        route = route_chat_turn("thanks!", [], history_depth=0)
+
+        assert route["tier"] == "standard"
+        assert route["reason"] == "disabled"
+
+
+@pytest.mark.django_db
+class TestStreamChatRouting:
+    """Test that stream_chat_response follows and logs the routing decision."""
+
+    def test_routed_model_used_and_logged(self, chat_session_no_era, settings, caplog):
+        """Test the light tier's model and max_tokens are sent and logged."""
+        settings.CHAT_MODEL_TIERS = {
+            **settings.CHAT_MODEL_TIERS,
+            "light": {"model": "claude-light", "max_tokens": 256},
+        }
+        client = fake_anthropic_client(["You're welcome!"])
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+            caplog.at_level("INFO", logger="apps.chat.routing"),
+        ):
+            events = collect_stream_events(chat_session_no_era, "thanks!")
+
+        assert events[-1]["type"] == "done"
+        kwargs = client.messages.stream.call_args.kwargs
+        assert kwargs["model"] == "claude-light"
+        assert kwargs["max_tokens"] == 256
+        assert ChatMessage.objects.get(role="assistant").model_used == "claude-light"
+
+        record = json.loads(caplog.records[-1].getMessage().split(": ", 1)[1])
+        assert record["tier"] == "light"
+        assert record["outcome"] == "completed"
+        assert record["output_tokens"] == 20
+        assert record["first_token_ms"] is not None
+
+
+@pytest.mark.django_db
+class TestStreamChatBudget:
+    """Test token budget reconciliation in stream_chat_response."""
+
+    def test_reservation_reconciled_with_usage(self, chat_session_no_era, user):
+        """Test the reserved estimate is replaced by the reported usage."""
+        from asgiref.sync import async_to_sync
+        from django.core.cache import cache
+
+        from apps.chat.services import stream_chat_response
+        from apps.llm.budget import get_user_usage
+
+        cache.clear()
+        client = fake_anthropic_client(["Hi"], input_tokens=10, output_tokens=20)
+
+        async def collect():
+            return [
+                event
+                async for event in stream_chat_response(
+                    chat_session_no_era, "Hello", charge_budget=True
+                )
+            ]
+
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+        ):
+            events = async_to_sync(collect)()
+
+        assert events[-1]["type"] == "done"
+        assert get_user_usage(user.id)["used"] == 30
+        cache.clear()
+
+    def test_no_reservation_until_claude_is_called(self, chat_session_no_era, user):
+        """Test a stream closed before the call leaves nothing reserved."""
+        from asgiref.sync import async_to_sync
+        from django.core.cache import cache
+
+        from apps.chat.services import stream_chat_response
+        from apps.llm.budget import get_user_usage
+
+        cache.clear()
+
+        async def close_before_call():
+            gen = stream_chat_response(chat_session_no_era, "Hi", charge_budget=True)
+            await gen.aclose()
+
+        async def fail_client_setup():
+            return [
+                event
+                async for event in stream_chat_response(
+                    chat_session_no_era, "Hello", charge_budget=True
+                )
+            ]
+
+        async_to_sync(close_before_call)()
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch(
+                "apps.chat.services.anthropic.AsyncAnthropic",
+                side_effect=RuntimeError("client setup failed"),
+            ),
+            pytest.raises(RuntimeError),
+        ):
+            async_to_sync(fail_client_setup)()
+
+        assert get_user_usage(user.id)["used"] == 0
+        cache.clear()
+
+    def test_budget_spent_before_call(self, chat_session_no_era, user, settings):
+        """Test an error event without an API call when the budget ran out."""
+        from asgiref.sync import async_to_sync
+        from django.core.cache import cache
+
+        from apps.chat.services import stream_chat_response
+        from apps.llm.budget import get_user_usage, reserve
+
+        cache.clear()
+        settings.LLM_USER_DAILY_TOKENS = 5000
+        reserve(user.id, 4000)
+        client = fake_anthropic_client(["Hi"])
+
+        async def collect():
+            return [
+                event
+                async for event in stream_chat_response(
+                    chat_session_no_era, "Hello", charge_budget=True
+                )
+            ]
+
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+        ):
+            events = async_to_sync(collect)()
+
+        assert events == [
+            {
+                "type": "error",
+                "content": "Daily AI usage limit reached. Try again after the reset.",
+            }
+        ]
+        client.messages.stream.assert_not_called()
+        assert get_user_usage(user.id)["used"] == 4000
+        cache.clear()
+
+
+@pytest.mark.django_db
+class TestStreamChatCircuitBreaker:
+    """Test stream_chat_response when the Anthropic circuit breaker is open."""
+
+    def test_degraded_error_without_calling_api(self, chat_session_no_era):
+        """Test a fast error event and no upstream call while open."""
+        from apps.llm.breaker import CircuitBreaker, CircuitOpenError
+
+        client = fake_anthropic_client(["never sent"])
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+            patch.object(
+                CircuitBreaker,
+                "check",
+                side_effect=CircuitOpenError("anthropic:claude", 20),
+            ),
+        ):
+            events = collect_stream_events(chat_session_no_era, "Hello")
+
+        assert events == [
+            {
+                "type": "error",
+                "content": "The AI service is temporarily unavailable. "
+                "Please try again in a minute.",
+            }
+        ]
+        client.messages.stream.assert_not_called()
+        # The unanswered question stays in the history
+        message = ChatMessage.objects.get()
+        assert message.role == ChatMessage.Role.USER
+        assert message.content == "Hello"
+        chat_session_no_era.refresh_from_db()
+        assert chat_session_no_era.message_count == 1
+
+    def test_upstream_failure_is_recorded(self, chat_session_no_era, settings):
+        """Test that a failed stream open counts against the breaker."""
+        import anthropic
+        from django.core.cache import cache
+
+        from apps.llm.breaker import get_breaker
+
+        settings.LLM_MAX_RETRIES = 0
+        cache.clear()
+        client = fake_anthropic_client([])
+        client.messages.stream.return_value.__aenter__.side_effect = (
+            anthropic.APIConnectionError(request=MagicMock())
+        )
+        with (
+            patch("apps.chat.services.retrieve_relevant_chunks", return_value=[]),
+            patch("apps.chat.services.anthropic.AsyncAnthropic", return_value=client),
+        ):
+            events = collect_stream_events(chat_session_no_era, "Hello")
+
+        assert events[-1]["type"] == "error"
+        stats = get_breaker("anthropic", settings.ANTHROPIC_MODEL).stats()
+        assert stats["failures"] == 1
+        cache.clear()
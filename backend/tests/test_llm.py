@@ -0,0 +1,510 @@
+"""Tests for the shared LLM provider infrastructure (apps.llm)."""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import openai
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.llm import breaker, governor
+from apps.llm.breaker import CircuitOpenError, get_breaker
+from apps.llm.budget import (
+    BudgetExceededError,
+    check,
+    get_global_usage,
+    get_reset_time,
+    get_user_usage,
+    reconcile,
+    reserve,
+)
+from apps.llm.governor import (
+    BATCH,
+    GENERATION,
+    GRADING,
+    INTERACTIVE,
+    GovernorTimeoutError,
+    agoverned,
+    get_governor_stats,
+    governed,
+    release,
+    try_acquire,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with empty governor state."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def limits(settings):
+    """Use a small, predictable concurrency limit."""
+    settings.LLM_CONCURRENCY_LIMITS = {"openai": 4, "anthropic": 4}
+    settings.LLM_GOVERNOR_LEASE_SECONDS = 60
+    return settings
+
+
+# =============================================================================
+# Governor
+# =============================================================================
+
+
+class TestGovernor:
+    """Test the distributed priority semaphore."""
+
+    def test_limit_is_enforced(self, limits):
+        """Test that no more than the limit can be held at once."""
+        leases = [try_acquire("openai", INTERACTIVE) for _ in range(4)]
+
+        assert all(leases)
+        assert len({key for key, _ in leases}) == 4
+        assert try_acquire("openai", INTERACTIVE) is None
+
+        release(leases[0])
+        assert try_acquire("openai", INTERACTIVE) is not None
+
+    def test_lower_classes_leave_headroom(self, limits):
+        """Test that each class is capped at its share of the slots."""
+        assert try_acquire("openai", BATCH) is not None
+        assert try_acquire("openai", BATCH) is None
+
+        assert try_acquire("openai", GENERATION) is not None
+        assert try_acquire("openai", GENERATION) is None
+
+        assert try_acquire("openai", GRADING) is not None
+        assert try_acquire("openai", GRADING) is None
+
+        assert try_acquire("openai", INTERACTIVE) is not None
+        assert get_governor_stats("openai")["in_flight"] == 4
+
+    def test_lower_class_yields_to_queued_higher_class(self, limits):
+        """Test a free slot is left for a queued higher-priority caller."""
+        cache.set("llm:gov:openai:waiting:interactive:0", "waiter")
+
+        assert try_acquire("openai", BATCH) is None
+        assert try_acquire("openai", INTERACTIVE) is not None
+
+    def test_dead_waiter_marker_expires(self, limits, monkeypatch):
+        """Test a waiter that never cleans up stops blocking lower classes."""
+        monkeypatch.setattr(governor, "WAITING_TTL", 0.1)
+        assert governor._mark_waiting("openai", INTERACTIVE, None) is not None
+        assert get_governor_stats("openai")["waiting"][INTERACTIVE] == 1
+        assert try_acquire("openai", BATCH) is None
+
+        time.sleep(0.2)
+
+        assert get_governor_stats("openai")["waiting"][INTERACTIVE] == 0
+        assert try_acquire("openai", BATCH) is not None
+
+    def test_waiter_refreshes_its_marker(self, limits, monkeypatch):
+        """Test a live waiter keeps its marker past the TTL by polling."""
+        monkeypatch.setattr(governor, "WAITING_TTL", 0.3)
+        monkeypatch.setattr(governor, "POLL_MAX", 0.1)
+        for _ in range(4):
+            try_acquire("openai", INTERACTIVE)
+        seen = {}
+
+        def observe():
+            seen.update(get_governor_stats("openai")["waiting"])
+
+        timer = threading.Timer(0.6, observe)
+        timer.start()
+        with pytest.raises(GovernorTimeoutError):
+            with governed("openai", GRADING, deadline=0.8):
+                pass
+        timer.join()
+
+        assert seen[GRADING] == 1
+        assert get_governor_stats("openai")["waiting"][GRADING] == 0
+
+    def test_release_ignores_expired_lease(self, limits):
+        """Test releasing a lease that was re-acquired elsewhere is a no-op."""
+        key, _ = try_acquire("openai", INTERACTIVE)
+        cache.set(key, "someone-else")
+
+        release((key, "stale-token"))
+
+        assert cache.get(key) == "someone-else"
+
+    def test_release_is_atomic_on_valkey(self, limits):
+        """Test Valkey releases compare and delete the lease in one script."""
+        from django.core.cache.backends.redis import RedisCache
+
+        from apps.llm.governor import COMPARE_AND_DELETE
+
+        backend = RedisCache("redis://valkey:6379/0", {})
+        client = MagicMock()
+        backend._cache.get_client = MagicMock(return_value=client)
+
+        with patch("apps.llm.governor.caches", {"default": backend}):
+            release(("llm:gov:openai:slot:0", "token"))
+
+        client.eval.assert_called_once_with(
+            COMPARE_AND_DELETE,
+            1,
+            backend.make_and_validate_key("llm:gov:openai:slot:0"),
+            backend._cache._serializer.dumps("token"),
+        )
+        client.get.assert_not_called()
+        client.delete.assert_not_called()
+
+    def test_governed_times_out_and_clears_queue(self, limits):
+        """Test a waiter gives up at its deadline and leaves the queue."""
+        for _ in range(4):
+            try_acquire("openai", INTERACTIVE)
+
+        with pytest.raises(GovernorTimeoutError):
+            with governed("openai", GRADING, deadline=0.2):
+                pass
+
+        assert get_governor_stats("openai")["waiting"][GRADING] == 0
+
+    def test_governed_waits_for_release(self, limits):
+        """Test a queued caller proceeds once a slot is released."""
+        leases = [try_acquire("openai", INTERACTIVE) for _ in range(4)]
+        timer = threading.Timer(0.2, release, args=(leases[0],))
+        timer.start()
+
+        with governed("openai", INTERACTIVE, deadline=5):
+            assert get_governor_stats("openai")["in_flight"] == 4
+
+        timer.join()
+        assert get_governor_stats("openai")["in_flight"] == 3
+
+    def test_queue_depth_metrics(self, limits):
+        """Test that queued callers are reported per priority class."""
+        for _ in range(4):
+            try_acquire("openai", INTERACTIVE)
+        seen = {}
+
+        def observe():
+            seen.update(get_governor_stats("openai")["waiting"])
+
+        timer = threading.Timer(0.1, observe)
+        timer.start()
+        with pytest.raises(GovernorTimeoutError):
+            with governed("openai", GENERATION, deadline=0.3):
+                pass
+        timer.join()
+
+        assert seen[GENERATION] == 1
+        assert seen[INTERACTIVE] == 0
+
+    def test_async_governed(self, limits):
+        """Test the async context manager acquires and releases a slot."""
+
+        async def run():
+            async with agoverned("anthropic", INTERACTIVE):
+                return get_governor_stats("anthropic")["in_flight"]
+
+        assert async_to_sync(run)() == 1
+        assert get_governor_stats("anthropic")["in_flight"] == 0
+
+
+# =============================================================================
+# Circuit breaker
+# =============================================================================
+
+
+@pytest.fixture
+def breaker_settings(settings):
+    """Trip quickly and retry without sleeping."""
+    settings.LLM_BREAKER_MIN_CALLS = 4
+    settings.LLM_BREAKER_ERROR_RATE = 0.5
+    settings.LLM_BREAKER_SLOW_RATE = 0.5
+    settings.LLM_BREAKER_SLOW_SECONDS = 1.0
+    settings.LLM_BREAKER_OPEN_SECONDS = 30
+    settings.LLM_MAX_RETRIES = 2
+    settings.LLM_RETRY_BASE_DELAY = 0
+    return settings
+
+
+def connection_error():
+    return openai.APIConnectionError(request=MagicMock())
+
+
+def expire_open_period(cb):
+    """Move an open breaker to half-open."""
+    key = f"llm:cb:{cb.name}:tripped"
+    cache.set(key, {**cache.get(key), "until": time.time() - 1}, timeout=None)
+
+
+class TestCircuitBreaker:
+    """Test the shared provider circuit breaker."""
+
+    def test_trips_on_error_rate(self, breaker_settings):
+        """Test that the breaker opens once the failure rate is reached."""
+        cb = get_breaker("openai", "gpt-test")
+        cb.record_success(0.1)
+        cb.record_success(0.1)
+        cb.record_failure()
+        assert cb.stats()["state"] == "closed"
+
+        cb.record_failure()
+
+        assert cb.stats()["state"] == "open"
+        with pytest.raises(CircuitOpenError) as exc_info:
+            cb.check()
+        assert exc_info.value.retry_after > 25
+
+    def test_needs_minimum_calls(self, breaker_settings):
+        """Test that a few failures alone do not trip the breaker."""
+        cb = get_breaker("openai", "gpt-test")
+        for _ in range(3):
+            cb.record_failure()
+
+        assert cb.check() is False
+
+    def test_trips_on_slow_calls(self, breaker_settings):
+        """Test that calls over the latency threshold count toward tripping."""
+        cb = get_breaker("openai", "gpt-test")
+        cb.record_success(0.1)
+        cb.record_success(0.1)
+        cb.record_success(5.0)
+        cb.record_success(5.0)
+
+        assert cb.stats()["state"] == "open"
+
+    def test_breakers_are_per_model(self, breaker_settings):
+        """Test that one model's failures do not open another's breaker."""
+        cb = get_breaker("openai", "gpt-test")
+        for _ in range(4):
+            cb.record_failure()
+
+        assert get_breaker("openai", "gpt-other").check() is False
+
+    def test_half_open_admits_one_probe(self, breaker_settings):
+        """Test that exactly one caller probes, and success closes."""
+        cb = get_breaker("openai", "gpt-test")
+        for _ in range(4):
+            cb.record_failure()
+        expire_open_period(cb)
+
+        assert cb.check() is True
+        with pytest.raises(CircuitOpenError):
+            cb.check()
+
+        cb.record_success(0.1, probe=True)
+        assert cb.stats()["state"] == "closed"
+        assert cb.check() is False
+
+    def test_failed_probe_reopens_for_longer(self, breaker_settings):
+        """Test that a failed probe doubles the open period."""
+        cb = get_breaker("openai", "gpt-test")
+        for _ in range(4):
+            cb.record_failure()
+        expire_open_period(cb)
+
+        probe = cb.check()
+        cb.record_failure(probe=probe)
+
+        stats = cb.stats()
+        assert stats["state"] == "open"
+        assert stats["retry_after"] > 55
+
+    def test_call_retries_provider_failures(self, breaker_settings):
+        """Test that transient failures are retried and then succeed."""
+        cb = get_breaker("openai", "gpt-test")
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise connection_error()
+            return "ok"
+
+        assert breaker.call(cb, flaky) == "ok"
+        assert len(attempts) == 3
+        assert cb.stats()["failures"] == 2
+
+    def test_call_does_not_retry_caller_errors(self, breaker_settings):
+        """Test that non-provider errors propagate without being counted."""
+        cb = get_breaker("openai", "gpt-test")
+        attempts = []
+
+        def broken():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            breaker.call(cb, broken)
+
+        assert len(attempts) == 1
+        assert cb.stats()["calls"] == 0
+
+    def test_call_fails_fast_while_open(self, breaker_settings):
+        """Test that an open breaker stops retries and skips the provider."""
+        cb = get_breaker("openai", "gpt-test")
+        attempts = []
+
+        def down():
+            attempts.append(1)
+            raise connection_error()
+
+        with pytest.raises(openai.APIConnectionError):
+            breaker.call(cb, down)
+        # The fourth failure trips the breaker, which cancels the retries
+        with pytest.raises(CircuitOpenError):
+            breaker.call(cb, down)
+
+        assert len(attempts) == 4
+
+
+# =============================================================================
+# Token budgets
+# =============================================================================
+
+
+@pytest.fixture
+def budgets(settings):
+    """Use small daily budgets."""
+    settings.LLM_USER_DAILY_TOKENS = 1000
+    settings.LLM_GLOBAL_DAILY_TOKENS = 1500
+    return settings
+
+
+class TestTokenBudget:
+    """Test per-user and global daily token budgets."""
+
+    def test_reserve_counts_against_both_budgets(self, budgets):
+        """Test that a reservation is added to the user and global usage."""
+        reserve(1, 400)
+
+        assert get_user_usage(1)["used"] == 400
+        assert get_user_usage(1)["remaining"] == 600
+        assert get_global_usage()["used"] == 400
+
+    def test_user_budget_exceeded(self, budgets):
+        """Test a reservation over the user budget is refused and undone."""
+        reserve(1, 800)
+
+        with pytest.raises(BudgetExceededError) as exc_info:
+            reserve(1, 300)
+
+        assert exc_info.value.scope == "user"
+        assert exc_info.value.reset_at == get_reset_time()
+        assert exc_info.value.retry_after > 0
+        assert get_user_usage(1)["used"] == 800
+        assert get_global_usage()["used"] == 800
+
+    def test_global_cap_applies_to_all_users(self, budgets):
+        """Test the global cap refuses a user who is within their own budget."""
+        reserve(1, 900)
+
+        with pytest.raises(BudgetExceededError) as exc_info:
+            reserve(2, 700)
+
+        assert exc_info.value.scope == "global"
+        assert get_user_usage(2)["used"] == 0
+        assert get_global_usage()["used"] == 900
+
+    def test_reconcile_replaces_estimate(self, budgets):
+        """Test reconciling moves both counters to the actual usage."""
+        reservation = reserve(1, 900)
+
+        reconcile(reservation, 250)
+
+        assert get_user_usage(1)["used"] == 250
+        assert get_global_usage()["used"] == 250
+        reserve(1, 700)
+
+    def test_check_does_not_reserve(self, budgets):
+        """Test check refuses what reserve would without counting anything."""
+        reserve(1, 800)
+
+        check(1, 200)
+        with pytest.raises(BudgetExceededError) as exc_info:
+            check(1, 300)
+
+        assert exc_info.value.scope == "user"
+        assert get_user_usage(1)["used"] == 800
+        assert get_global_usage()["used"] == 800
+
+    def test_zero_disables_limit(self, budgets):
+        """Test that a limit of 0 tracks usage without enforcing it."""
+        budgets.LLM_USER_DAILY_TOKENS = 0
+        budgets.LLM_GLOBAL_DAILY_TOKENS = 0
+
+        reserve(1, 10**9)
+
+        assert get_user_usage(1) == {
+            "used": 10**9,
+            "limit": 0,
+            "remaining": None,
+            "reset_at": get_reset_time().isoformat(),
+        }
+
+
+# =============================================================================
+# Status API
+# =============================================================================
+
+
+@pytest.mark.django_db
+class TestLLMStatusAPI:
+    """Test the staff-only provider status endpoint."""
+
+    def _client(self, user):
+        client = APIClient()
+        refresh = RefreshToken.for_user(user)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        return client
+
+    def test_requires_staff(self, create_user):
+        """Test that non-staff users are rejected."""
+        user = create_user(email="llm@example.com", username="llm", password="x")
+
+        response = self._client(user).get(reverse("llm:status"))
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_reports_governor_stats(self, create_user, limits):
+        """Test that staff see per-provider queue metrics."""
+        user = create_user(
+            email="ops@example.com", username="ops", password="x", is_staff=True
+        )
+        try_acquire("openai", GENERATION)
+
+        response = self._client(user).get(reverse("llm:status"))
+
+        assert response.status_code == status.HTTP_200_OK
+        governor = response.data["providers"]["openai"]["governor"]
+        assert governor["limit"] == 4
+        assert governor["in_flight"] == 1
+        assert governor["capacity"][BATCH] == 1
+
+    def test_reports_breaker_state(self, create_user, settings):
+        """Test that staff see the breaker state of each configured model."""
+        settings.OPENAI_MODEL = "gpt-test"
+        user = create_user(
+            email="ops@example.com", username="ops", password="x", is_staff=True
+        )
+        get_breaker("openai", "gpt-test").record_failure()
+
+        response = self._client(user).get(reverse("llm:status"))
+
+        breakers = response.data["providers"]["openai"]["breakers"]
+        assert breakers["gpt-test"]["state"] == "closed"
+        assert breakers["gpt-test"]["failures"] == 1
+
+    def test_reports_global_budget(self, create_user, budgets):
+        """Test that staff see today's global token usage."""
+        user = create_user(
+            email="ops@example.com", username="ops", password="x", is_staff=True
+        )
+        reserve(user.id, 300)
+
+        response = self._client(user).get(reverse("llm:status"))
+
+        assert response.data["budget"]["used"] == 300
+        assert response.data["budget"]["limit"] == 1500
@@ -4,15 +4,21 @@ Tests cover models, serializers, API endpoints, and service functions
 for the quiz app's AI-powered quiz generation and grading.
 """
 
+import math
+from datetime import timedelta
 from unittest.mock import MagicMock, patch
 
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from apps.eras.models import Era, KeyEvent, KeyFigure
+from apps.llm.breaker import CircuitBreaker, CircuitOpenError
+from apps.llm.budget import BudgetExceededError, get_reset_time
+from apps.quiz.grading import ACCEPTED_FEEDBACK, REJECTED_FEEDBACK, grade_answer
 from apps.quiz.models import Quiz, QuizQuestion
 from apps.quiz.serializers import (
     QuizAnswerSerializer,
@@ -23,12 +29,19 @@ from apps.quiz.serializers import (
     QuizSerializer,
 )
 
-
 # =============================================================================
 # Fixtures
 # =============================================================================
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test without throttle, budget or cached grading state."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def user(create_user):
     """Create a test user."""
@@ -113,6 +126,14 @@ def quiz(db, user, sample_era):
     )
 
 
+@pytest.fixture
+def generating_quiz(quiz):
+    """Mark the test quiz as claimed by a generation task."""
+    quiz.status = Quiz.Status.GENERATING
+    quiz.save(update_fields=["status"])
+    return quiz
+
+
 @pytest.fixture
 def completed_quiz(db, user, sample_era):
     """Create a completed test quiz with questions."""
@@ -393,6 +414,61 @@ class TestQuizAPI:
         assert len(response.data["results"]) == 1
         assert response.data["results"][0]["id"] == completed_quiz.id
 
+    def test_list_quizzes_counts_answers(self, authenticated_client, completed_quiz):
+        """Test the list annotates answered and correct question counts."""
+        completed_quiz.questions.filter(order=2).update(is_correct=False)
+
+        response = authenticated_client.get(reverse("quiz:quiz-list"))
+
+        result = response.data["results"][0]
+        assert result["questions_answered"] == 2
+        assert result["correct_answers"] == 1
+        assert "questions" not in result
+
+    @pytest.fixture
+    def quiz_history(self, user, sample_era):
+        """Create 500 graded quizzes of 10 questions each."""
+        quizzes = Quiz.objects.bulk_create(
+            Quiz(user=user, era=sample_era, total_questions=10) for _ in range(500)
+        )
+        QuizQuestion.objects.bulk_create(
+            QuizQuestion(
+                quiz=quiz,
+                question_text=f"Question {i}",
+                correct_answer="0",
+                is_correct=i < 7,
+                explanation="A long explanation. " * 50,
+                order=i,
+            )
+            for quiz in quizzes
+            for i in range(10)
+        )
+
+    def test_list_quizzes_at_scale(
+        self, authenticated_client, quiz_history, django_assert_num_queries
+    ):
+        """Test a page of a long quiz history loads no questions."""
+        # The user, the page count and the page itself
+        with django_assert_num_queries(3):
+            response = authenticated_client.get(reverse("quiz:quiz-list"))
+
+        assert response.data["count"] == 500
+        assert len(response.data["results"]) == 20
+        assert response.data["results"][0]["questions_answered"] == 10
+        assert response.data["results"][0]["correct_answers"] == 7
+
+    @pytest.mark.benchmark
+    def test_benchmark_list_quizzes_at_scale(self, authenticated_client, quiz_history):
+        """Benchmark: a page of a 500-quiz history loads in under a second."""
+        import time
+
+        start = time.perf_counter()
+        response = authenticated_client.get(reverse("quiz:quiz-list"))
+        elapsed = time.perf_counter() - start
+
+        assert response.status_code == status.HTTP_200_OK
+        assert elapsed < 1.0
+
     def test_list_quizzes_unauthenticated(self):
         """Test listing quizzes without authentication."""
         client = APIClient()
@@ -445,11 +521,18 @@ class TestQuizAPI:
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
-    @patch("apps.quiz.views.generate_quiz_questions")
+    @patch("apps.quiz.views.schedule_bank_top_up")
+    @patch("apps.quiz.views.generate_quiz")
     def test_create_quiz(
-        self, mock_generate, authenticated_client, sample_era, user
+        self,
+        mock_task,
+        mock_top_up,
+        authenticated_client,
+        sample_era,
+        user,
+        django_capture_on_commit_callbacks,
     ):
-        """Test creating a new quiz."""
+        """Test creating a quiz returns it pending and queues generation."""
         url = reverse("quiz:quiz-list")
         data = {
             "era_id": sample_era.id,
@@ -457,10 +540,14 @@ class TestQuizAPI:
             "question_count": 5,
         }
 
-        response = authenticated_client.post(url, data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(url, data)
 
         assert response.status_code == status.HTTP_201_CREATED
-        assert mock_generate.called
+        assert response.data["status"] == Quiz.Status.PENDING
+        assert response.data["questions"] == []
+        mock_task.delay.assert_called_once_with(response.data["id"])
+        mock_top_up.assert_called_once_with(sample_era.id, "beginner")
 
         # Verify quiz was created
         quiz = Quiz.objects.get(id=response.data["id"])
@@ -468,8 +555,8 @@ class TestQuizAPI:
         assert quiz.era == sample_era
         assert quiz.total_questions == 5
 
-    @patch("apps.quiz.views.generate_quiz_questions")
-    def test_create_quiz_all_eras(self, mock_generate, authenticated_client, user):
+    @patch("apps.quiz.views.generate_quiz")
+    def test_create_quiz_all_eras(self, mock_task, authenticated_client, user):
         """Test creating an 'All Eras' quiz."""
         url = reverse("quiz:quiz-list")
         data = {
@@ -486,6 +573,96 @@ class TestQuizAPI:
         assert quiz.era is None
         assert quiz.total_questions == 10
 
+    @patch("apps.quiz.views.schedule_bank_top_up")
+    @patch("apps.quiz.views.generate_quiz")
+    def test_create_quiz_idempotency_key(
+        self,
+        mock_task,
+        mock_top_up,
+        authenticated_client,
+        django_capture_on_commit_callbacks,
+    ):
+        """Test a retried create with the same key returns the same quiz."""
+        url = reverse("quiz:quiz-list")
+        data = {"difficulty": "beginner", "question_count": 5}
+
+        with django_capture_on_commit_callbacks(execute=True):
+            first = authenticated_client.post(url, data, HTTP_IDEMPOTENCY_KEY="abc")
+            retry = authenticated_client.post(url, data, HTTP_IDEMPOTENCY_KEY="abc")
+            other = authenticated_client.post(url, data, HTTP_IDEMPOTENCY_KEY="def")
+
+        assert first.status_code == status.HTTP_201_CREATED
+        assert retry.status_code == status.HTTP_200_OK
+        assert retry.data["id"] == first.data["id"]
+        assert other.data["id"] != first.data["id"]
+        assert Quiz.objects.count() == 2
+        assert mock_task.delay.call_count == 2
+
+    @patch("apps.quiz.views.generate_quiz")
+    def test_create_quiz_provider_unavailable(self, mock_task, authenticated_client):
+        """Test a 503 and no quiz while the OpenAI circuit breaker is open."""
+        url = reverse("quiz:quiz-list")
+
+        with patch.object(
+            CircuitBreaker, "stats", return_value={"state": "open", "retry_after": 20}
+        ):
+            response = authenticated_client.post(
+                url, {"difficulty": "beginner", "question_count": 5}
+            )
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert not Quiz.objects.exists()
+        mock_task.delay.assert_not_called()
+
+    @patch("apps.quiz.views.generate_quiz")
+    def test_create_quiz_budget_exhausted(
+        self, mock_task, authenticated_client, user, settings
+    ):
+        """Test a 429 with the reset time once the daily token budget is used."""
+        from apps.llm.budget import reserve
+
+        settings.LLM_USER_DAILY_TOKENS = 1000
+        reserve(user.id, 1000)
+        url = reverse("quiz:quiz-list")
+
+        response = authenticated_client.post(
+            url, {"difficulty": "beginner", "question_count": 5}
+        )
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.data["reset_at"] == get_reset_time().isoformat()
+        assert int(response["Retry-After"]) > 0
+        assert not Quiz.objects.exists()
+
+    def test_quiz_status(self, authenticated_client, other_authenticated_client, quiz):
+        """Test polling the generation status of a quiz."""
+        url = reverse("quiz:quiz-status", kwargs={"pk": quiz.id})
+
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "id": quiz.id,
+            "status": Quiz.Status.PENDING,
+            "generation_error": "",
+            "total_questions": 5,
+            "questions_ready": 0,
+        }
+        assert other_authenticated_client.get(url).status_code == 404
+
+    def test_quiz_status_counts_streamed_questions(
+        self, authenticated_client, quiz, quiz_question
+    ):
+        """Test questions saved during generation are reported as ready."""
+        quiz.status = Quiz.Status.GENERATING
+        quiz.save()
+        url = reverse("quiz:quiz-status", kwargs={"pk": quiz.id})
+
+        response = authenticated_client.get(url)
+
+        assert response.data["status"] == Quiz.Status.GENERATING
+        assert response.data["questions_ready"] == 1
+
     def test_submit_answer_multiple_choice(
         self, authenticated_client, quiz, quiz_question
     ):
@@ -523,7 +700,7 @@ class TestQuizAPI:
         quiz_question.refresh_from_db()
         assert quiz_question.is_correct is False
 
-    @patch("apps.quiz.views.grade_short_answer")
+    @patch("apps.quiz.views.grade_answer")
     def test_submit_answer_short_answer(
         self, mock_grade, authenticated_client, quiz
     ):
@@ -566,6 +743,8 @@ class TestQuizAPI:
 
     def test_complete_quiz(self, authenticated_client, quiz, quiz_question):
         """Test completing a quiz."""
+        quiz.status = Quiz.Status.READY
+        quiz.save()
         # Answer the question first
         quiz_question.user_answer = "1"
         quiz_question.is_correct = True
@@ -595,6 +774,154 @@ class TestQuizAPI:
 
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_complete_quiz_while_generating(
+        self, authenticated_client, quiz, quiz_question
+    ):
+        """Test a quiz cannot be completed before all questions exist."""
+        quiz.status = Quiz.Status.GENERATING
+        quiz.save()
+
+        url = reverse("quiz:quiz-complete", kwargs={"pk": quiz.id})
+        response = authenticated_client.post(url)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        quiz.refresh_from_db()
+        assert quiz.completed_at is None
+
+
+@pytest.mark.django_db
+class TestQuizBatchAnswers:
+    """Test submitting a quiz's answers in one request."""
+
+    @pytest.fixture
+    def questions(self, quiz, quiz_question):
+        """Add a true/false and two short answer questions to the quiz."""
+        quiz.status = Quiz.Status.READY
+        quiz.save()
+        tf = QuizQuestion.objects.create(
+            quiz=quiz,
+            question_text="Augustine was Bishop of Hippo.",
+            question_type=QuizQuestion.QuestionType.TRUE_FALSE,
+            options=["True", "False"],
+            correct_answer="0",
+            explanation="He was.",
+            order=2,
+        )
+        short = [
+            QuizQuestion.objects.create(
+                quiz=quiz,
+                question_text=f"Explain event {i}.",
+                question_type=QuizQuestion.QuestionType.SHORT_ANSWER,
+                correct_answer=f"Reference {i}.",
+                explanation="Because.",
+                order=3 + i,
+            )
+            for i in range(2)
+        ]
+        return [quiz_question, tf, *short]
+
+    @staticmethod
+    def answers(questions):
+        return {
+            "answers": [
+                {"question_id": questions[0].id, "answer": "1"},
+                {"question_id": questions[1].id, "answer": "1"},
+                {"question_id": questions[2].id, "answer": "First."},
+                {"question_id": questions[3].id, "answer": "Second."},
+            ]
+        }
+
+    @patch("apps.quiz.grading.pre_grade", return_value=None)
+    @patch("apps.quiz.grading.grade_short_answers")
+    def test_submit_answers(
+        self, mock_llm, mock_pre_grade, authenticated_client, quiz, questions
+    ):
+        """Test all answers are graded with one combined LLM call."""
+        mock_llm.return_value = (
+            [(True, "Right."), (False, "Wrong.")],
+            MagicMock(prompt_tokens=300, completion_tokens=80),
+        )
+        url = reverse("quiz:quiz-submit-answers", kwargs={"pk": quiz.id})
+
+        response = authenticated_client.post(
+            url, self.answers(questions), format="json"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data["results"]
+        assert [r["question_id"] for r in results] == [q.id for q in questions]
+        assert [r["is_correct"] for r in results] == [True, False, True, False]
+        assert [r["feedback"] for r in results] == [None, None, "Right.", "Wrong."]
+        mock_llm.assert_called_once()
+        assert [item[2] for item in mock_llm.call_args.args[0]] == [
+            "First.",
+            "Second.",
+        ]
+        assert list(
+            quiz.questions.order_by("order").values_list("user_answer", "is_correct")
+        ) == [("1", True), ("1", False), ("First.", True), ("Second.", False)]
+        quiz.refresh_from_db()
+        assert quiz.grading_input_tokens == 300
+        assert quiz.completed_at is None
+
+    def test_submit_answers_unknown_question(
+        self, authenticated_client, quiz, questions
+    ):
+        """Test a batch with a foreign question is rejected as a whole."""
+        url = reverse("quiz:quiz-submit-answers", kwargs={"pk": quiz.id})
+        data = {
+            "answers": [
+                {"question_id": questions[0].id, "answer": "1"},
+                {"question_id": 99999, "answer": "1"},
+            ]
+        }
+
+        response = authenticated_client.post(url, data, format="json")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert not quiz.questions.exclude(user_answer="").exists()
+
+    def test_submit_answers_duplicate_question(
+        self, authenticated_client, quiz, questions
+    ):
+        """Test a question cannot be answered twice in one batch."""
+        url = reverse("quiz:quiz-submit-answers", kwargs={"pk": quiz.id})
+        data = {
+            "answers": [
+                {"question_id": questions[0].id, "answer": "1"},
+                {"question_id": questions[0].id, "answer": "2"},
+            ]
+        }
+
+        response = authenticated_client.post(url, data, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @patch("apps.quiz.grading.pre_grade", return_value=None)
+    @patch("apps.quiz.grading.grade_short_answers")
+    def test_complete_with_answers(
+        self, mock_llm, mock_pre_grade, authenticated_client, quiz, questions
+    ):
+        """Test answers can be graded and the quiz completed in one request."""
+        mock_llm.return_value = (
+            [(True, "Right."), (True, "Right.")],
+            MagicMock(prompt_tokens=300, completion_tokens=80),
+        )
+        url = reverse("quiz:quiz-complete", kwargs={"pk": quiz.id})
+
+        response = authenticated_client.post(
+            url, self.answers(questions), format="json"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["score"] == 3
+        assert len(response.data["results"]) == 4
+        quiz.refresh_from_db()
+        assert quiz.completed_at is not None
+        assert quiz.score == 3
+        assert quiz.grading_input_tokens == 300
+        assert quiz.grading_output_tokens == 80
+
 
 @pytest.mark.django_db
 class TestQuizStatsAPI:
@@ -622,6 +949,565 @@ class TestQuizStatsAPI:
         assert response.data["total_completed"] == 0
         assert response.data["quizzes_passed"] == 0
 
+    def test_by_era_skips_eras_without_completed_quizzes(
+        self, authenticated_client, user, completed_quiz
+    ):
+        """Test quizzes in progress count in the totals but not in by_era."""
+        Quiz.objects.create(user=user, total_questions=5)
+
+        response = authenticated_client.get(reverse("quiz:stats"))
+
+        assert response.data["total_quizzes"] == 2
+        assert response.data["total_completed"] == 1
+        assert [era["era_name"] for era in response.data["by_era"]] == [
+            "Early Church"
+        ]
+
+    def test_stats_match_quiz_properties(self, authenticated_client, user, sample_era):
+        """Test passed and streak counts computed in SQL match Quiz.passed."""
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        now = timezone.now()
+        # (score, total) from oldest to newest
+        results = [(10, 10), (2, 3), (7, 10), (139, 200), (4, 5), (0, 0)]
+        quizzes = [
+            Quiz.objects.create(
+                user=user,
+                era=sample_era,
+                score=score,
+                total_questions=total,
+                completed_at=now - timedelta(minutes=len(results) - i),
+            )
+            for i, (score, total) in enumerate(results)
+        ]
+        Quiz.objects.create(user=user, era=sample_era, score=1, total_questions=5)
+
+        response = authenticated_client.get(reverse("quiz:stats"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["total_quizzes"] == 7
+        assert response.data["total_completed"] == 6
+        assert response.data["quizzes_passed"] == sum(q.passed for q in quizzes)
+        assert response.data["quizzes_passed"] == 4
+        # The newest quiz (no questions) is a failure
+        assert response.data["current_streak"] == 0
+
+        quizzes[-1].delete()
+        response = authenticated_client.get(reverse("quiz:stats"))
+        assert response.data["current_streak"] == 3
+        assert response.data["average_score"] == pytest.approx(
+            round((100 + 200 / 3 + 70 + 69.5 + 80) / 5, 1)
+        )
+
+    def test_streak_without_failures(self, authenticated_client, completed_quiz):
+        """Test that every completed quiz counts when none was failed."""
+        response = authenticated_client.get(reverse("quiz:stats"))
+
+        assert response.data["current_streak"] == 1
+
+    @pytest.fixture
+    def completed_history(self, user, sample_era):
+        """Create 10k completed quizzes, one a minute, half of them in an era."""
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        now = timezone.now()
+        Quiz.objects.bulk_create(
+            Quiz(
+                user=user,
+                era=sample_era if i % 2 else None,
+                score=i % 6,
+                total_questions=5,
+                completed_at=now - timedelta(minutes=i),
+            )
+            for i in range(10_000)
+        )
+
+    def test_stats_query_count_at_scale(
+        self, user, completed_history, django_assert_num_queries
+    ):
+        """Test stats for 10k quizzes take one query."""
+        from apps.quiz.stats import get_quiz_stats
+
+        with django_assert_num_queries(1):
+            stats = get_quiz_stats(user)
+
+        assert stats["total_completed"] == 10_000
+        # Scores 4/5 and 5/5 pass; the newest quiz scores 0/5
+        assert stats["quizzes_passed"] == 3332
+        assert stats["current_streak"] == 0
+        assert len(stats["by_era"]) == 2
+
+    @pytest.mark.benchmark
+    def test_benchmark_stats_at_scale(self, user, completed_history):
+        """Benchmark: stats for 10k quizzes are computed in under a second."""
+        import time
+
+        from apps.quiz.stats import get_quiz_stats
+
+        start = time.perf_counter()
+        stats = get_quiz_stats(user)
+        elapsed = time.perf_counter() - start
+
+        assert stats["total_completed"] == 10_000
+        assert elapsed < 1.0
+
+
+def stream_chunks(content, size=16, prompt_tokens=100, completion_tokens=200):
+    """Return OpenAI stream chunks delivering ``content`` in small pieces."""
+    chunks = [
+        MagicMock(
+            choices=[MagicMock(delta=MagicMock(content=content[i : i + size]))],
+            usage=None,
+        )
+        for i in range(0, len(content), size)
+    ]
+    chunks.append(
+        MagicMock(
+            choices=[],
+            usage=MagicMock(
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            ),
+        )
+    )
+    return chunks
+
+
+def bank_question_data(text, question_type="mc", correct="1"):
+    """Return a generated question dict as returned by OpenAI."""
+    options = {"mc": ["A", "B", "C", "D"], "tf": ["True", "False"], "sa": []}
+    return {
+        "question_text": text,
+        "question_type": question_type,
+        "options": options[question_type],
+        "correct_answer": correct,
+        "explanation": "Because.",
+    }
+
+
+@pytest.mark.django_db
+class TestQuestionBank:
+    """Test the quiz question bank."""
+
+    @pytest.fixture
+    def stocked(self, sample_era):
+        """Store 6 MC, 2 TF and 2 SA beginner questions for the era."""
+        from apps.quiz.bank import add_to_bank
+
+        add_to_bank(
+            sample_era,
+            "beginner",
+            [bank_question_data(f"MC question {i}?") for i in range(6)]
+            + [bank_question_data(f"TF question {i}.", "tf", "0") for i in range(2)]
+            + [bank_question_data(f"SA question {i}?", "sa", "Ref") for i in range(2)],
+        )
+
+    def test_validate_question(self):
+        """Test malformed generated questions are rejected."""
+        from apps.quiz.bank import validate_question
+
+        assert validate_question(bank_question_data("Ok?"))["correct_answer"] == "1"
+        assert validate_question(bank_question_data("Bad index?", correct="4")) is None
+        short = bank_question_data("Three options?")
+        short["options"] = ["A", "B", "C"]
+        assert validate_question(short) is None
+        assert validate_question({"question_text": "No type?"}) is None
+
+    def test_add_to_bank_deduplicates(self, sample_era):
+        """Test questions differing only in case and punctuation are merged."""
+        from apps.quiz.bank import add_to_bank
+        from apps.quiz.models import BankQuestion
+
+        add_to_bank(sample_era, "beginner", [bank_question_data("Who was Arius?")])
+        banked = add_to_bank(
+            sample_era,
+            "beginner",
+            [bank_question_data("who was  Arius"), {"question_text": "Bad"}],
+        )
+
+        assert BankQuestion.objects.count() == 1
+        assert list(banked.values()) == list(BankQuestion.objects.all())
+
+    def test_fill_quiz_avoids_repeats(self, user, sample_era, stocked):
+        """Test a user is not given the same bank question twice."""
+        from apps.quiz.bank import fill_quiz_from_bank
+
+        first = Quiz.objects.create(user=user, era=sample_era, total_questions=5)
+        second = Quiz.objects.create(user=user, era=sample_era, total_questions=5)
+        third = Quiz.objects.create(user=user, era=sample_era, total_questions=5)
+
+        assert fill_quiz_from_bank(first) is True
+        assert fill_quiz_from_bank(second) is True
+        assert fill_quiz_from_bank(third) is False
+
+        first_ids = set(first.questions.values_list("bank_question", flat=True))
+        second_ids = set(second.questions.values_list("bank_question", flat=True))
+        assert len(first_ids) == len(second_ids) == 5
+        assert not first_ids & second_ids
+        assert list(first.questions.values_list("question_type", flat=True)) == [
+            "mc",
+            "mc",
+            "mc",
+            "tf",
+            "sa",
+        ]
+        first.refresh_from_db()
+        assert first.status == Quiz.Status.READY
+        assert not third.questions.exists()
+
+    @patch("apps.quiz.views.schedule_bank_top_up")
+    @patch("apps.quiz.views.generate_quiz")
+    def test_create_quiz_from_bank(
+        self,
+        mock_task,
+        mock_top_up,
+        authenticated_client,
+        sample_era,
+        stocked,
+        django_capture_on_commit_callbacks,
+    ):
+        """Test creating a quiz is served from the bank without OpenAI."""
+        url = reverse("quiz:quiz-list")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(
+                url,
+                {
+                    "era_id": sample_era.id,
+                    "difficulty": "beginner",
+                    "question_count": 5,
+                },
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["status"] == Quiz.Status.READY
+        assert len(response.data["questions"]) == 5
+        mock_task.delay.assert_not_called()
+        mock_top_up.assert_called_once_with(sample_era.id, "beginner")
+
+    def test_top_up_requests_missing_types(self, sample_era, stocked, settings):
+        """Test a top-up only asks for the types below target."""
+        from apps.quiz.bank import top_up_bank
+
+        settings.QUIZ_BANK_TARGET_PER_TYPE = 6
+        settings.QUIZ_BANK_BATCH_PER_TYPE = 3
+        generated = [bank_question_data(f"New TF {i}.", "tf", "1") for i in range(3)]
+
+        with patch(
+            "apps.quiz.services.request_questions", return_value=(generated, None)
+        ) as mock_request:
+            added = top_up_bank(sample_era, "beginner")
+
+        mock_request.assert_called_once_with(
+            sample_era, "beginner", {"tf": 3, "sa": 3}
+        )
+        assert added == 3
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_generated_questions_are_banked(self, mock_client, quiz):
+        """Test questions generated for a quiz feed the bank."""
+        from apps.quiz.models import BankQuestion
+        from apps.quiz.services import generate_quiz_questions
+
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "Test?", '
+            '"question_type": "mc", "options": ["A", "B", "C", "D"], '
+            '"correct_answer": "0", "explanation": "Because."}]}'
+        )
+
+        generate_quiz_questions(quiz)
+
+        banked = BankQuestion.objects.get()
+        assert quiz.questions.get().bank_question == banked
+
+
+@pytest.mark.django_db
+class TestShortAnswerGrading:
+    """Test the cached, pre-graded short answer grading pipeline."""
+
+    @pytest.fixture
+    def sa_question(self, quiz):
+        """Create a short answer question."""
+        return QuizQuestion.objects.create(
+            quiz=quiz,
+            question_text="Why does the Edict of Milan matter?",
+            question_type=QuizQuestion.QuestionType.SHORT_ANSWER,
+            correct_answer="It legalized Christianity in the Roman Empire.",
+            explanation="Constantine and Licinius ended the persecution.",
+            order=1,
+        )
+
+    @staticmethod
+    def embeddings(similarity):
+        """Return a fake embedder giving answers ``similarity`` to the reference."""
+        angle = math.acos(similarity)
+
+        def embed(text):
+            if text.startswith("It legalized"):
+                return [1.0, 0.0]
+            return [math.cos(angle), math.sin(angle)]
+
+        return embed
+
+    @pytest.mark.parametrize(
+        ("similarity", "expected"),
+        [(0.95, (True, ACCEPTED_FEEDBACK)), (0.1, (False, REJECTED_FEEDBACK))],
+    )
+    @patch("apps.quiz.grading.grade_short_answer")
+    def test_confident_answers_skip_llm(
+        self, mock_llm, sa_question, similarity, expected
+    ):
+        """Test clearly right or wrong answers are graded locally."""
+        with patch(
+            "apps.quiz.grading.get_answer_embedding",
+            side_effect=self.embeddings(similarity),
+        ):
+            assert grade_answer(sa_question, "Some answer") == expected
+
+        mock_llm.assert_not_called()
+
+    @patch("apps.quiz.grading.grade_short_answer")
+    def test_ambiguous_answer_uses_llm_and_records_tokens(
+        self, mock_llm, quiz, sa_question
+    ):
+        """Test ambiguous answers go to the LLM once, then hit the cache."""
+        mock_llm.return_value = (
+            True,
+            "Good.",
+            MagicMock(prompt_tokens=120, completion_tokens=30),
+        )
+
+        with patch(
+            "apps.quiz.grading.get_answer_embedding",
+            side_effect=self.embeddings(0.6),
+        ):
+            first = grade_answer(sa_question, "It made the faith legal.", user_id=1)
+            again = grade_answer(sa_question, "it made the faith legal", user_id=2)
+
+        assert first == again == (True, "Good.")
+        mock_llm.assert_called_once_with(
+            sa_question.question_text,
+            sa_question.correct_answer,
+            "It made the faith legal.",
+            user_id=1,
+        )
+        quiz.refresh_from_db()
+        assert quiz.grading_input_tokens == 120
+        assert quiz.grading_output_tokens == 30
+
+    @patch("apps.quiz.grading.grade_short_answer")
+    def test_fallback_grade_not_cached(self, mock_llm, sa_question):
+        """Test a fallback grade is retried on the next submission."""
+        mock_llm.return_value = (False, "We couldn't grade your answer.", None)
+
+        with patch(
+            "apps.quiz.grading.get_answer_embedding", side_effect=ImportError
+        ):
+            grade_answer(sa_question, "An answer")
+            grade_answer(sa_question, "An answer")
+
+        assert mock_llm.call_count == 2
+
+
+@pytest.mark.django_db
+class TestEraContext:
+    """Test the cached era context of generation prompts."""
+
+    def test_context_is_cached(self, sample_era, django_assert_num_queries):
+        """Test the era context is built once per version."""
+        from apps.quiz.context import get_era_context
+
+        context = get_era_context(sample_era)
+
+        with django_assert_num_queries(0):
+            assert get_era_context(sample_era) == context
+        assert "Council of Nicaea" in context
+        assert "Augustine of Hippo (354-430): Bishop of Hippo" in context
+
+    def test_all_eras_context(self, sample_era, django_assert_num_queries):
+        """Test the "All Eras" context covers every era and is cached."""
+        from apps.quiz.context import get_era_context
+
+        Era.objects.create(
+            name="Reformation",
+            slug="reformation",
+            start_year=1517,
+            end_year=1648,
+            description="Protestant Reformation.",
+            color="#000000",
+            order=2,
+        )
+
+        context = get_era_context(None)
+
+        assert "Era: Early Church" in context
+        assert "Era: Reformation" in context
+        with django_assert_num_queries(0):
+            get_era_context(None)
+
+    def test_editing_eras_invalidates_context(self, sample_era):
+        """Test saving or deleting era content changes the version."""
+        from apps.quiz.context import context_version, get_era_context
+
+        get_era_context(sample_era)
+        get_era_context(None)
+        version = context_version()
+
+        KeyEvent.objects.create(era=sample_era, year=313, title="Edict of Milan")
+
+        assert context_version() != version
+        assert "Edict of Milan" in get_era_context(sample_era)
+        assert "Edict of Milan" in get_era_context(None)
+
+        version = context_version()
+        sample_era.key_figures.get().delete()
+        assert context_version() != version
+        assert "Augustine" not in get_era_context(sample_era)
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_prompt_starts_with_era_context(self, mock_client, quiz):
+        """Test quiz-specific instructions follow the shared era prefix."""
+        from apps.quiz.context import get_era_context
+        from apps.quiz.services import generate_quiz_questions
+
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "Test?", "question_type": "tf", '
+            '"options": ["True", "False"], "correct_answer": "0", '
+            '"explanation": "Because."}]}'
+        )
+
+        generate_quiz_questions(quiz)
+
+        messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        prompt = messages[1]["content"]
+        assert prompt.startswith(f"**Era Content:**\n{get_era_context(quiz.era)}")
+        assert prompt.index("**Requirements:**") < prompt.index("beginner")
+
+
+@pytest.mark.django_db
+class TestQuizGrounding:
+    """Test grounding quiz generation in the content corpus."""
+
+    @pytest.fixture
+    def era_items(self, sample_era):
+        """Create three content items tagged with the era, with chunks."""
+        from apps.content.models import ContentChunk, ContentItem, ContentTag, Source
+
+        source = Source.objects.create(
+            name="Lectures",
+            url="https://example.com",
+            source_type=Source.SourceType.YOUTUBE_CHANNEL,
+        )
+        tag = ContentTag.objects.create(
+            name=sample_era.name, tag_type=ContentTag.TagType.ERA, slug=sample_era.slug
+        )
+        items = []
+        for i in range(3):
+            item = ContentItem.objects.create(
+                source=source,
+                content_type=ContentItem.ContentType.TRANSCRIPT,
+                title=f"Lecture {i}",
+                url=f"https://example.com/{i}",
+                external_id=f"lecture-{i}",
+                author="Lecturer",
+                raw_text="Text.",
+            )
+            item.tags.add(tag)
+            ContentChunk.objects.create(
+                content_item=item,
+                chunk_text=f"Excerpt from lecture {i}.",
+                chunk_index=0,
+                token_count=100,
+                embedding=[1.0, 0.1 * i] + [0.0] * 382,
+            )
+            items.append(item)
+        return items
+
+    def test_chunk_sets_respect_budget_and_rotate(
+        self, sample_era, era_items, settings
+    ):
+        """Test quizzes rotate through token-budgeted chunk sets."""
+        from apps.quiz.grounding import get_grounding_chunks
+
+        settings.QUIZ_GROUNDING_TOKEN_BUDGET = 200
+        settings.QUIZ_GROUNDING_ROTATIONS = 2
+
+        first = get_grounding_chunks(sample_era, "beginner")
+        second = get_grounding_chunks(sample_era, "beginner")
+        third = get_grounding_chunks(sample_era, "beginner")
+
+        assert [len(first), len(second)] == [2, 1]
+        assert {c.id for c in first}.isdisjoint(c.id for c in second)
+        assert [c.id for c in third] == [c.id for c in first]
+        # Each difficulty has its own rotation
+        assert get_grounding_chunks(sample_era, "advanced") == first
+
+    def test_centroid_and_sets_are_cached(
+        self, sample_era, era_items, django_assert_num_queries
+    ):
+        """Test later quizzes only load the chosen chunks."""
+        from apps.quiz.grounding import era_centroid, get_grounding_chunks
+
+        get_grounding_chunks(sample_era, "beginner")
+
+        with django_assert_num_queries(1):
+            get_grounding_chunks(sample_era, "beginner")
+        with django_assert_num_queries(0):
+            assert len(era_centroid(sample_era)) == 384
+
+    def test_era_without_content(self, sample_era):
+        """Test an era without embedded content is not grounded."""
+        from apps.quiz.grounding import get_grounding_chunks
+
+        assert get_grounding_chunks(sample_era, "beginner") == []
+        assert get_grounding_chunks(None, "beginner") == []
+
+    def test_all_eras_combines_eras(self, sample_era, era_items):
+        """Test "All Eras" quizzes draw from every era with content."""
+        from apps.quiz.grounding import get_grounding_chunks
+
+        chunks = get_grounding_chunks(None, "beginner")
+
+        assert chunks
+        assert {c.content_item_id for c in chunks} <= {i.id for i in era_items}
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_generated_question_cites_source(
+        self, mock_client, authenticated_client, quiz, era_items
+    ):
+        """Test a question's source label is resolved to its content item."""
+        from django.utils import timezone
+
+        from apps.quiz.services import generate_quiz_questions
+
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "Test?", "question_type": "tf", '
+            '"options": ["True", "False"], "correct_answer": "0", '
+            '"explanation": "Because.", "source": "S1"}]}'
+        )
+
+        generate_quiz_questions(quiz)
+
+        prompt = mock_client.chat.completions.create.call_args.kwargs["messages"][
+            1
+        ]["content"]
+        question = quiz.questions.get()
+        assert f"[S1] {question.source.title} by Lecturer" in prompt
+        assert question.source in era_items
+        assert question.bank_question.source == question.source
+
+        quiz.completed_at = timezone.now()
+        quiz.save()
+        url = reverse("quiz:quiz-detail", kwargs={"pk": quiz.id})
+        response = authenticated_client.get(url)
+        assert response.data["questions"][0]["source_title"] == question.source.title
+
 
 # =============================================================================
 # Service Function Tests
@@ -632,22 +1518,17 @@ class TestQuizStatsAPI:
 class TestQuizServices:
     """Test quiz service functions."""
 
+    @pytest.mark.usefixtures("generating_quiz")
     @patch("apps.quiz.services.client")
     def test_generate_quiz_questions(self, mock_client, quiz, sample_era):
         """Test quiz question generation."""
         from apps.quiz.services import generate_quiz_questions
 
-        # Mock OpenAI response
-        mock_response = MagicMock()
-        mock_response.choices = [
-            MagicMock(
-                message=MagicMock(
-                    content='{"questions": [{"question_text": "Test?", "question_type": "mc", "options": ["A", "B", "C", "D"], "correct_answer": "0", "explanation": "Test explanation"}]}'
-                )
-            )
-        ]
-        mock_response.usage = MagicMock(prompt_tokens=100, completion_tokens=200)
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "Test?", "question_type": "mc", '
+            '"options": ["A", "B", "C", "D"], "correct_answer": "0", '
+            '"explanation": "Test explanation"}]}'
+        )
 
         generate_quiz_questions(quiz)
 
@@ -665,6 +1546,269 @@ class TestQuizServices:
         assert quiz.generation_input_tokens == 100
         assert quiz.generation_output_tokens == 200
 
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_generate_quiz_questions_saves_each_question_early(
+        self, mock_client, quiz
+    ):
+        """Test a question is saved as soon as its JSON object is streamed."""
+        from apps.quiz.services import generate_quiz_questions
+
+        first = stream_chunks(
+            '{"questions": [{"question_text": "First?", "question_type": "tf", '
+            '"options": ["True", "False"], "correct_answer": "1", '
+            '"explanation": "Because."},'
+        )[:-1]
+        rest = stream_chunks(
+            ' {"question_text": "Second?", "question_type": "mc", '
+            '"options": ["A", "B", "C", "D"], "correct_answer": "2", '
+            '"explanation": "Because."}]}'
+        )
+        saved_before_rest = []
+
+        def stream():
+            yield from first
+            saved_before_rest.extend(
+                quiz.questions.values_list("question_text", flat=True)
+            )
+            yield from rest
+
+        mock_client.chat.completions.create.return_value = stream()
+
+        generate_quiz_questions(quiz)
+
+        assert saved_before_rest == ["First?"]
+        assert list(quiz.questions.values_list("question_text", "order")) == [
+            ("First?", 1),
+            ("Second?", 2),
+        ]
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.READY
+        assert quiz.total_questions == 2
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_generate_quiz_questions_truncated_stream(self, mock_client, quiz):
+        """Test questions completed before a cut-off response are kept."""
+        from apps.quiz.services import generate_quiz_questions
+
+        chunks = stream_chunks(
+            '{"questions": [{"question_text": "Kept?", "question_type": "sa", '
+            '"options": [], "correct_answer": "Ref", "explanation": "Because."}, '
+            '{"question_text": "Cut off'
+        )
+        mock_client.chat.completions.create.return_value = chunks
+
+        generate_quiz_questions(quiz)
+
+        assert list(quiz.questions.values_list("question_text", flat=True)) == [
+            "Kept?"
+        ]
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.client")
+    def test_generate_quiz_questions_none_valid(self, mock_client, quiz):
+        """Test a response without valid questions raises."""
+        from apps.quiz.services import generate_quiz_questions
+
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "No answer?"}]}'
+        )
+
+        with pytest.raises(ValueError):
+            generate_quiz_questions(quiz)
+        assert not quiz.questions.exists()
+
+    def test_question_stream_parser(self):
+        """Test question objects are extracted across arbitrary chunk splits."""
+        from apps.quiz.streaming import QuestionStreamParser
+
+        document = (
+            '{"questions": [{"question_text": "Is \\"{[}\\" a string?", '
+            '"options": ["A}", "B]"], "meta": {"n": 1}}, '
+            '{"question_text": "Second"}]}'
+        )
+        for size in (1, 3, 7, len(document)):
+            parser = QuestionStreamParser()
+            questions = []
+            for i in range(0, len(document), size):
+                questions.extend(parser.feed(document[i : i + size]))
+
+            assert questions == [
+                {
+                    "question_text": 'Is "{[}" a string?',
+                    "options": ["A}", "B]"],
+                    "meta": {"n": 1},
+                },
+                {"question_text": "Second"},
+            ]
+
+    @patch("apps.quiz.services.client")
+    def test_generate_quiz_task(self, mock_client, quiz):
+        """Test the Celery task generates a pending quiz exactly once."""
+        from apps.quiz.tasks import generate_quiz
+
+        mock_client.chat.completions.create.return_value = stream_chunks(
+            '{"questions": [{"question_text": "Test?", '
+            '"question_type": "tf", "options": ["True", "False"], '
+            '"correct_answer": "0", "explanation": "Because."}]}'
+        )
+
+        generate_quiz.apply(args=[quiz.id])
+        generate_quiz.apply(args=[quiz.id])
+
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.READY
+        assert quiz.questions.count() == 1
+        assert mock_client.chat.completions.create.call_count == 1
+
+    @patch("apps.quiz.tasks.generate_quiz_questions")
+    def test_generate_quiz_task_failure(self, mock_generate, quiz):
+        """Test a failed generation is recorded on the quiz."""
+        from apps.quiz.tasks import generate_quiz
+
+        mock_generate.side_effect = BudgetExceededError(
+            "user", 1000, get_reset_time()
+        )
+
+        generate_quiz.apply(args=[quiz.id])
+
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.FAILED
+        assert "usage limit" in quiz.generation_error
+
+    @patch("apps.quiz.tasks.generate_quiz_questions")
+    def test_generate_quiz_task_retries_while_unavailable(self, mock_generate, quiz):
+        """Test an open breaker requeues generation before failing the quiz."""
+        from apps.quiz.tasks import MAX_UNAVAILABLE_RETRIES, generate_quiz
+
+        mock_generate.side_effect = CircuitOpenError("openai:gpt-4o", 0)
+
+        generate_quiz.apply(args=[quiz.id])
+
+        assert mock_generate.call_count == MAX_UNAVAILABLE_RETRIES + 1
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.FAILED
+        assert "temporarily unavailable" in quiz.generation_error
+
+    @pytest.mark.usefixtures("generating_quiz")
+    @patch("apps.quiz.services.request_questions")
+    def test_generate_quiz_questions_requests_only_missing(
+        self, mock_request, quiz
+    ):
+        """Test a retried generation keeps its questions and asks for the rest."""
+        from apps.quiz.services import generate_quiz_questions
+
+        QuizQuestion.objects.create(
+            quiz=quiz,
+            question_text="Saved?",
+            question_type=QuizQuestion.QuestionType.TRUE_FALSE,
+            options=["True", "False"],
+            correct_answer="0",
+            order=1,
+        )
+        usage = MagicMock(prompt_tokens=10, completion_tokens=20)
+        mock_request.return_value = ([], usage)
+
+        generate_quiz_questions(quiz)
+
+        assert mock_request.call_args.args[2] == {
+            QuizQuestion.QuestionType.MULTIPLE_CHOICE: 3,
+            QuizQuestion.QuestionType.TRUE_FALSE: 0,
+            QuizQuestion.QuestionType.SHORT_ANSWER: 1,
+        }
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.READY
+        assert list(quiz.questions.values_list("question_text", flat=True)) == [
+            "Saved?"
+        ]
+
+    @patch("apps.quiz.tasks.generate_quiz_questions")
+    def test_generate_quiz_task_failure_deletes_partial_questions(
+        self, mock_generate, quiz
+    ):
+        """Test a failed generation does not leave a partial quiz behind."""
+        from apps.quiz.tasks import generate_quiz
+
+        def partial(quiz):
+            QuizQuestion.objects.create(
+                quiz=quiz, question_text="Partial?", correct_answer="0", order=1
+            )
+            raise RuntimeError("stream cut off")
+
+        mock_generate.side_effect = partial
+
+        generate_quiz.apply(args=[quiz.id])
+
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.FAILED
+        assert not quiz.questions.exists()
+
+    def test_fail_stale_quizzes(self, quiz, user, settings):
+        """Test quizzes generating or pending past the timeout are failed."""
+        from django.utils import timezone
+
+        from apps.quiz.tasks import fail_stale_quizzes
+
+        settings.QUIZ_GENERATION_TIMEOUT_SECONDS = 600
+        long_ago = timezone.now() - timedelta(minutes=11)
+        # Queued for a long time, but its generation only just started
+        started_late = Quiz.objects.create(
+            user=user, total_questions=5, status=Quiz.Status.GENERATING
+        )
+        Quiz.objects.filter(pk=started_late.pk).update(
+            created_at=long_ago, generation_started_at=timezone.now()
+        )
+        # Its task was lost before it was claimed
+        lost = Quiz.objects.create(user=user, total_questions=5)
+        Quiz.objects.filter(pk=lost.pk).update(created_at=long_ago)
+        Quiz.objects.filter(pk=quiz.pk).update(
+            status=Quiz.Status.GENERATING, generation_started_at=long_ago
+        )
+        QuizQuestion.objects.create(
+            quiz=quiz, question_text="Partial?", correct_answer="0", order=1
+        )
+
+        assert fail_stale_quizzes() == 2
+
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.FAILED
+        assert quiz.generation_error
+        assert not quiz.questions.exists()
+        lost.refresh_from_db()
+        assert lost.status == Quiz.Status.FAILED
+        started_late.refresh_from_db()
+        assert started_late.status == Quiz.Status.GENERATING
+
+    @patch("apps.quiz.services.client")
+    def test_swept_quiz_is_not_readied(self, mock_client, quiz):
+        """Test a worker stops once the sweep has failed its quiz."""
+        from apps.quiz.tasks import generate_quiz
+
+        def stream(**kwargs):
+            Quiz.objects.filter(pk=quiz.pk).update(status=Quiz.Status.FAILED)
+            yield from stream_chunks(
+                '{"questions": [{"question_text": "Late?", '
+                '"question_type": "tf", "options": ["True", "False"], '
+                '"correct_answer": "0", "explanation": "Because."}]}'
+            )
+
+        mock_client.chat.completions.create.side_effect = stream
+
+        generate_quiz.apply(args=[quiz.id])
+
+        quiz.refresh_from_db()
+        assert quiz.status == Quiz.Status.FAILED
+        assert quiz.generation_started_at is not None
+        assert not quiz.questions.exists()
+
+    def test_fail_stale_quizzes_runs_on_beat_schedule(self, settings):
+        """Test the stale quiz sweep is registered with celery beat."""
+        tasks = {entry["task"] for entry in settings.CELERY_BEAT_SCHEDULE.values()}
+
+        assert "apps.quiz.tasks.fail_stale_quizzes" in tasks
+
     @patch("apps.quiz.services.client")
     def test_grade_short_answer(self, mock_client):
         """Test short answer grading."""
@@ -681,7 +1825,7 @@ class TestQuizServices:
         ]
         mock_client.chat.completions.create.return_value = mock_response
 
-        is_correct, feedback = grade_short_answer(
+        is_correct, feedback, usage = grade_short_answer(
             "What is Nicaea?",
             "The Council of Nicaea established the Nicene Creed.",
             "It created the Nicene Creed to address Arianism.",
@@ -689,8 +1833,57 @@ class TestQuizServices:
 
         assert is_correct is True
         assert feedback == "Excellent answer!"
+        assert usage is mock_response.usage
         assert mock_client.chat.completions.create.called
 
+    @patch("apps.quiz.services.client")
+    def test_grade_short_answers(self, mock_client):
+        """Test several short answers are graded in one call."""
+        from apps.quiz.services import grade_short_answers
+
+        mock_response = MagicMock()
+        mock_response.choices = [
+            MagicMock(
+                message=MagicMock(
+                    content='{"grades": [{"answer": 1, "is_correct": false, '
+                    '"feedback": "No."}, {"answer": 0, "is_correct": true, '
+                    '"feedback": "Yes."}]}'
+                )
+            )
+        ]
+        mock_client.chat.completions.create.return_value = mock_response
+
+        grades, usage = grade_short_answers(
+            [("Q1?", "Ref 1.", "A1"), ("Q2?", "Ref 2.", "A2")]
+        )
+
+        assert grades == [(True, "Yes."), (False, "No.")]
+        assert usage is mock_response.usage
+        assert mock_client.chat.completions.create.call_count == 1
+
+    @patch("apps.quiz.services.client")
+    def test_grade_short_answers_incomplete_response(self, mock_client):
+        """Test a response missing a grade falls back for every answer."""
+        from apps.quiz.services import grade_short_answers
+
+        mock_response = MagicMock()
+        mock_response.choices = [
+            MagicMock(
+                message=MagicMock(
+                    content='{"grades": [{"answer": 0, "is_correct": true, '
+                    '"feedback": "Yes."}]}'
+                )
+            )
+        ]
+        mock_client.chat.completions.create.return_value = mock_response
+
+        grades, usage = grade_short_answers(
+            [("Q1?", "Ref 1.", "A1"), ("Q2?", "Ref 2.", "A2")]
+        )
+
+        assert [is_correct for is_correct, _feedback in grades] == [False, False]
+        assert usage is None
+
     @patch("apps.quiz.services.client")
     def test_grade_short_answer_error(self, mock_client):
         """Test short answer grading with API error."""
@@ -699,7 +1892,7 @@ class TestQuizServices:
         # Mock OpenAI error
         mock_client.chat.completions.create.side_effect = Exception("API Error")
 
-        is_correct, feedback = grade_short_answer(
+        is_correct, feedback, _usage = grade_short_answer(
             "What is Nicaea?",
             "The Council of Nicaea established the Nicene Creed.",
             "User answer",
@@ -708,3 +1901,244 @@ class TestQuizServices:
         # Should return fallback values
         assert is_correct is False
         assert "couldn't grade" in feedback
+        assert _usage is None
+
+    @patch("apps.quiz.services.client")
+    def test_grade_short_answer_breaker_open(self, mock_client):
+        """Test grading falls back without calling OpenAI while the breaker is open."""
+        from apps.quiz.services import grade_short_answer
+
+        with patch.object(
+            CircuitBreaker, "check", side_effect=CircuitOpenError("openai:gpt-4o", 20)
+        ):
+            is_correct, feedback, _usage = grade_short_answer(
+                "What is Nicaea?", "The Nicene Creed.", "User answer"
+            )
+
+        assert is_correct is False
+        assert "couldn't grade" in feedback
+        mock_client.chat.completions.create.assert_not_called()
+
+    @patch("apps.quiz.services.client")
+    def test_grade_short_answer_budget_exhausted(self, mock_client, settings):
+        """Test grading is skipped once the user's token budget is used."""
+        from apps.quiz.services import grade_short_answer
+
+        settings.LLM_USER_DAILY_TOKENS = 10
+
+        is_correct, feedback, _usage = grade_short_answer(
+            "What is Nicaea?", "The Nicene Creed.", "User answer", user_id=1
+        )
+
+        assert is_correct is False
+        assert "usage limit" in feedback
+        mock_client.chat.completions.create.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestReviewQueue:
+    """Test the spaced repetition review of missed questions."""
+
+    def submit(self, client, question, answer):
+        url = reverse("quiz:quiz-submit-answer", kwargs={"pk": question.quiz_id})
+        return client.post(
+            url, {"question_id": question.id, "answer": answer}, format="json"
+        )
+
+    def test_schedule_follows_sm2(self):
+        """Test intervals grow with correct answers and restart on a lapse."""
+        from django.utils import timezone
+
+        from apps.quiz.models import ReviewItem
+        from apps.quiz.review import schedule
+
+        now = timezone.now()
+        item = ReviewItem()
+        schedule(item, False, now)
+        assert (item.repetitions, item.interval_days) == (0, 1)
+        assert item.ease_factor == pytest.approx(2.18)
+        assert item.due_at == now + timedelta(days=1)
+
+        intervals = []
+        for _ in range(3):
+            schedule(item, True, now)
+            intervals.append(item.interval_days)
+        assert intervals == [1, 6, 13]
+        assert item.ease_factor == pytest.approx(2.18)
+
+        for _ in range(5):
+            schedule(item, False, now)
+        assert item.interval_days == 1
+        assert item.ease_factor == 1.3
+
+    def test_wrong_answer_is_scheduled(self, authenticated_client, user, quiz_question):
+        """Test a missed question enters the schedule, due the next day."""
+        from apps.quiz.models import ReviewItem
+
+        self.submit(authenticated_client, quiz_question, "0")
+
+        item = ReviewItem.objects.get(user=user)
+        assert item.question_text == quiz_question.question_text
+        assert item.era_id == quiz_question.quiz.era_id
+        assert item.interval_days == 1
+        assert item.due_at > quiz_question.created_at + timedelta(hours=23)
+
+    def test_correct_answer_is_not_scheduled(
+        self, authenticated_client, user, quiz_question
+    ):
+        """Test questions answered correctly stay out of the schedule."""
+        from apps.quiz.models import ReviewItem
+
+        self.submit(authenticated_client, quiz_question, "1")
+
+        assert not ReviewItem.objects.filter(user=user).exists()
+
+    def test_later_answer_reschedules_item(
+        self, authenticated_client, user, quiz_question, completed_quiz
+    ):
+        """Test the same question in another quiz updates the existing item."""
+        from apps.quiz.models import ReviewItem
+        from apps.quiz.review import record_answers
+
+        self.submit(authenticated_client, quiz_question, "0")
+        again = QuizQuestion.objects.create(
+            quiz=completed_quiz,
+            question_text="What year was the council of Nicaea",
+            question_type=QuizQuestion.QuestionType.MULTIPLE_CHOICE,
+            options=["313", "325", "381", "451"],
+            correct_answer="1",
+            user_answer="1",
+            is_correct=True,
+            order=3,
+        )
+
+        record_answers(user, [again])
+
+        item = ReviewItem.objects.get(user=user)
+        assert item.question_text == again.question_text
+        assert item.repetitions == 1
+
+    def test_repeated_answer_does_not_reschedule(
+        self, authenticated_client, user, quiz_question
+    ):
+        """Test only the first grade of a quiz question is recorded."""
+        from apps.quiz.models import ReviewItem
+
+        self.submit(authenticated_client, quiz_question, "0")
+        item = ReviewItem.objects.get(user=user)
+
+        self.submit(authenticated_client, quiz_question, "1")
+        url = reverse("quiz:quiz-submit-answers", kwargs={"pk": quiz_question.quiz_id})
+        authenticated_client.post(
+            url,
+            {"answers": [{"question_id": quiz_question.id, "answer": "1"}]},
+            format="json",
+        )
+
+        rescheduled = ReviewItem.objects.get(user=user)
+        assert rescheduled.repetitions == 0
+        assert rescheduled.due_at == item.due_at
+
+    def test_answer_to_completed_quiz_rejected(
+        self, authenticated_client, user, quiz_question
+    ):
+        """Test answers to a completed quiz are refused and not recorded."""
+        from django.utils import timezone
+
+        from apps.quiz.models import ReviewItem
+
+        Quiz.objects.filter(pk=quiz_question.quiz_id).update(
+            completed_at=timezone.now()
+        )
+
+        response = self.submit(authenticated_client, quiz_question, "0")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["error"] == "Quiz already completed."
+        quiz_question.refresh_from_db()
+        assert quiz_question.user_answer == ""
+        assert not ReviewItem.objects.filter(user=user).exists()
+
+    @pytest.fixture
+    def due_items(self, user, quiz, quiz_question):
+        """Schedule the quiz question (due) and a true/false one (not due)."""
+        from django.utils import timezone
+
+        from apps.quiz.models import ReviewItem
+
+        now = timezone.now()
+        later = QuizQuestion.objects.create(
+            quiz=quiz,
+            question_text="Augustine was Bishop of Hippo.",
+            question_type=QuizQuestion.QuestionType.TRUE_FALSE,
+            options=["True", "False"],
+            correct_answer="0",
+            order=2,
+        )
+        for question, key, due_at in [
+            (quiz_question, "a", now - timedelta(hours=1)),
+            (later, "b", now + timedelta(days=1)),
+        ]:
+            ReviewItem.objects.create(
+                user=user,
+                era=quiz.era,
+                question_text=question.question_text,
+                question_type=question.question_type,
+                options=question.options,
+                correct_answer=question.correct_answer,
+                fingerprint=key,
+                due_at=due_at,
+            )
+
+    @patch("apps.quiz.services.client")
+    def test_review_quiz_from_due_items(
+        self, mock_client, authenticated_client, quiz, quiz_question, due_items
+    ):
+        """Test a review quiz copies the due questions without an LLM call."""
+        response = authenticated_client.post(reverse("quiz:quiz-review"))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["status"] == Quiz.Status.READY
+        assert response.data["total_questions"] == 1
+        assert response.data["era"] == quiz.era_id
+        assert [q["question_text"] for q in response.data["questions"]] == [
+            quiz_question.question_text
+        ]
+        mock_client.chat.completions.create.assert_not_called()
+
+    def test_review_survives_deleted_quiz(
+        self, authenticated_client, quiz, quiz_question, due_items
+    ):
+        """Test review items outlive the quiz their question was answered in."""
+        quiz.delete()
+
+        response = authenticated_client.post(reverse("quiz:quiz-review"))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [q["question_text"] for q in response.data["questions"]] == [
+            quiz_question.question_text
+        ]
+
+    def test_open_review_quiz_is_returned(self, authenticated_client, due_items):
+        """Test starting a review again returns the uncompleted review quiz."""
+        first = authenticated_client.post(reverse("quiz:quiz-review"))
+        again = authenticated_client.post(reverse("quiz:quiz-review"))
+
+        assert again.status_code == status.HTTP_200_OK
+        assert again.data["id"] == first.data["id"]
+        assert Quiz.objects.filter(is_review=True).count() == 1
+
+    def test_review_is_throttled(self, authenticated_client, due_items):
+        """Test starting reviews is rate limited like quiz creation."""
+        for _ in range(3):
+            authenticated_client.post(reverse("quiz:quiz-review"))
+
+        response = authenticated_client.post(reverse("quiz:quiz-review"))
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_review_quiz_with_nothing_due(self, authenticated_client):
+        """Test starting a review without due questions is rejected."""
+        response = authenticated_client.post(reverse("quiz:quiz-review"))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
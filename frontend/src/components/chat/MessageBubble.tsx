@@ -1,7 +1,7 @@
 import Markdown from "react-markdown";
 import remarkGfm from "remark-gfm";
 import { ExternalLink } from "lucide-react";
-import type { ChatMessage } from "@/types";
+import type { ChatMessage, SourceCitation } from "@/types";
 import { cn } from "@/lib/utils";
 
 type MessageBubbleProps = {
@@ -109,27 +109,35 @@ export function MessageBubble({ message }: MessageBubbleProps) {
 
         {/* Source Citations */}
         {!isUser && message.sources && message.sources.length > 0 && (
-          <div className="mt-3 flex flex-wrap gap-1.5 border-t border-[hsl(var(--border))] pt-2">
-            {message.sources.map((source, index) => (
-              <a
-                key={index}
-                href={source.url}
-                target="_blank"
-                rel="noopener noreferrer"
-                className={cn(
-                  "inline-flex items-center gap-1 rounded-full px-2.5 py-1",
-                  "bg-[hsl(var(--muted))] text-xs text-[hsl(var(--muted-foreground))]",
-                  "transition-colors hover:bg-[hsl(var(--secondary))] hover:text-[hsl(var(--foreground))]",
-                )}
-                title={source.source}
-              >
-                <ExternalLink className="h-3 w-3" />
-                {source.title}
-              </a>
-            ))}
-          </div>
+          <SourceList sources={message.sources} />
         )}
       </div>
     </div>
   );
 }
+
+// Source citation links below an assistant message (also shown while the
+// message is streaming)
+export function SourceList({ sources }: { sources: SourceCitation[] }) {
+  return (
+    <div className="mt-3 flex flex-wrap gap-1.5 border-t border-[hsl(var(--border))] pt-2">
+      {sources.map((source, index) => (
+        <a
+          key={index}
+          href={source.url}
+          target="_blank"
+          rel="noopener noreferrer"
+          className={cn(
+            "inline-flex items-center gap-1 rounded-full px-2.5 py-1",
+            "bg-[hsl(var(--muted))] text-xs text-[hsl(var(--muted-foreground))]",
+            "transition-colors hover:bg-[hsl(var(--secondary))] hover:text-[hsl(var(--foreground))]",
+          )}
+          title={source.source}
+        >
+          <ExternalLink className="h-3 w-3" />
+          {source.title}
+        </a>
+      ))}
+    </div>
+  );
+}
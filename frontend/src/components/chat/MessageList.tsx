@@ -3,17 +3,27 @@ import Markdown from "react-markdown";
 import remarkGfm from "remark-gfm";
 import { Loader2 } from "lucide-react";
 import { useChatStore } from "@/stores/chatStore";
-import { MessageBubble } from "./MessageBubble";
+import { MessageBubble, SourceList } from "./MessageBubble";
 
 export function MessageList() {
-  const { messages, isStreaming, streamingContent, isLoadingMessages } =
-    useChatStore();
+  const {
+    messages,
+    isStreaming,
+    streamingContent,
+    streamingSources,
+    isLoadingMessages,
+    hasOlderMessages,
+    isLoadingOlderMessages,
+    loadOlderMessages,
+  } = useChatStore();
   const bottomRef = useRef<HTMLDivElement>(null);
+  const lastMessageId = messages[messages.length - 1]?.id;
 
-  // Auto-scroll to bottom on new messages or streaming content
+  // Auto-scroll to bottom on new messages or streaming content (but not
+  // when older messages are prepended)
   useEffect(() => {
     bottomRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages, streamingContent]);
+  }, [lastMessageId, streamingContent]);
 
   if (isLoadingMessages) {
     return (
@@ -29,6 +39,20 @@ export function MessageList() {
   return (
     <div className="flex-1 overflow-y-auto px-4 py-6">
       <div className="mx-auto flex max-w-3xl flex-col gap-4">
+        {hasOlderMessages && (
+          <button
+            type="button"
+            onClick={() => loadOlderMessages()}
+            disabled={isLoadingOlderMessages}
+            className="mx-auto flex items-center text-sm text-[hsl(var(--muted-foreground))] hover:text-[hsl(var(--foreground))] disabled:opacity-50"
+          >
+            {isLoadingOlderMessages && (
+              <Loader2 className="mr-1.5 h-4 w-4 animate-spin" />
+            )}
+            Load older messages
+          </button>
+        )}
+
         {messages.map((message) => (
           <MessageBubble key={message.id} message={message} />
         ))}
@@ -59,6 +83,9 @@ export function MessageList() {
               {streamingContent && (
                 <span className="ml-0.5 inline-block h-4 w-0.5 animate-pulse bg-[hsl(var(--foreground))]" />
               )}
+              {streamingSources.length > 0 && (
+                <SourceList sources={streamingSources} />
+              )}
             </div>
           </div>
         )}
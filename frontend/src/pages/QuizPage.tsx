@@ -142,8 +142,16 @@ export function QuizPage() {
                 explanation={currentFeedback.explanation}
                 feedback={currentFeedback.feedback ?? undefined}
                 onNext={nextQuestion}
-                isLastQuestion={currentQuestionIndex === activeQuiz.questions.length - 1}
+                isLastQuestion={currentQuestionIndex === activeQuiz.totalQuestions - 1}
               />
+            ) : !currentQuestion ? (
+              // Question still being generated
+              <div className="flex flex-col items-center py-8 text-center">
+                <Loader2 className="h-8 w-8 animate-spin text-primary-600 dark:text-primary-400 mb-3" />
+                <p className="text-sm text-[hsl(var(--muted-foreground))]">
+                  {error || "Generating the next question..."}
+                </p>
+              </div>
             ) : (
               // Show question
               <>
@@ -22,6 +22,7 @@ function mapMessage(data: Record<string, unknown>): ChatMessage {
     content: data.content as string,
     createdAt: data.created_at as string,
     sources: citations?.map(mapCitation),
+    isTruncated: Boolean(data.is_truncated),
   };
 }
 
@@ -52,14 +53,34 @@ export async function deleteChatSession(sessionId: string): Promise<void> {
   await api.delete(`/chat/sessions/${sessionId}/`);
 }
 
+export type MessagePage = {
+  messages: ChatMessage[];
+  hasMore: boolean;
+};
+
+// Messages are keyset-paginated: the newest page by default, older
+// messages with `before`, and messages newer than one the client already
+// has with `after`. Pages are always in chronological order.
 export async function fetchMessages(
   sessionId: string,
-): Promise<ChatMessage[]> {
-  const response = await api.get(`/chat/sessions/${sessionId}/messages/`);
-  // Messages endpoint has pagination disabled - returns a plain array
-  return response.data.map(mapMessage);
+  cursor: { before?: string; after?: string } = {},
+): Promise<MessagePage> {
+  const response = await api.get(`/chat/sessions/${sessionId}/messages/`, {
+    params: cursor,
+  });
+  return {
+    messages: response.data.results.map(mapMessage),
+    hasMore: response.data.has_more,
+  };
 }
 
+// Errors that should not trigger a reconnect (e.g. 4xx responses)
+class FatalStreamError extends Error {}
+
+// Reconnect attempts after a dropped stream. fetchEventSource re-sends the
+// request with Last-Event-ID, and the server resumes the same answer.
+const MAX_STREAM_RETRIES = 3;
+
 // SSE streaming function - returns abort controller
 export function streamChatMessage(
   sessionId: string,
@@ -67,12 +88,14 @@ export function streamChatMessage(
   csrfToken: string,
   callbacks: {
     onDelta: (content: string) => void;
+    onCitation: (citation: SourceCitation) => void;
     onDone: (messageId: string, citations: SourceCitation[]) => void;
     onError: (error: Error) => void;
   },
 ): AbortController {
   const controller = new AbortController();
   const baseUrl = import.meta.env.VITE_API_BASE_URL || "/api";
+  let retries = 0;
 
   fetchEventSource(`${baseUrl}/chat/stream/`, {
     method: "POST",
@@ -83,12 +106,35 @@ export function streamChatMessage(
     credentials: "include" as RequestCredentials,
     body: JSON.stringify({ session_id: sessionId, message }),
     signal: controller.signal,
+    async onopen(response) {
+      const contentType = response.headers.get("content-type") || "";
+      if (response.ok && contentType.startsWith("text/event-stream")) {
+        return;
+      }
+      // Surface the server's reason (e.g. a 429 once the daily token
+      // budget is used up) instead of a bare status code
+      let reason = `Stream failed (${response.status})`;
+      try {
+        const body = await response.json();
+        if (body.error) {
+          reason = body.error;
+        }
+      } catch {
+        // Not a JSON error body
+      }
+      throw new FatalStreamError(reason);
+    },
     onmessage(event) {
+      retries = 0;
       try {
         const data = JSON.parse(event.data);
         if (data.type === "delta") {
           callbacks.onDelta(data.content);
         }
+        // Sent as soon as the response first cites a source
+        if (data.type === "citation") {
+          callbacks.onCitation(mapCitation(data.citation));
+        }
         if (data.type === "done") {
           const citations: SourceCitation[] = (data.citations || []).map(
             (c: Record<string, unknown>) => mapCitation(c),
@@ -100,6 +146,10 @@ export function streamChatMessage(
       }
     },
     onerror(err) {
+      if (!(err instanceof FatalStreamError) && retries < MAX_STREAM_RETRIES) {
+        retries += 1;
+        return retries * 1000; // Retry with Last-Event-ID after a delay
+      }
       callbacks.onError(
         err instanceof Error ? err : new Error("Stream failed"),
       );
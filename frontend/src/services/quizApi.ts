@@ -1,5 +1,11 @@
 import api from "./api";
-import type { Quiz, QuizFeedback, QuizHistoryItem, QuizStats } from "@/types";
+import type {
+  Quiz,
+  QuizFeedback,
+  QuizHistoryItem,
+  QuizStats,
+  QuizGenerationProgress,
+} from "@/types";
 
 function mapQuiz(data: any): Quiz {
   return {
@@ -11,6 +17,8 @@ function mapQuiz(data: any): Quiz {
     totalQuestions: data.total_questions,
     percentageScore: data.percentage_score,
     passed: data.passed,
+    status: data.status,
+    generationError: data.generation_error ?? "",
     completedAt: data.completed_at,
     createdAt: data.created_at,
     questions: data.questions.map((q: any) => ({
@@ -43,19 +51,39 @@ function mapQuizHistoryItem(data: any): QuizHistoryItem {
   };
 }
 
+// Creates a pending quiz; its questions are generated in the background
+// and appear one by one (see fetchQuizStatus).
+// The idempotency key makes a retried request return the same quiz.
 export async function createQuiz(
   eraId: number | null,
   difficulty: string,
-  questionCount: number
+  questionCount: number,
+  idempotencyKey: string = crypto.randomUUID()
 ): Promise<Quiz> {
-  const response = await api.post("/quiz/quizzes/", {
-    era_id: eraId,
-    difficulty,
-    question_count: questionCount,
-  });
+  const response = await api.post(
+    "/quiz/quizzes/",
+    {
+      era_id: eraId,
+      difficulty,
+      question_count: questionCount,
+    },
+    { headers: { "Idempotency-Key": idempotencyKey } }
+  );
   return mapQuiz(response.data);
 }
 
+export async function fetchQuizStatus(
+  quizId: number
+): Promise<QuizGenerationProgress> {
+  const response = await api.get(`/quiz/quizzes/${quizId}/status/`);
+  return {
+    status: response.data.status,
+    generationError: response.data.generation_error,
+    totalQuestions: response.data.total_questions,
+    questionsReady: response.data.questions_ready,
+  };
+}
+
 export async function fetchQuiz(quizId: number): Promise<Quiz> {
   const response = await api.get(`/quiz/quizzes/${quizId}/`);
   return mapQuiz(response.data);
@@ -15,8 +15,11 @@ type ChatState = {
   messages: ChatMessage[];
   isStreaming: boolean;
   streamingContent: string;
+  streamingSources: SourceCitation[];
   isLoadingSessions: boolean;
   isLoadingMessages: boolean;
+  hasOlderMessages: boolean;
+  isLoadingOlderMessages: boolean;
   error: string | null;
 
   // Actions
@@ -25,6 +28,7 @@ type ChatState = {
   deleteSession: (sessionId: string) => Promise<void>;
   setActiveSession: (sessionId: string) => void;
   loadMessages: (sessionId: string) => Promise<void>;
+  loadOlderMessages: () => Promise<void>;
   sendMessage: (content: string) => Promise<void>;
   cancelStream: () => void;
   clearError: () => void;
@@ -32,14 +36,33 @@ type ChatState = {
 
 let abortController: AbortController | null = null;
 
+// Messages of sessions opened earlier, so reopening one only fetches
+// what was added since its last known message
+const messageCache = new Map<
+  string,
+  { messages: ChatMessage[]; hasOlderMessages: boolean }
+>();
+
+// Id of the newest message the server has confirmed (optimistic user
+// messages have temporary ids)
+function lastSavedMessageId(messages: ChatMessage[]): string | undefined {
+  for (let i = messages.length - 1; i >= 0; i--) {
+    if (!messages[i].id.startsWith("temp-")) return messages[i].id;
+  }
+  return undefined;
+}
+
 export const useChatStore = create<ChatState>((set, get) => ({
   sessions: [],
   activeSessionId: null,
   messages: [],
   isStreaming: false,
   streamingContent: "",
+  streamingSources: [],
   isLoadingSessions: false,
   isLoadingMessages: false,
+  hasOlderMessages: false,
+  isLoadingOlderMessages: false,
   error: null,
 
   loadSessions: async () => {
@@ -66,6 +89,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
         sessions: [session, ...state.sessions],
         activeSessionId: session.id,
         messages: [],
+        hasOlderMessages: false,
       }));
       return session;
     } catch (error) {
@@ -82,6 +106,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
     try {
       set({ error: null });
       await deleteChatSession(sessionId);
+      messageCache.delete(sessionId);
       set((state) => {
         const sessions = state.sessions.filter((s) => s.id !== sessionId);
         const isActive = state.activeSessionId === sessionId;
@@ -102,17 +127,52 @@ export const useChatStore = create<ChatState>((set, get) => ({
   },
 
   setActiveSession: (sessionId: string) => {
-    set({ activeSessionId: sessionId, messages: [], error: null });
+    const { activeSessionId, messages, hasOlderMessages } = get();
+    if (activeSessionId) {
+      messageCache.set(activeSessionId, { messages, hasOlderMessages });
+    }
+    const cached = messageCache.get(sessionId);
+    set({
+      activeSessionId: sessionId,
+      messages: cached?.messages ?? [],
+      hasOlderMessages: cached?.hasOlderMessages ?? false,
+      error: null,
+    });
     get().loadMessages(sessionId);
   },
 
   loadMessages: async (sessionId: string) => {
     try {
-      set({ isLoadingMessages: true, error: null });
-      const messages = await fetchMessages(sessionId);
-      // Only update if this session is still the active one
+      const cached = get().messages;
+      const after = lastSavedMessageId(cached);
+      if (!after) {
+        set({ isLoadingMessages: true, error: null });
+        const page = await fetchMessages(sessionId);
+        // Only update if this session is still the active one
+        if (get().activeSessionId === sessionId) {
+          set({
+            messages: page.messages,
+            hasOlderMessages: page.hasMore,
+            isLoadingMessages: false,
+          });
+        }
+        return;
+      }
+
+      // Reopened session: fetch only the messages added since
+      let messages = cached.slice(
+        0,
+        cached.findIndex((m) => m.id === after) + 1,
+      );
+      let cursor = after;
+      for (;;) {
+        const page = await fetchMessages(sessionId, { after: cursor });
+        messages = [...messages, ...page.messages];
+        if (!page.hasMore || page.messages.length === 0) break;
+        cursor = page.messages[page.messages.length - 1].id;
+      }
       if (get().activeSessionId === sessionId) {
-        set({ messages, isLoadingMessages: false });
+        set({ messages });
       }
     } catch (error) {
       set({
@@ -123,6 +183,36 @@ export const useChatStore = create<ChatState>((set, get) => ({
     }
   },
 
+  loadOlderMessages: async () => {
+    const { activeSessionId, messages, hasOlderMessages, isLoadingOlderMessages } =
+      get();
+    if (!activeSessionId || !hasOlderMessages || isLoadingOlderMessages) return;
+    const oldest = messages.find((m) => !m.id.startsWith("temp-"));
+    if (!oldest) return;
+
+    try {
+      set({ isLoadingOlderMessages: true, error: null });
+      const page = await fetchMessages(activeSessionId, { before: oldest.id });
+      if (get().activeSessionId === activeSessionId) {
+        set((state) => ({
+          messages: [...page.messages, ...state.messages],
+          hasOlderMessages: page.hasMore,
+          isLoadingOlderMessages: false,
+        }));
+      } else {
+        set({ isLoadingOlderMessages: false });
+      }
+    } catch (error) {
+      set({
+        error:
+          error instanceof Error
+            ? error.message
+            : "Failed to load older messages",
+        isLoadingOlderMessages: false,
+      });
+    }
+  },
+
   sendMessage: async (content: string) => {
     const { activeSessionId } = get();
     if (!activeSessionId) return;
@@ -139,6 +229,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
       messages: [...state.messages, userMessage],
       isStreaming: true,
       streamingContent: "",
+      streamingSources: [],
       error: null,
     }));
 
@@ -156,18 +247,31 @@ export const useChatStore = create<ChatState>((set, get) => ({
             streamingContent: state.streamingContent + delta,
           }));
         },
+        onCitation: (citation: SourceCitation) => {
+          // A resumed stream replays events the client may already have
+          set((state) =>
+            state.streamingSources.some(
+              (s) => s.title === citation.title && s.url === citation.url,
+            )
+              ? state
+              : { streamingSources: [...state.streamingSources, citation] },
+          );
+        },
         onDone: (messageId: string, citations: SourceCitation[]) => {
+          const sources =
+            citations.length > 0 ? citations : get().streamingSources;
           const assistantMessage: ChatMessage = {
             id: messageId,
             role: "assistant",
             content: get().streamingContent,
             createdAt: new Date().toISOString(),
-            sources: citations.length > 0 ? citations : undefined,
+            sources: sources.length > 0 ? sources : undefined,
           };
           set((state) => ({
             messages: [...state.messages, assistantMessage],
             isStreaming: false,
             streamingContent: "",
+            streamingSources: [],
           }));
           abortController = null;
 
@@ -179,6 +283,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
             error: error.message || "Failed to get response",
             isStreaming: false,
             streamingContent: "",
+            streamingSources: [],
           });
           abortController = null;
         },
@@ -191,7 +296,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
       abortController.abort();
       abortController = null;
     }
-    set({ isStreaming: false, streamingContent: "" });
+    set({ isStreaming: false, streamingContent: "", streamingSources: [] });
   },
 
   clearError: () => {
@@ -1,5 +1,11 @@
 import { create } from "zustand";
-import type { Quiz, QuizFeedback, QuizHistoryItem, QuizStats } from "@/types";
+import type {
+  Quiz,
+  QuizFeedback,
+  QuizGenerationProgress,
+  QuizHistoryItem,
+  QuizStats,
+} from "@/types";
 import {
   createQuiz,
   fetchQuiz,
@@ -7,8 +13,33 @@ import {
   submitAnswer,
   completeQuiz,
   fetchQuizStats,
+  fetchQuizStatus,
 } from "@/services/quizApi";
 
+// Polling interval and limit while quiz questions are being generated
+const GENERATION_POLL_MS = 1000;
+const GENERATION_TIMEOUT_MS = 120_000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function checkGenerationFailed(progress: QuizGenerationProgress): void {
+  if (progress.status === "failed") {
+    throw new Error(progress.generationError || "Failed to generate quiz questions");
+  }
+}
+
+// Resolves once the first question can be shown (or the quiz is ready)
+async function waitForFirstQuestion(quizId: number): Promise<void> {
+  const deadline = Date.now() + GENERATION_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const progress = await fetchQuizStatus(quizId);
+    checkGenerationFailed(progress);
+    if (progress.status === "ready" || progress.questionsReady > 0) return;
+    await sleep(GENERATION_POLL_MS);
+  }
+  throw new Error("Quiz generation is taking too long. Please try again.");
+}
+
 type QuizState = {
   // Active quiz
   activeQuiz: Quiz | null;
@@ -27,6 +58,7 @@ type QuizState = {
 
   // Actions
   startQuiz: (eraId: number | null, difficulty: string, questionCount: number) => Promise<void>;
+  followGeneration: (quizId: number) => Promise<void>;
   submitQuizAnswer: (questionId: number, answer: string) => Promise<void>;
   nextQuestion: () => void;
   finishQuiz: () => Promise<void>;
@@ -51,13 +83,21 @@ export const useQuizStore = create<QuizState>((set, get) => ({
   startQuiz: async (eraId, difficulty, questionCount) => {
     try {
       set({ isCreatingQuiz: true, error: null });
-      const quiz = await createQuiz(eraId, difficulty, questionCount);
+      let quiz = await createQuiz(eraId, difficulty, questionCount);
+      if (quiz.status !== "ready") {
+        // Start as soon as question 1 exists; the rest load in the background
+        await waitForFirstQuestion(quiz.id);
+        quiz = await fetchQuiz(quiz.id);
+      }
       set({
         activeQuiz: quiz,
         currentQuestionIndex: 0,
         currentFeedback: null,
         isCreatingQuiz: false,
       });
+      if (quiz.status !== "ready") {
+        get().followGeneration(quiz.id);
+      }
     } catch (error) {
       set({
         error: error instanceof Error ? error.message : "Failed to create quiz",
@@ -66,6 +106,50 @@ export const useQuizStore = create<QuizState>((set, get) => ({
     }
   },
 
+  followGeneration: async (quizId) => {
+    const deadline = Date.now() + GENERATION_TIMEOUT_MS;
+    let questionsLoaded = get().activeQuiz?.questions.length ?? 0;
+    try {
+      while (Date.now() < deadline) {
+        await sleep(GENERATION_POLL_MS);
+        if (get().activeQuiz?.id !== quizId) return;
+
+        const progress = await fetchQuizStatus(quizId);
+        checkGenerationFailed(progress);
+        const ready = progress.status === "ready";
+        if (!ready && progress.questionsReady === questionsLoaded) continue;
+
+        const quiz = await fetchQuiz(quizId);
+        questionsLoaded = quiz.questions.length;
+        if (get().activeQuiz?.id !== quizId) return;
+        set((state) => ({
+          activeQuiz: state.activeQuiz
+            ? {
+                ...state.activeQuiz,
+                status: quiz.status,
+                totalQuestions: quiz.totalQuestions,
+                questions: quiz.questions,
+              }
+            : null,
+        }));
+        if (ready) {
+          // Fewer questions than requested may have been generated
+          const { currentQuestionIndex, currentFeedback } = get();
+          if (!currentFeedback && currentQuestionIndex >= quiz.questions.length) {
+            get().finishQuiz();
+          }
+          return;
+        }
+      }
+      throw new Error("Quiz generation is taking too long. Please try again.");
+    } catch (error) {
+      if (get().activeQuiz?.id !== quizId) return;
+      set({
+        error: error instanceof Error ? error.message : "Failed to generate quiz questions",
+      });
+    }
+  },
+
   submitQuizAnswer: async (questionId, answer) => {
     try {
       set({ isSubmittingAnswer: true, error: null });
@@ -90,7 +174,9 @@ export const useQuizStore = create<QuizState>((set, get) => ({
     const { activeQuiz, currentQuestionIndex } = get();
     if (!activeQuiz) return;
 
-    if (currentQuestionIndex < activeQuiz.questions.length - 1) {
+    // During generation the next question may not have arrived yet; the
+    // page shows a placeholder until followGeneration loads it
+    if (currentQuestionIndex < activeQuiz.totalQuestions - 1) {
       set({
         currentQuestionIndex: currentQuestionIndex + 1,
         currentFeedback: null,
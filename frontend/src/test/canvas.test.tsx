@@ -98,14 +98,18 @@ const defaultChatStore = {
   messages: [],
   isStreaming: false,
   streamingContent: "",
+  streamingSources: [],
   isLoadingSessions: false,
   isLoadingMessages: false,
+  hasOlderMessages: false,
+  isLoadingOlderMessages: false,
   error: null,
   loadSessions: vi.fn(),
   createSession: vi.fn(),
   deleteSession: vi.fn(),
   setActiveSession: vi.fn(),
   loadMessages: vi.fn(),
+  loadOlderMessages: vi.fn(),
   sendMessage: vi.fn(),
   cancelStream: vi.fn(),
   clearError: vi.fn(),
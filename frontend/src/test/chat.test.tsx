@@ -73,14 +73,18 @@ function createMockStoreState(overrides: Partial<ReturnType<typeof useChatStore>
     messages: [],
     isStreaming: false,
     streamingContent: "",
+    streamingSources: [],
     isLoadingSessions: false,
     isLoadingMessages: false,
+    hasOlderMessages: false,
+    isLoadingOlderMessages: false,
     error: null,
     loadSessions: vi.fn(),
     createSession: vi.fn().mockResolvedValue(mockSessions[0]),
     deleteSession: vi.fn().mockResolvedValue(undefined),
     setActiveSession: vi.fn(),
     loadMessages: vi.fn().mockResolvedValue(undefined),
+    loadOlderMessages: vi.fn(),
     sendMessage: vi.fn().mockResolvedValue(undefined),
     cancelStream: vi.fn(),
     clearError: vi.fn(),
@@ -129,6 +133,33 @@ describe("ChatPage", () => {
     expect(screen.getByLabelText("Chat message input")).toBeInTheDocument();
   });
 
+  it("shows citations of the streaming response before it is done", () => {
+    vi.mocked(useChatStore).mockReturnValue(
+      createMockStoreState({
+        activeSessionId: "session-1",
+        messages: mockMessages,
+        isStreaming: true,
+        streamingContent: "As the Confessions describe",
+        streamingSources: [
+          {
+            title: "Augustine's Confessions",
+            url: "https://example.com/confessions",
+            source: "CCEL",
+          },
+        ],
+      }),
+    );
+
+    render(
+      <BrowserRouter>
+        <ChatPage />
+      </BrowserRouter>,
+    );
+
+    const link = screen.getByText("Augustine's Confessions").closest("a");
+    expect(link).toHaveAttribute("href", "https://example.com/confessions");
+  });
+
   it("shows error banner when there is an error", () => {
     const mockClearError = vi.fn();
     vi.mocked(useChatStore).mockReturnValue(
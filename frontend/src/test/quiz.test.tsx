@@ -73,6 +73,8 @@ const mockQuiz: Quiz = {
   totalQuestions: 3,
   percentageScore: 0,
   passed: false,
+  status: "ready",
+  generationError: "",
   completedAt: null,
   createdAt: "2026-02-17T10:00:00Z",
   questions: [mockMCQuestion, mockTFQuestion, mockSAQuestion],
@@ -102,6 +104,7 @@ const defaultQuizStore = {
   isLoadingHistory: false,
   error: null,
   startQuiz: vi.fn(),
+  followGeneration: vi.fn(),
   submitQuizAnswer: vi.fn(),
   nextQuestion: vi.fn(),
   finishQuiz: vi.fn(),
@@ -42,6 +42,7 @@ export type ChatMessage = {
   content: string;
   createdAt: string;
   sources?: SourceCitation[];
+  isTruncated?: boolean;
 };
 
 export type ChatSession = {
@@ -67,11 +68,24 @@ export type Quiz = {
   totalQuestions: number;
   percentageScore: number;
   passed: boolean;
+  status: QuizStatus;
+  generationError: string;
   completedAt: string | null;
   createdAt: string;
   questions: QuizQuestionItem[];
 };
 
+export type QuizStatus = "pending" | "generating" | "ready" | "failed";
+
+// Questions are saved one by one while a quiz is generating, so the first
+// ones can be answered before the rest exist
+export type QuizGenerationProgress = {
+  status: QuizStatus;
+  generationError: string;
+  totalQuestions: number;
+  questionsReady: number;
+};
+
 export type QuizQuestionItem = {
   id: number;
   questionText: string;